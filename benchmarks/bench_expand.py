@@ -0,0 +1,57 @@
+"""Expansion engine microbenchmark on deeply nested lists
+
+The README document is scaled up: a company with departments holding
+10k employees each. No MongoDB is needed.
+
+    python benchmarks/bench_expand.py --employees 10000 --repeat 5
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from mongocsvexport import MongoExport
+
+
+FIELDS = ['company', 'departments.title', 'departments.employees.first_name',
+          'departments.employees.last_name', 'departments.employees.skills.name']
+
+
+def make_doc(departments, employees, skills):
+    return {
+        'company': u'Orange',
+        'departments': [
+            {'title': u'Department {}'.format(d),
+             'employees': [
+                 {'first_name': u'First {}'.format(e),
+                  'last_name': u'Last {}'.format(e),
+                  'skills': [{'name': u'skill {}'.format(s)} for s in range(skills)]}
+                 for e in range(employees)]}
+            for d in range(departments)]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--departments', type=int, default=3)
+    parser.add_argument('--employees', type=int, default=10000)
+    parser.add_argument('--skills', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    doc = make_doc(args.departments, args.employees, args.skills)
+    export = MongoExport(None, FIELDS, open(os.devnull, 'w'), {})
+    best = None
+    for _ in range(args.repeat):
+        start = time.time()
+        num_rows = 0
+        for _ in export._get_rows(doc):
+            num_rows += 1
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print '{} rows, best of {}: {:.3f}s, {:.0f} rows/s'.format(
+        num_rows, args.repeat, best, num_rows / best)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Compare export with and without server-side projection
+
+Requires a running mongod. The collection is filled with wide synthetic
+documents if it is empty. Bytes received are taken from the server
+``network.bytesOut`` counter, so run it against an otherwise idle server.
+
+    python benchmarks/bench_projection.py --host localhost:27017 -n 100000
+"""
+import os
+import sys
+import time
+import argparse
+import pymongo
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from mongocsvexport import MongoExport
+
+
+FIELDS = ['key_0', 'key_1', 'key_2', 'nested.items.name', 'nested.items.value']
+
+
+def make_doc(i, width):
+    doc = dict(('key_{}'.format(k), 'value {} {}'.format(i, k)) for k in range(width))
+    doc['nested'] = {'items': [{'name': 'item {}'.format(j), 'value': j,
+                                'blob': 'x' * 200}
+                               for j in range(3)]}
+    return doc
+
+
+def populate(collection, num_docs, width):
+    batch = []
+    for i in range(num_docs):
+        batch.append(make_doc(i, width))
+        if len(batch) == 1000:
+            collection.insert_many(batch)
+            batch = []
+    if batch:
+        collection.insert_many(batch)
+
+
+def bytes_out(db):
+    return db.command('serverStatus')['network']['bytesOut']
+
+
+def measure(collection, config):
+    db = collection.database
+    with open(os.devnull, 'w') as output:
+        export = MongoExport(collection, FIELDS, output, config)
+        start_bytes = bytes_out(db)
+        start = time.time()
+        export.run()
+        elapsed = time.time() - start
+        received = bytes_out(db) - start_bytes
+    return elapsed, received
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='localhost:27017')
+    parser.add_argument('-d', dest='db_name', default='mongocsvexport_bench')
+    parser.add_argument('-c', dest='coll_name', default='projection')
+    parser.add_argument('-n', dest='num_docs', type=int, default=100000)
+    parser.add_argument('--width', type=int, default=200,
+                        help='Number of top-level keys in generated documents')
+    args = parser.parse_args()
+    collection = pymongo.MongoClient(args.host)[args.db_name][args.coll_name]
+    if not collection.find_one():
+        populate(collection, args.num_docs, args.width)
+    for name, config in (('no projection', {'projection': False}),
+                         ('projection', {'projection': True}),
+                         ('projection depth 2', {'projection': True,
+                                                 'projection_depth': 2})):
+        elapsed, received = measure(collection, config)
+        print '{:<20} {:>8.2f}s {:>12.1f}MB'.format(name, elapsed,
+                                                    received / 1024.0 / 1024.0)
+
+
+if __name__ == '__main__':
+    main()
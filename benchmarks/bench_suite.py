@@ -0,0 +1,184 @@
+"""Throughput of the export hot path on synthetic documents
+
+Every shape of benchmarks/docgen.py is run through ``expand_dict``,
+``_get_rows`` (expansion with serialization), ``_serialize`` alone and a
+whole ``run`` writing CSV into a byte counting sink. No MongoDB is needed:
+documents are fed by a ``_doc_iter`` stand-in. Each case runs in a fresh
+process, so its peak RSS is its own.
+
+Results can be saved as a JSON baseline and later runs compared to it;
+the script exits with status 1 if any rate drops more than the tolerance
+below the baseline.
+
+    python benchmarks/bench_suite.py --save baseline.json
+    python benchmarks/bench_suite.py --compare baseline.json --tolerance 0.1
+"""
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+from mongocsvexport import MongoExport, expand_dict
+from docgen import SHAPES, generate
+
+
+# documents per shape for about a second per case
+NUM_DOCS = {
+    'flat': 20000,
+    'nested': 300,
+    'fanout': 30,
+    'mixed': 20000,
+}
+STAGES = ['expand', 'get_rows', 'serialize', 'run']
+RATES = ['docs_per_s', 'rows_per_s', 'mb_per_s']
+
+
+class CountingOutput(object):
+    """Output counting written bytes"""
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+
+    def flush(self):
+        pass
+
+
+class BenchExport(MongoExport):
+
+    docs = []
+
+    def _doc_iter(self):
+        return iter(self.docs)
+
+
+def _leaf_values(docs, export):
+    values = []
+    for doc in docs:
+        for row in expand_dict(doc, export._plan):
+            values.extend(row)
+    return values
+
+def bench_case(case):
+    """Run one stage on one shape (pool worker)"""
+    shape, stage, num_docs, seed = case
+    fields = SHAPES[shape][1]
+    docs = generate(shape, num_docs, seed)
+    output = CountingOutput()
+    export = BenchExport(None, fields, output, {})
+    export.docs = docs
+    num_rows = 0
+    if stage == 'serialize':
+        values = _leaf_values(docs, export)
+        serialize = export._serialize
+        start = time.time()
+        for val in values:
+            serialize(val)
+        elapsed = time.time() - start
+        num_rows = len(values) // len(fields)
+    elif stage == 'run':
+        start = time.time()
+        export.run()
+        elapsed = time.time() - start
+        num_rows = sum(1 for doc in docs for _ in expand_dict(doc, export._plan))
+    else:
+        if stage == 'expand':
+            plan = export._plan
+            get_rows = lambda doc: expand_dict(doc, plan)
+        else:
+            get_rows = export._get_rows
+        start = time.time()
+        for doc in docs:
+            for _ in get_rows(doc):
+                num_rows += 1
+        elapsed = time.time() - start
+    elapsed = max(elapsed, 1e-9)
+    return {
+        'shape': shape,
+        'stage': stage,
+        'docs': num_docs,
+        'rows': num_rows,
+        'seconds': round(elapsed, 4),
+        'docs_per_s': round(num_docs / elapsed, 1),
+        'rows_per_s': round(num_rows / elapsed, 1),
+        'mb_per_s': round(output.size / elapsed / 1e6, 3) if stage == 'run' else None,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Descriptions of rates which dropped below the baseline"""
+    base = dict(((r['shape'], r['stage']), r) for r in baseline['results'])
+    regressions = []
+    for result in results:
+        old = base.get((result['shape'], result['stage']))
+        if old is None:
+            continue
+        for rate in RATES:
+            if result[rate] is None or not old.get(rate):
+                continue
+            change = result[rate] / old[rate] - 1
+            if change < -tolerance:
+                regressions.append('{} {} {}: {:.1f} -> {:.1f} ({:+.1%})'.format(
+                    result['shape'], result['stage'], rate, old[rate], result[rate], change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--shape', action='append', choices=sorted(SHAPES),
+                        help='Shape to run, may be repeated (default is all)')
+    parser.add_argument('--stage', action='append', choices=STAGES,
+                        help='Stage to run, may be repeated (default is all)')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='Multiplier of the number of documents')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', help='Save results as JSON baseline')
+    parser.add_argument('--compare', help='Compare results with JSON baseline')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='Allowed rate drop against the baseline (default is 0.1)')
+    args = parser.parse_args()
+    cases = [(shape, stage, max(int(NUM_DOCS[shape] * args.scale), 1), args.seed)
+             for shape in args.shape or sorted(SHAPES)
+             for stage in args.stage or STAGES]
+    pool = multiprocessing.Pool(1, maxtasksperchild=1)
+    results = []
+    try:
+        print '{:8} {:10} {:>8} {:>9} {:>11} {:>12} {:>8} {:>10}'.format(
+            'shape', 'stage', 'docs', 'rows', 'docs/s', 'rows/s', 'MB/s', 'RSS MB')
+        for result in pool.imap(bench_case, cases):
+            results.append(result)
+            print '{shape:8} {stage:10} {docs:8} {rows:9} {docs_per_s:11.0f} ' \
+                  '{rows_per_s:12.0f} {mb:>8} {rss:10.1f}'.format(
+                      mb='{:.2f}'.format(result['mb_per_s']) if result['mb_per_s'] else '-',
+                      rss=result['peak_rss_kb'] / 1024.0, **result)
+    finally:
+        pool.close()
+        pool.join()
+    report = {
+        'python': sys.version.split()[0],
+        'seed': args.seed,
+        'scale': args.scale,
+        'results': results,
+    }
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print >>sys.stderr, 'REGRESSION', regression
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
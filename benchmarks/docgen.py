@@ -0,0 +1,132 @@
+"""Seeded generator of synthetic documents of typical shapes
+
+Every shape is a function ``(rng, i) -> document`` paired with the fields
+exported from it. The same seed always produces the same documents.
+
+    python benchmarks/docgen.py fanout -n 2
+"""
+import random
+import argparse
+from datetime import datetime, timedelta
+
+from bson.int64 import Int64
+from bson.objectid import ObjectId
+
+
+WORDS = [u'alpha', u'beta', u'gamma', u'delta', u'epsilon', u'zeta', u'eta',
+         u'theta', u'iota', u'kappa', u'lambda', u'\u043c\u044e', u'\u043d\u044e']
+EPOCH = datetime(2015, 1, 1)
+
+
+def _text(rng, words=3):
+    return u' '.join(rng.choice(WORDS) for _ in range(words))
+
+def _oid(rng):
+    return ObjectId(''.join(rng.choice('0123456789abcdef') for _ in range(24)))
+
+def _date(rng):
+    return EPOCH + timedelta(seconds=rng.randint(0, 10 ** 8))
+
+
+def flat(rng, i, width=50):
+    """Wide flat document, one row each"""
+    doc = {'_id': i}
+    for k in range(width):
+        kind = k % 4
+        if kind == 0:
+            doc['key_{}'.format(k)] = _text(rng)
+        elif kind == 1:
+            doc['key_{}'.format(k)] = rng.randint(0, 10 ** 6)
+        elif kind == 2:
+            doc['key_{}'.format(k)] = rng.random() * 1000
+        else:
+            doc['key_{}'.format(k)] = _date(rng)
+    return doc
+
+FLAT_FIELDS = ['key_{}'.format(k) for k in range(0, 50, 2)]
+
+
+def nested(rng, i):
+    """Deep nested lists like the README company document"""
+    return {
+        '_id': i,
+        'company': _text(rng, 1),
+        'departments': [
+            {'title': _text(rng, 2),
+             'employees': [
+                 {'first_name': _text(rng, 1),
+                  'last_name': _text(rng, 1),
+                  'skills': [{'name': _text(rng, 1), 'level': rng.randint(1, 5)}
+                             for _ in range(rng.randint(1, 3))]}
+                 for _ in range(rng.randint(5, 20))]}
+            for _ in range(rng.randint(2, 4))]
+    }
+
+NESTED_FIELDS = ['company', 'departments.title', 'departments.employees.first_name',
+                 'departments.employees.last_name', 'departments.employees.skills.name',
+                 'departments.employees.skills.level']
+
+
+def fanout(rng, i):
+    """Sibling arrays multiplying into thousands of rows per document"""
+    return {
+        '_id': i,
+        'name': _text(rng),
+        'sizes': [{'size': rng.randint(30, 50), 'stock': rng.randint(0, 100)}
+                  for _ in range(rng.randint(30, 60))],
+        'colors': [_text(rng, 1) for _ in range(rng.randint(30, 60))],
+    }
+
+FANOUT_FIELDS = ['name', 'sizes.size', 'sizes.stock', 'colors']
+
+
+def mixed(rng, i):
+    """Values of all common BSON types, absent and null fields"""
+    doc = {'_id': _oid(rng)}
+    values = [
+        lambda: rng.randint(-10 ** 6, 10 ** 6),
+        lambda: Int64(rng.randint(0, 2 ** 62)),
+        lambda: rng.random(),
+        lambda: _text(rng),
+        lambda: _date(rng),
+        lambda: rng.random() < 0.5,
+        lambda: None,
+        lambda: {'x': rng.randint(0, 9)},
+    ]
+    for k in range(12):
+        if rng.random() < 0.9:
+            doc['v{}'.format(k)] = rng.choice(values)()
+    doc['ref'] = _oid(rng)
+    doc['tags'] = [_text(rng, 1) for _ in range(rng.randint(0, 3))]
+    return doc
+
+MIXED_FIELDS = ['_id', 'ref', 'tags'] + ['v{}'.format(k) for k in range(12)]
+
+
+SHAPES = {
+    'flat': (flat, FLAT_FIELDS),
+    'nested': (nested, NESTED_FIELDS),
+    'fanout': (fanout, FANOUT_FIELDS),
+    'mixed': (mixed, MIXED_FIELDS),
+}
+
+
+def generate(shape, num_docs, seed=0):
+    """List of ``num_docs`` documents of the shape"""
+    make_doc = SHAPES[shape][0]
+    rng = random.Random(seed)
+    return [make_doc(rng, i) for i in range(num_docs)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('shape', choices=sorted(SHAPES))
+    parser.add_argument('-n', dest='num_docs', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    for doc in generate(args.shape, args.num_docs, args.seed):
+        print doc
+
+
+if __name__ == '__main__':
+    main()
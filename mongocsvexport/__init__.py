@@ -1,16 +1,20 @@
-"""Export collection to csv file"""
-import json
+"""Export collection to csv file
+
+The package is imported by every run of the command, MongoDB driver,
+tqdm and the optional modes are imported when they are used.
+"""
+import os
 import sys
-import argparse
-import itertools
-import pymongo
+import time
 import csv
-import types
-import bson.json_util
+from datetime import datetime
+from itertools import islice
 from collections import OrderedDict
-import tqdm
-#from tqdm import tqdm
-
+from mongocsvexport.util import LRUCache
+from mongocsvexport.compress import CompressedOutput, compression_from_path
+from mongocsvexport.expand import (FieldNode, FieldsPlan, compile_fields, build_projection,
+                                   expand_list, expand_node, document_rows, expand_dict,
+                                   _identity)
 
 
 def get_params(prefix, args):
@@ -21,79 +25,20 @@ def get_params(prefix, args):
             params[k[len(prefix):]] = v
     return params
 
-def flatten_iters_tree(l):
-    for item in l:
-        if type(item) in (types.GeneratorType, list, tuple):
-            for subitem in flatten_iters_tree(item):
-                yield subitem
-        else:
-            yield item
-
-def tuple_startswith(t1, t2):
-    t1_len = len(t1)
-    for i, item in enumerate(t2):
-        if i >= t1_len:
-            return False
-        if item != t1[i]:
-            return False
-    return True
-
-class FieldValue(object):
-
-    __slots__ = ('path', 'value')
-
-    def __init__(self, path, value):
-        self.path = path
-        self.value = value
-
-    def __repr__(self):
-        return 'FieldValue({}, {})'.format(repr(self.path), repr(self.value))
-
-def expand_dict(doc, fields, path=()):
-
-    local_fields = [f[-1] for f in fields if tuple_startswith(f, path) and len(f) - len(path) == 1]
-    absent_fields = []
-    for local_field in local_fields:
-        if local_field not in doc:
-            absent_fields.append(local_field)
-
-    def check_field(path, exact=True):
-        compare = (lambda p1, p2: p1 == p2) if exact else (lambda p1, p2: tuple_startswith(p1, p2))
-        for field in fields:
-            if compare(field, path):
-                return True
-        return False
-
-    def expand_list(l, fields, path=()):
-        for item in l:
-            if isinstance(item, dict):
-                for subitem in expand_dict(item, fields, path):
-                    yield subitem
-            else:
-                yield FieldValue(path, item)
-
-    def tuple_iter():
-        for gr_key, group in itertools.groupby(
-                itertools.chain(doc.iteritems(), ((f, None) for f in absent_fields)),
-                lambda val: 2 if type(val[1]) in (types.GeneratorType, list) else 1 if isinstance(val[1], dict) else 0):
-            if gr_key == 0:
-                def field_filter():
-                    for k,v in group:
-                        fpath = path + (k,)
-                        if check_field(fpath, True):
-                            yield FieldValue(fpath, v)
-                yield [tuple(field_filter())]
-            else:
-                expand = expand_dict if gr_key == 1 else expand_list
-                for k,v in group:
-                    fpath = path + (k,)
-                    if check_field(fpath, False):
-                        yield expand(v, fields, fpath)
-
-    tuples = tuple_iter()
-    tuples = itertools.product(*tuples)
-    tuples = (tuple(flatten_iters_tree(t)) for t in tuples)
-    return tuples
+def merge_cond(cond, extra):
+    """Combine query condition with an extra condition"""
+    if not cond:
+        return extra
+    if not extra:
+        return cond
+    return {'$and': [cond, extra]}
+
+
+FANOUT_POLICIES = {
+    'truncate': 'truncated',
+    'skip': 'skipped',
+    'reject': 'rejected',
+}
 
 
 class MongoExport(object):
@@ -106,6 +51,25 @@ class MongoExport(object):
         'header': False,
         'psql_dump': None,
         'show_progress': False,
+        'projection': True, # Ask server to return requested fields only
+        'projection_depth': 1,
+        'sort': None, # List of (key, direction) pairs
+        'hint': None, # Index name or list of (key, direction) pairs
+        'estimated_count': False, # Use collection metadata for progress total
+        'batch_size': None,
+        'no_cursor_timeout': False,
+        'serialize_cache': 0, # Size of LRU cache of serialized strings and dates
+        'buffer_size': 1024 * 1024, # Write buffer of output files opened by name
+        'chunk_rows': 1000, # Number of rows passed to csv writer at once
+        'flush_interval': 1.0, # Seconds between output flushes with progress meter
+        'lazy_decode': False, # Decode requested paths of raw BSON documents only
+        'max_fanout': None, # Max number of rows of a document
+        'fanout_policy': 'truncate', # truncate, skip or reject documents over max_fanout
+        'reject_file': None, # Documents rejected by the fan-out policy, JSON lines
+        'stats': False, # Time export stages and count documents, rows and bytes
+        'stats_file': None, # Periodic stats snapshots
+        'stats_format': 'jsonl', # jsonl or prometheus
+        'stats_interval': 10.0, # Seconds between stats snapshots
     }
 
     def __init__(self, collection, fields, output, config):
@@ -113,31 +77,92 @@ class MongoExport(object):
         self.config.update(config)
         self.collection = collection
         self.fields = fields
+        self._stats = None
+        if self.config['stats']:
+            self._init_stats()
         self._output = self._init_output(output)
-        self._writer = csv.writer(self._output, delimiter=self.config['delimiter'])
+        self._last_flush = time.time()
+        self._writer = self._new_writer(self._output)
         self._init_fields(fields)
         if self.config['psql_dump']:
             self.config['delimiter'] = ','
             self.config['header'] = False
             self.config['null_value'] = ''
+        self._init_serializer()
+        if self.config['fanout_policy'] not in FANOUT_POLICIES:
+            raise ValueError('Unknown fan-out policy: {}'.format(self.config['fanout_policy']))
+        if self.config['fanout_policy'] == 'reject' and not self.config['reject_file']:
+            raise ValueError('Reject file is required by reject fan-out policy')
+        self._overflows = 0
+        self._reject_output = None
 
     @classmethod
     def create(cls, db_name, coll_name, fields, output, config):
         """Constructor which initialize new mongo connection from config"""
+        import pymongo
         mongo_params = get_params('mongo_', config)
         conn = pymongo.MongoClient(**mongo_params)
         collection = conn[db_name][coll_name]
         return cls(collection, fields, output, config)
 
     def run(self):
+        self._write_prologue()
+        self._write_rows(self._doc_iter())
+        self._write_epilogue()
+        self._output.flush()
+        self._report()
+
+    def _write_rows(self, docs):
+        self._write_chunks(docs, self._write_chunk)
+
+    def _write_chunks(self, docs, write, chunk_rows=None, doc_done=None):
+        """Pass rows of the documents to ``write`` in lists of ``chunk_rows``
+        rows, return the number of rows
+
+        Rows of a document with a large fan-out are split between chunks
+        instead of being held in memory. ``doc_done(doc, num_rows, flush)``
+        is called after the rows of each document are collected, with the
+        number of rows so far and a function writing the collected rows.
+        """
+        chunk_rows = chunk_rows or self.config['chunk_rows']
+        get_rows = self._get_rows
+        chunk = []
+        num_rows = 0
+        def flush():
+            if chunk:
+                write(chunk[:])
+                del chunk[:]
+        for doc in docs:
+            rows = iter(get_rows(doc))
+            while True:
+                size = len(chunk)
+                chunk.extend(islice(rows, chunk_rows - size))
+                num_rows += len(chunk) - size
+                if len(chunk) < chunk_rows:
+                    break
+                flush()
+            if doc_done is not None:
+                doc_done(doc, num_rows, flush)
+        flush()
+        return num_rows
+
+    def _write_chunk(self, rows):
+        self._writer.writerows(rows)
+        # keep output size in line with the progress meter
+        if self.config['show_progress']:
+            now = time.time()
+            if now - self._last_flush >= self.config['flush_interval']:
+                self._output.flush()
+                self._last_flush = now
+
+    def _write_prologue(self):
         if self.config['header']:
             self._writer.writerow(self.fields)
         if self.config['psql_dump']:
             self._output.write('COPY {} FROM stdin WITH (FORMAT csv);\n'.format(
                 self.config['psql_dump']))
-        for doc in self._doc_iter():
-            for row in self._get_rows(doc):
-                self._writer.writerow(row)
+
+    def _write_epilogue(self):
         if self.config['psql_dump']:
             self._output.write('\\.\n')
 
@@ -146,98 +171,364 @@ class MongoExport(object):
         for i, field in enumerate(fields):
             path = tuple(field.split('.'))
             self._fields_order_map[path] = i
+        self._plan = compile_fields(tuple(f.split('.')) for f in fields)
+
+    def _init_serializer(self):
+        from bson.objectid import ObjectId
+        null_value = self.config['null_value']
+        encode = lambda val: val.encode('utf-8')
+        # serializers keyed by exact value type, subclasses are resolved
+        # by _serialize_other and added on the first occurrence
+        self._serializers = {
+            type(None): lambda val: null_value,
+            str: _identity,
+            unicode: encode,
+            int: str,
+            long: str,
+            float: str,
+            bool: str,
+            datetime: str,
+            ObjectId: str,
+        }
+        self._cache = None
+        if self.config['serialize_cache']:
+            self._cache = LRUCache(self.config['serialize_cache'])
+            self._serializers[unicode] = self._cached(self._serializers[unicode])
+            self._serializers[datetime] = self._cached_naive(self._serializers[datetime])
+
+    def _init_stats(self):
+        from mongocsvexport.stats import ExportStats
+        stats = self._stats = ExportStats(self.config['stats_file'],
+                                          self.config['stats_format'],
+                                          self.config['stats_interval'])
+        # instance attributes shadow the methods, the hot path is not
+        # instrumented unless stats are requested
+        self._get_rows = stats.timed_rows(self._get_rows)
+        self._serialize = stats.timed(self._serialize, 'serialize')
+
+    def _new_writer(self, output):
+        if self._stats is not None:
+            writer = csv.writer(self._stats.counting_output(output),
+                                delimiter=self.config['delimiter'])
+            return self._stats.timed_writer(writer)
+        return csv.writer(output, delimiter=self.config['delimiter'])
+
+    def _cached(self, serializer):
+        cache_get = self._cache.get
+        return lambda val: cache_get(val, serializer)
+
+    def _cached_naive(self, serializer):
+        # aware datetimes of one instant are equal in any timezone but are
+        # serialized with the offset, only naive ones are cached
+        cached = self._cached(serializer)
+        return lambda val: cached(val) if val.tzinfo is None else serializer(val)
+
+    def _report(self):
+        if self._cache is not None:
+            hits, misses = self._cache.hits, self._cache.misses
+            rate = 100.0 * hits / (hits + misses) if hits + misses else 0.0
+            print >>sys.stderr, ('Serialization cache: {} hits, {} misses '
+                                 '({:.1f}% hit rate)'.format(hits, misses, rate))
+        if self._overflows:
+            print >>sys.stderr, 'Fan-out cap: {} documents with more than {} rows {}'.format(
+                self._overflows, self.config['max_fanout'],
+                FANOUT_POLICIES[self.config['fanout_policy']])
+        if self._reject_output is not None:
+            self._reject_output.close()
+        if self._stats is not None:
+            self._stats.close()
+            for line in self._stats.summary():
+                print >>sys.stderr, line
 
     def _init_output(self, output):
         if isinstance(output, basestring):
-            output = open(output, 'w')
+            output = open_output(output, self.config)
         return output
 
     def _doc_iter(self):
+        lazy_decode = self.config['lazy_decode']
+        cursor = self._cursor(self._raw_find() if lazy_decode else None)
+        docs = cursor
+        if self._stats is not None:
+            docs = self._stats.timed_iter(docs, 'cursor')
+        if self.config['show_progress']:
+            import tqdm
+            docs = tqdm.tqdm(docs, total=self._count_docs())
+        if lazy_decode:
+            return self._decode_raw(docs)
+        return iter(docs)
+
+    def _raw_find(self):
+        # find method returning undecoded documents
+        from bson.codec_options import CodecOptions
+        from bson.raw_bson import RawBSONDocument
+        codec_options = CodecOptions(document_class=RawBSONDocument)
+        return self.collection.with_options(codec_options=codec_options).find
+
+    def _decode_raw(self, docs):
+        from mongocsvexport.rawbson import decode_document
+        plan = self._plan
+        decode = decode_document
+        if self._stats is not None:
+            decode = self._stats.timed(decode, 'decode')
+        for doc in docs:
+            yield decode(doc.raw, plan)
+
+    def _cursor(self, find=None):
+        """Build cursor for the configured query
+
+        ``find`` is a collection find-like method, collection.find by default.
+        """
+        if find is None:
+            find = self.collection.find
         limit = self.config['limit']
         query_cond = self.config['query_cond']
         args = (query_cond,) if query_cond else ()
-        cursor = self.collection.find(*args)
-        num_docs = cursor.count()
-        if self.config['show_progress']:
-            if limit:
-                num_docs = limit
-            cursor = tqdm.tqdm(cursor, total=num_docs)
-        for i, doc in enumerate(cursor):
-            if limit and i >= limit:
-                break
-            yield doc
+        kwargs = {}
+        if self.config['projection']:
+            kwargs['projection'] = self._projection()
+        if self.config['no_cursor_timeout']:
+            kwargs['no_cursor_timeout'] = True
+        cursor = find(*args, **kwargs)
+        if self.config['sort']:
+            cursor = cursor.sort(self.config['sort'])
+        if self.config['hint']:
+            cursor = cursor.hint(self.config['hint'])
+        if limit:
+            cursor = cursor.limit(limit)
+        if self.config['batch_size']:
+            cursor = cursor.batch_size(self.config['batch_size'])
+        return cursor
+
+    def _projection(self):
+        return build_projection(self._fields_order_map.keys(),
+                                self.config['projection_depth'])
+
+    def _count_docs(self):
+        # number of documents for progress meter, only queried when needed
+        if self.config['estimated_count']:
+            total = self.collection.estimated_document_count()
+            return min(total, self.config['limit'] or total)
+        kwargs = {}
+        if self.config['limit']:
+            kwargs['limit'] = self.config['limit']
+        return self.collection.count_documents(self.config['query_cond'] or {}, **kwargs)
 
     def _get_rows(self, doc):
         # generate output rows for given document
-        for row in expand_dict(doc, self._fields_order_map.keys()):
-            row = sorted(row, key=lambda fv: self._fields_order_map[fv.path])
-            row = tuple(self._serialize(f.value) for f in row)
-            yield row
+        return self._fanout_rows(doc, self._document_rows(doc))
+
+    def _fanout_rows(self, doc, rows):
+        # rows of the document rows with the fan-out policy applied
+        max_fanout = self.config['max_fanout']
+        if max_fanout is not None and rows.count > max_fanout:
+            return self._overflow(doc, rows)
+        return rows.rows()
+
+    def _document_rows(self, doc):
+        return document_rows(doc, self._plan, self._serialize)
+
+    def _overflow(self, doc, rows):
+        # apply fan-out policy to the document with too many rows
+        self._overflows += 1
+        policy = self.config['fanout_policy']
+        if policy == 'truncate':
+            return rows.rows(self.config['max_fanout'])
+        if policy == 'reject':
+            if self._reject_output is None:
+                self._reject_output = open(self.config['reject_file'], 'w')
+            import bson.json_util
+            self._reject_output.write(bson.json_util.dumps(doc) + '\n')
+        return ()
 
     def _serialize(self, val):
-        if val is None:
-            val = self.config['null_value']
-        elif isinstance(val, unicode):
-            val = val.encode('utf-8')
+        serializer = self._serializers.get(type(val))
+        if serializer is None:
+            return self._serialize_other(val)
+        return serializer(val)
+
+    def _serialize_other(self, val):
+        val_type = type(val)
+        if isinstance(val, unicode):
+            serializer = self._serializers[unicode]
         else:
-            val = str(val)
-        return val
-
-def bson_object(val):
-    """Create BSON-compatible dict from JSON-string"""
-    return bson.json_util.loads(val)
-
-def main():
-    parser = argparse.ArgumentParser(argument_default=argparse.SUPPRESS)
-    parser.add_argument('-d', dest='db_name', required=True,
-                        help='Database name')
-    parser.add_argument('-c', dest='coll_name', required=True,
-                        help='Collection name')
-    parser.add_argument('-f', dest='fields', required=True,
-                        help='Comma separated list of fields')
-    parser.add_argument('--host', dest='mongo_host',
-                        help='Mongo connection')
-    parser.add_argument('-o', dest='output_file', default=None,
-                        help='Output file name. If not specified print to STDOUT')
-    parser.add_argument('--limit', dest='limit', type=int,
-                        help='Max number of documents')
-    parser.add_argument('--null', dest='null_value',
-                        help='NULL value replacement (default is empty string)')
-    parser.add_argument('--cond', dest='query_cond', type=bson_object,
-                        help='Mongo query condition in form of JSON-object')
-    parser.add_argument('--delimiter', dest='delimiter',
-                        help='Fields delimiter (default is comma)')
-    parser.add_argument('--header', dest='header', action='store_true',
-                        help='Output a header line with the name of each column')
-    parser.add_argument('--psql-dump', dest='psql_dump',
-                        help='Output data as psql dump file')
-    parser.add_argument('-p', dest='show_progress', action='store_true',
-                        help='Show progress meter')
-    args = parser.parse_args()
-    args = vars(args)
-    if args.get('show_progress') and not args.get('output_file'):
-        parser.error('You must use the -o option with -p')
-    fields = args.pop('fields')
-    fields = [f.strip() for f in fields.split(',')]
-    coll_name = args.pop('coll_name')
-    db_name = args.pop('db_name')
-    output = args.pop('output_file')
-    if output:
-        output = open(output, 'w')
+            serializer = str
+        self._serializers[val_type] = serializer
+        return serializer(val)
+
+def open_output(path, config):
+    """Open output file by name or stdout if the name is empty
+
+    Output is compressed if it is requested by config or by the file name
+    suffix (.gz, .zst, .lz4).
+    """
+    buffer_size = config.get('buffer_size', MongoExport.defaults['buffer_size'])
+    compression = config.get('compression') or (path and compression_from_path(path))
+    if path:
+        output = open(path, 'a' if config.get('append') else 'w', buffer_size)
+    elif 'buffer_size' in config or compression:
+        output = os.fdopen(os.dup(sys.stdout.fileno()), 'w', buffer_size)
     else:
         output = sys.stdout
-    export = MongoExport.create(db_name, coll_name, fields, output, args)
-    try:
-        export.run()
-    except KeyboardInterrupt:
-        print >>sys.stderr, "Keyboard interrupt. Exiting..."
-        sys.exit(1)
-
-if __name__ == '__main__':
-    main()
-
-
-
-
-
+    if compression:
+        output = CompressedOutput(output, compression, config.get('compression_level'))
+    return output
+
+def export_class(config):
+    """Export class implementing the options of config"""
+    if config.get('input_path'):
+        if config.get('parallel', 1) > 1:
+            from mongocsvexport.sources import ParallelFileExport
+            return ParallelFileExport
+        from mongocsvexport.sources import FileExport
+        return FileExport
+    if config.get('psql_dsn'):
+        if config.get('parallel', 1) > 1:
+            from mongocsvexport.postgres import ParallelPostgresExport
+            return ParallelPostgresExport
+        from mongocsvexport.postgres import PostgresExport
+        return PostgresExport
+    if config.get('pushdown'):
+        from mongocsvexport.pushdown import PushdownExport
+        return PushdownExport
+    if config.get('output_format', 'csv') != 'csv':
+        from mongocsvexport.columnar import ColumnarExport
+        return ColumnarExport
+    if config.get('incremental'):
+        from mongocsvexport.incremental import IncrementalExport
+        return IncrementalExport
+    if config.get('checkpoint'):
+        from mongocsvexport.checkpoint import CheckpointExport
+        return CheckpointExport
+    if config.get('max_rows') or config.get('max_bytes'):
+        from mongocsvexport.sharded import ShardedExport
+        return ShardedExport
+    if config.get('parallel', 1) > 1:
+        from mongocsvexport.parallel import ParallelExport
+        return ParallelExport
+    if config.get('pipeline'):
+        from mongocsvexport.pipeline import PipelineExport
+        return PipelineExport
+    return MongoExport
+
+def opens_output(config):
+    """Whether the export opens the output file by itself
+
+    Checkpointed output is truncated to the checkpoint, sharded output is
+    split into parts, incremental output is named by the run number.
+    """
+    return bool(config.get('checkpoint') or config.get('max_rows') or config.get('max_bytes') or
+                config.get('incremental'))
+
+def check_config(config, output_path=None):
+    """Check that the options of config can be used together
+
+    Raises ValueError naming the conflicting command line options. Jobs
+    are checked by the same rules as the command line.
+    """
+    parallel = (config.get('parallel') or 1) > 1
+    def used(dest):
+        # parallel is the number of processes, one is the default
+        return parallel if dest == 'parallel' else config.get(dest)
+    if config.get('jobs'):
+        # options of the jobs are checked for each job, these ones can not
+        # be shared by the jobs
+        for option, dest in (('-d', 'db_name'), ('-c', 'coll_name'), ('-f', 'fields'),
+                             ('--input', 'input_path'), ('--stats-file', 'stats_file'),
+                             ('--profile', 'profile'), ('--explain', 'explain')):
+            if used(dest):
+                raise ValueError('{} can not be used with --jobs'.format(option))
+        return
+    if config.get('input_path'):
+        if config['input_path'] != '-' and not os.path.isfile(config['input_path']):
+            raise ValueError('Input file {} does not exist'.format(config['input_path']))
+        if config['input_path'] == '-' and parallel:
+            raise ValueError('Standard input can not be used with --parallel')
+        if config.get('output_format', 'csv') != 'csv':
+            raise ValueError('--format can not be used with --input')
+        for option, dest in (('-d', 'db_name'), ('-c', 'coll_name'), ('--cond', 'query_cond'),
+                             ('--sort', 'sort'), ('--hint', 'hint'), ('--explain', 'explain'),
+                             ('--pushdown', 'pushdown'), ('--checkpoint', 'checkpoint'),
+                             ('--incremental', 'incremental'), ('--pipeline', 'pipeline'),
+                             ('--lazy-decode', 'lazy_decode'), ('--psql-dsn', 'psql_dsn'),
+                             ('--max-rows', 'max_rows'), ('--max-bytes', 'max_bytes')):
+            if used(dest):
+                raise ValueError('{} can not be used with --input'.format(option))
+    if config.get('psql_dsn'):
+        if output_path:
+            raise ValueError('-o can not be used with --psql-dsn')
+        for option, dest in (('--psql-dump', 'psql_dump'), ('--checkpoint', 'checkpoint'),
+                             ('--incremental', 'incremental'), ('--pipeline', 'pipeline'),
+                             ('--max-rows', 'max_rows'), ('--max-bytes', 'max_bytes')):
+            if used(dest):
+                raise ValueError('{} can not be used with --psql-dsn'.format(option))
+        if parallel and config.get('limit'):
+            raise ValueError('--limit can not be used with --psql-dsn and --parallel')
+    elif config.get('show_progress') and not output_path:
+        raise ValueError('You must use the -o option with -p')
+    if config.get('pushdown'):
+        if parallel:
+            raise ValueError('--parallel can not be used with --pushdown')
+        if config.get('output_format', 'csv') != 'csv':
+            raise ValueError('--format can not be used with --pushdown')
+        for option, dest in (('--pipeline', 'pipeline'), ('--checkpoint', 'checkpoint'),
+                             ('--incremental', 'incremental'), ('--lazy-decode', 'lazy_decode'),
+                             ('--max-fanout', 'max_fanout'), ('--psql-dsn', 'psql_dsn'),
+                             ('--max-rows', 'max_rows'), ('--max-bytes', 'max_bytes')):
+            if used(dest):
+                raise ValueError('{} can not be used with --pushdown'.format(option))
+    if config.get('fanout_policy') == 'reject' and parallel:
+        raise ValueError('--fanout-policy reject can not be used with --parallel')
+    if config.get('stats') and parallel:
+        raise ValueError('--stats can not be used with --parallel')
+    if config.get('sort'):
+        # these modes order documents by their own keys
+        if parallel:
+            raise ValueError('--parallel can not be used with --sort')
+        for option, dest in (('--checkpoint', 'checkpoint'), ('--incremental', 'incremental')):
+            if used(dest):
+                raise ValueError('{} can not be used with --sort'.format(option))
+    if config.get('pipeline') and parallel:
+        raise ValueError('--pipeline can not be used with --parallel')
+    if config.get('checkpoint'):
+        if not output_path:
+            raise ValueError('You must use the -o option with --checkpoint')
+        for option, dest in (('--parallel', 'parallel'), ('--pipeline', 'pipeline'),
+                             ('--lazy-decode', 'lazy_decode'), ('--compress', 'compression')):
+            if used(dest):
+                raise ValueError('{} can not be used with --checkpoint'.format(option))
+        if compression_from_path(output_path):
+            raise ValueError('Compressed output can not be used with --checkpoint')
+    if config.get('incremental'):
+        if not config.get('state'):
+            raise ValueError('You must use the --state option with --incremental')
+        for option, dest in (('--checkpoint', 'checkpoint'), ('--parallel', 'parallel'),
+                             ('--pipeline', 'pipeline'), ('--lazy-decode', 'lazy_decode')):
+            if used(dest):
+                raise ValueError('{} can not be used with --incremental'.format(option))
+    if config.get('max_rows') or config.get('max_bytes'):
+        if not output_path:
+            raise ValueError('You must use the -o option with --max-rows or --max-bytes')
+        for option, dest in (('--checkpoint', 'checkpoint'), ('--incremental', 'incremental'),
+                             ('--parallel', 'parallel'), ('--pipeline', 'pipeline'),
+                             ('--lazy-decode', 'lazy_decode')):
+            if used(dest):
+                raise ValueError('{} can not be used with --max-rows or --max-bytes'.format(
+                    option))
+    if config.get('output_format', 'csv') != 'csv':
+        for option, dest in (('--psql-dump', 'psql_dump'), ('--psql-dsn', 'psql_dsn'),
+                             ('--checkpoint', 'checkpoint'), ('--incremental', 'incremental'),
+                             ('--parallel', 'parallel'), ('--pipeline', 'pipeline'),
+                             ('--max-rows', 'max_rows'), ('--max-bytes', 'max_bytes'),
+                             ('--compress', 'compression')):
+            if used(dest):
+                raise ValueError('{} can not be used with --format {}'.format(
+                    option, config['output_format']))
+        if output_path and compression_from_path(output_path):
+            raise ValueError('Compressed output can not be used with --format {}'.format(
+                config['output_format']))
 
+def main():
+    """Command line entry point, see mongocsvexport.cli"""
+    from mongocsvexport.cli import main
+    main()
@@ -0,0 +1,126 @@
+"""Resumable export with checkpoints on _id"""
+import os
+from mongocsvexport import MongoExport, merge_cond
+from mongocsvexport.statefile import read_state, write_state
+
+
+class Checkpoint(object):
+    """Export state: last fully written _id, output size and documents number"""
+
+    def __init__(self, path, fields):
+        self.path = path
+        self.fields = fields
+        self.last_id = None
+        self.offset = 0
+        self.num_docs = 0
+
+    @classmethod
+    def load(cls, path, fields):
+        """Load checkpoint from the file, new checkpoint if there is no file"""
+        checkpoint = cls(path, fields)
+        state = read_state(path)
+        if state is None:
+            return checkpoint
+        if state['fields'] != list(fields):
+            raise ValueError('Checkpoint {} was made for other fields: {}'.format(
+                path, ','.join(state['fields'])))
+        checkpoint.last_id = state['last_id']
+        checkpoint.offset = state['offset']
+        checkpoint.num_docs = state['num_docs']
+        return checkpoint
+
+    @property
+    def resumed(self):
+        return self.num_docs > 0
+
+    def save(self):
+        write_state(self.path, {
+            'fields': list(self.fields),
+            'last_id': self.last_id,
+            'offset': self.offset,
+            'num_docs': self.num_docs,
+        })
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class CheckpointExport(MongoExport):
+    """Export in _id order which can be resumed after a failure
+
+    Every ``checkpoint_every`` documents the output is flushed to disk and
+    the checkpoint records the last written _id and the output size. On
+    restart the output is truncated to that size and the export continues
+    with documents after the recorded _id. The rows of a document are
+    always written before its _id is recorded. The export opens the output
+    file itself and closes it and removes the checkpoint when finished.
+    """
+
+    defaults = dict(MongoExport.defaults,
+                    checkpoint=None, # Path of the checkpoint file
+                    checkpoint_every=10000) # Documents between checkpoints
+
+    def _init_output(self, output):
+        self._checkpoint = Checkpoint.load(self.config['checkpoint'], self.fields)
+        if not isinstance(output, basestring):
+            raise ValueError('Resumable export needs output file name')
+        if self._checkpoint.resumed:
+            output = open(output, 'r+b', self.config['buffer_size'])
+            output.seek(self._checkpoint.offset)
+            output.truncate()
+        else:
+            output = open(output, 'wb', self.config['buffer_size'])
+        return output
+
+    def run(self):
+        checkpoint = self._checkpoint
+        if checkpoint.resumed:
+            # _id values of the types sorting after last_id are beyond it too
+            from mongocsvexport.parallel import range_cond
+            resume_cond = merge_cond(range_cond(checkpoint.last_id, None),
+                                     {'_id': {'$ne': checkpoint.last_id}})
+            self.config['query_cond'] = merge_cond(self.config['query_cond'], resume_cond)
+            if self.config['limit']:
+                self.config['limit'] -= checkpoint.num_docs
+                if self.config['limit'] <= 0:
+                    self._finish()
+                    return
+        else:
+            self._write_prologue()
+        self._base_docs = checkpoint.num_docs
+        self.config['sort'] = [('_id', 1)]
+        self._write_rows(self._doc_iter())
+        self._finish()
+
+    def _finish(self):
+        self._write_epilogue()
+        self._output.flush()
+        os.fsync(self._output.fileno())
+        self._output.close()
+        self._checkpoint.remove()
+        self._report()
+
+    def _projection(self):
+        projection = super(CheckpointExport, self)._projection()
+        projection['_id'] = 1
+        return projection
+
+    def _write_rows(self, docs):
+        self._num_docs = 0
+        self._write_chunks(docs, self._write_chunk, doc_done=self._doc_done)
+
+    def _doc_done(self, doc, num_rows, flush):
+        self._num_docs += 1
+        if self._num_docs % self.config['checkpoint_every'] == 0:
+            flush()
+            self._save_checkpoint(doc['_id'], self._num_docs)
+
+    def _save_checkpoint(self, last_id, num_docs):
+        self._output.flush()
+        os.fsync(self._output.fileno())
+        checkpoint = self._checkpoint
+        checkpoint.offset = self._output.tell()
+        checkpoint.num_docs = self._base_docs + num_docs
+        checkpoint.last_id = last_id
+        checkpoint.save()
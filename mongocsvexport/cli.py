@@ -0,0 +1,279 @@
+"""Command line interface"""
+import sys
+import argparse
+from mongocsvexport import (MongoExport, export_class, open_output, opens_output,
+                            check_config)
+
+
+def bson_object(val):
+    """Create BSON-compatible dict from JSON-string"""
+    import bson.json_util
+    return bson.json_util.loads(val)
+
+def column_types(val):
+    """Parse ``field:kind,...`` into dict of declared column kinds"""
+    from mongocsvexport import columnar
+    return columnar.column_types(val)
+
+def key_spec(val):
+    """Parse ``field[:1|-1],...`` into list of (key, direction) pairs"""
+    spec = []
+    for item in val.split(','):
+        key, _, direction = item.strip().partition(':')
+        if not key:
+            raise ValueError('Empty key in {!r}'.format(val))
+        try:
+            direction = int(direction) if direction else 1
+        except ValueError:
+            raise ValueError('Bad direction of {} in {!r}'.format(key, val))
+        if direction not in (1, -1):
+            raise ValueError('Bad direction of {} in {!r}'.format(key, val))
+        spec.append((key, direction))
+    return spec
+
+def hint_spec(val):
+    """Key spec if there are several fields or directions, index name
+    otherwise"""
+    return key_spec(val) if ':' in val or ',' in val else val
+
+
+def main():
+    parser = argparse.ArgumentParser(argument_default=argparse.SUPPRESS)
+    # required unless --jobs is used
+    parser.add_argument('-d', dest='db_name',
+                        help='Database name')
+    parser.add_argument('-c', dest='coll_name',
+                        help='Collection name')
+    parser.add_argument('-f', dest='fields',
+                        help='Comma separated list of fields')
+    parser.add_argument('--input', dest='input_path',
+                        help=('Export documents of mongodump .bson or JSON lines file '
+                              'instead of collection, - reads stdin'))
+    parser.add_argument('--input-format', dest='input_format', choices=['bson', 'jsonl'],
+                        help=('Format of --input (default is bson for .bson suffix, '
+                              'jsonl otherwise)'))
+    parser.add_argument('--jobs', dest='jobs',
+                        help=('JSON file with a list of exports (db, collection, fields, '
+                              'output and config options) run with one connection; '
+                              'other options are defaults of all the jobs'))
+    parser.add_argument('--concurrency', dest='concurrency', type=int, default=4,
+                        help='Number of concurrently running --jobs (default is 4)')
+    parser.add_argument('--host', dest='mongo_host',
+                        help='Mongo connection')
+    parser.add_argument('--read-preference', dest='mongo_readPreference',
+                        choices=['primary', 'primaryPreferred', 'secondary',
+                                 'secondaryPreferred', 'nearest'],
+                        help='Read preference, secondary keeps exports off the primary')
+    parser.add_argument('-o', dest='output_file', default=None,
+                        help='Output file name. If not specified print to STDOUT')
+    parser.add_argument('--limit', dest='limit', type=int,
+                        help='Max number of documents')
+    parser.add_argument('--null', dest='null_value',
+                        help='NULL value replacement (default is empty string)')
+    parser.add_argument('--cond', dest='query_cond', type=bson_object,
+                        help='Mongo query condition in form of JSON-object')
+    parser.add_argument('--sort', dest='sort', type=key_spec,
+                        help=('Sort documents, comma separated fields with optional '
+                              'direction, e.g. ts:-1,_id. Use an indexed field'))
+    parser.add_argument('--hint', dest='hint', type=hint_spec,
+                        help=('Index to use, index name or fields like --sort. A single '
+                              'field needs a direction (ts:1), a bare word is an index name'))
+    parser.add_argument('--explain', dest='explain', action='store_true',
+                        help=('Report query plan, used indexes and scan size of the '
+                              'export without running it'))
+    parser.add_argument('--delimiter', dest='delimiter',
+                        help='Fields delimiter (default is comma)')
+    parser.add_argument('--header', dest='header', action='store_true',
+                        help='Output a header line with the name of each column')
+    parser.add_argument('--psql-dump', dest='psql_dump',
+                        help='Output data as psql dump file')
+    parser.add_argument('--format', dest='output_format', choices=['csv', 'parquet', 'arrow'],
+                        help=('Output format (default is csv). Parquet and Arrow IPC '
+                              'keep value types and require pyarrow'))
+    parser.add_argument('--batch-rows', dest='record_batch_rows', type=int,
+                        help='Rows per Parquet or Arrow record batch (default is 65536)')
+    parser.add_argument('--parquet-compression', dest='parquet_compression',
+                        help='Parquet compression codec (default is snappy)')
+    parser.add_argument('--column-types', dest='column_types', type=column_types,
+                        help=('Declared Parquet or Arrow column types as field:kind,... '
+                              'with kinds bool, int64, double, timestamp, string, binary. '
+                              'Without declared types of all columns the batches are '
+                              'spooled to a temporary file to infer the types'))
+    parser.add_argument('--objectid-binary', dest='objectid_binary', action='store_true',
+                        help='Write ObjectId as 12 bytes binary to Parquet or Arrow')
+    parser.add_argument('--psql-dsn', dest='psql_dsn',
+                        help=('Load rows straight into PostgreSQL with COPY over the '
+                              'connection (requires psycopg2)'))
+    parser.add_argument('--psql-table', dest='psql_table',
+                        help='Target table of --psql-dsn (default is collection name)')
+    parser.add_argument('--psql-commit-rows', dest='psql_commit_rows', type=int,
+                        help=('Commit --psql-dsn load every N rows instead of '
+                              'one transaction'))
+    parser.add_argument('-p', dest='show_progress', action='store_true',
+                        help='Show progress meter')
+    parser.add_argument('--estimated-count', dest='estimated_count', action='store_true',
+                        help=('Use fast collection count estimation for progress meter '
+                              '(ignores --cond)'))
+    parser.add_argument('--batch-size', dest='batch_size', type=int,
+                        help='Number of documents in cursor batches')
+    parser.add_argument('--no-cursor-timeout', dest='no_cursor_timeout',
+                        action='store_true',
+                        help='Prevent server from closing idle cursor of long exports')
+    parser.add_argument('--serialize-cache', dest='serialize_cache', type=int,
+                        help='Size of cache of serialized string and date values')
+    parser.add_argument('--pipeline', dest='pipeline', action='store_true',
+                        help='Fetch, expand and write documents in concurrent stages')
+    parser.add_argument('--fetch-queue', dest='fetch_queue', type=int,
+                        help='Max number of fetched batches waiting for expansion in pipeline')
+    parser.add_argument('--write-queue', dest='write_queue', type=int,
+                        help='Max number of row chunks waiting for writing in pipeline')
+    parser.add_argument('--raw-batches', dest='raw_batches', action='store_true',
+                        help='Fetch raw BSON batches and decode them in expand stage of pipeline')
+    parser.add_argument('--lazy-decode', dest='lazy_decode', action='store_true',
+                        help=('Decode only requested fields of fetched BSON documents. '
+                              'Pays off for documents with large unrequested '
+                              'sub-documents and arrays'))
+    parser.add_argument('--pushdown', dest='pushdown', action='store_true',
+                        help=('Unwind lists by the server with aggregation pipeline '
+                              '(requires MongoDB 3.6)'))
+    parser.add_argument('--checkpoint', dest='checkpoint',
+                        help=('Checkpoint file of resumable export. Export is resumed '
+                              'from the checkpoint if the file exists'))
+    parser.add_argument('--checkpoint-every', dest='checkpoint_every', type=int,
+                        help='Number of documents between checkpoints (default is 10000)')
+    parser.add_argument('--incremental', dest='incremental',
+                        help=('Export only documents with the field (e.g. _id or '
+                              'updated_at) greater than at the previous run'))
+    parser.add_argument('--state', dest='state',
+                        help='State file of incremental export')
+    parser.add_argument('--incremental-hint', dest='incremental_hint', action='store_true',
+                        help='Hint incremental export query to use the field index')
+    parser.add_argument('--append', dest='append', action='store_true',
+                        help=('Append to the output file. Otherwise incremental runs may '
+                              'write new part files with {run} in -o file name'))
+    parser.add_argument('--max-rows', dest='max_rows', type=int,
+                        help=('Start a new part file after N rows. -o file name must '
+                              'have part number placeholder like out-%%05d.csv'))
+    parser.add_argument('--max-bytes', dest='max_bytes', type=int,
+                        help='Start a new part file after N bytes (uncompressed)')
+    parser.add_argument('--split-docs', dest='split_docs', action='store_true',
+                        help='Allow rows of one document to be written to several parts')
+    parser.add_argument('--manifest', dest='manifest',
+                        help=('Manifest file listing parts with row counts and _id ranges '
+                              '(default is -o file name with "manifest" as part number '
+                              'and .json suffix)'))
+    parser.add_argument('--max-fanout', dest='max_fanout', type=int,
+                        help='Max number of rows of a document, see --fanout-policy')
+    parser.add_argument('--fanout-policy', dest='fanout_policy',
+                        choices=['truncate', 'skip', 'reject'],
+                        help=('What to do with documents over --max-fanout: write the '
+                              'first rows, skip them or write them to --reject-file '
+                              '(default is truncate)'))
+    parser.add_argument('--reject-file', dest='reject_file',
+                        help='File of documents rejected by --fanout-policy, JSON lines')
+    parser.add_argument('--stats', dest='stats', action='store_true',
+                        help=('Time export stages, count documents, rows and bytes and '
+                              'print the summary to STDERR'))
+    parser.add_argument('--stats-file', dest='stats_file',
+                        help='Write periodic --stats snapshots to the file')
+    parser.add_argument('--stats-format', dest='stats_format', choices=['jsonl', 'prometheus'],
+                        help=('Stats file format: JSON lines or Prometheus text file '
+                              '(default is jsonl)'))
+    parser.add_argument('--stats-interval', dest='stats_interval', type=float,
+                        help='Seconds between stats snapshots (default is 10)')
+    parser.add_argument('--profile', dest='profile',
+                        help='Profile the export with cProfile and dump stats to the file')
+    parser.add_argument('--buffer-size', dest='buffer_size', type=int,
+                        help='Output write buffer size in bytes (default is 1MB)')
+    parser.add_argument('--chunk-rows', dest='chunk_rows', type=int,
+                        help='Number of rows written at once (default is 1000)')
+    parser.add_argument('--compress', dest='compression', choices=['gzip', 'zstd', 'lz4'],
+                        help=('Compress output (by default chosen by -o suffix: '
+                              '.gz, .zst, .lz4)'))
+    parser.add_argument('--compress-level', dest='compression_level', type=int,
+                        help='Compression level')
+    parser.add_argument('--no-projection', dest='projection', action='store_false',
+                        help='Fetch whole documents instead of requested fields only')
+    parser.add_argument('--projection-depth', dest='projection_depth', type=int,
+                        help=('Number of leading keys of dotted field paths used in '
+                              'projection (default is 1). Deeper projection is only '
+                              'safe if arrays along the paths contain documents'))
+    parser.add_argument('--parallel', dest='parallel', type=int,
+                        help='Export _id ranges of collection by N processes')
+    parser.add_argument('--unordered', dest='ordered', action='store_false',
+                        help=('Write ranges exported with --parallel as soon as they '
+                              'are ready instead of _id order'))
+    args = parser.parse_args()
+    args = vars(args)
+    concurrency = args.pop('concurrency')
+    if args.get('jobs'):
+        try:
+            check_config(args)
+        except ValueError as e:
+            parser.error(str(e))
+        from mongocsvexport.jobs import run_jobs
+        try:
+            failed = run_jobs(args.pop('jobs'), args, concurrency)
+        except ValueError as e:
+            parser.error(str(e))
+        sys.exit(1 if failed else 0)
+    required = (('-f', 'fields'),)
+    if not args.get('input_path'):
+        required = (('-d', 'db_name'), ('-c', 'coll_name')) + required
+    for option, dest in required:
+        if dest not in args:
+            parser.error('argument {} is required'.format(option))
+    if args.get('stats_file'):
+        args['stats'] = True
+    try:
+        # the input is checked before -o truncates the output
+        check_config(args, args.get('output_file'))
+    except ValueError as e:
+        parser.error(str(e))
+    fields = args.pop('fields')
+    fields = [f.strip() for f in fields.split(',')]
+    coll_name = args.pop('coll_name', None)
+    db_name = args.pop('db_name', None)
+    if args.pop('explain', False):
+        # plan of the base query, conditions added by export modes are not included
+        from mongocsvexport.explain import explain, report_lines
+        # dry run, the output is not opened
+        args.pop('output_file')
+        try:
+            export = MongoExport.create(db_name, coll_name, fields, sys.stdout, args)
+        except ValueError as e:
+            parser.error(str(e))
+        for line in report_lines(explain(export)):
+            print line
+        return
+    if opens_output(args):
+        output = args.pop('output_file')
+    else:
+        try:
+            output = open_output(args.pop('output_file'), args)
+        except ValueError as e:
+            parser.error(str(e))
+    export_cls = export_class(args)
+    try:
+        export = export_cls.create(db_name, coll_name, fields, output, args)
+    except ValueError as e:
+        parser.error(str(e))
+    try:
+        if args.get('profile'):
+            import cProfile
+            profile = cProfile.Profile()
+            try:
+                profile.runcall(export.run)
+            finally:
+                profile.dump_stats(args['profile'])
+        else:
+            export.run()
+    except KeyboardInterrupt:
+        print >>sys.stderr, "Keyboard interrupt. Exiting..."
+        sys.exit(1)
+    if output is not sys.stdout and not isinstance(output, basestring):
+        output.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+"""Parquet and Arrow IPC output of typed columns"""
+import sys
+import tempfile
+import cPickle
+from datetime import datetime
+from bson.objectid import ObjectId
+from mongocsvexport import MongoExport, document_rows
+
+
+FORMATS = ('parquet', 'arrow')
+
+# column kinds by exact value type, other values are converted to strings
+VALUE_KINDS = {
+    bool: 'bool',
+    int: 'int64',
+    long: 'int64',
+    float: 'double',
+    datetime: 'timestamp',
+    unicode: 'string',
+    str: 'binary',
+}
+
+KINDS = frozenset(VALUE_KINDS.values())
+
+def widen_kind(kind, other):
+    """Kind of a column holding values of both kinds, None is all nulls
+
+    Integers widen to double, other mixes to string.
+    """
+    if kind is None or kind == other:
+        return other
+    if other is None:
+        return kind
+    if set([kind, other]) == set(['int64', 'double']):
+        return 'double'
+    return 'string'
+
+def infer_kind(values, kind=None):
+    """Column kind of the values widened from ``kind``, None if all of
+    them are null"""
+    for val_type in set(type(val) for val in values):
+        if val_type is not type(None):
+            kind = widen_kind(kind, VALUE_KINDS[val_type])
+    return kind
+
+def _convert_kind(val, kind):
+    # value converted to the column kind, None if it does not fit
+    val_type = type(val)
+    if kind == 'double' and val_type in (int, long, bool):
+        return float(val)
+    if kind == 'int64':
+        if val_type is bool:
+            return long(val)
+        if val_type is float and val.is_integer():
+            return long(val)
+    return None
+
+def coerce_values(values, kind, stringify):
+    """Make the values fit the column kind
+
+    Any value fits a string column after stringify, numbers are converted
+    to double and integral ones to int64. Values which do not fit (only
+    possible with declared column types) become null.
+    """
+    if kind == 'string':
+        return [val if val is None or type(val) is unicode else stringify(val)
+                for val in values]
+    result = []
+    for val in values:
+        if val is not None and VALUE_KINDS[type(val)] != kind:
+            val = _convert_kind(val, kind)
+        result.append(val)
+    return result
+
+def column_types(val):
+    """Parse ``field:kind,...`` into dict of declared column kinds"""
+    types = {}
+    for item in val.split(','):
+        field, _, kind = item.strip().rpartition(':')
+        if not field or kind not in KINDS:
+            raise ValueError('Bad column type {!r}, kinds are {}'.format(
+                item, ', '.join(sorted(KINDS))))
+        types[field] = kind
+    return types
+
+def import_pyarrow(output_format):
+    try:
+        import pyarrow
+        if output_format == 'parquet':
+            import pyarrow.parquet
+    except ImportError:
+        raise ValueError('{} output requires pyarrow package'.format(output_format))
+    return pyarrow
+
+def arrow_type(pa, kind):
+    # BSON datetimes have millisecond precision
+    return {
+        'bool': pa.bool_(),
+        'int64': pa.int64(),
+        'double': pa.float64(),
+        'timestamp': pa.timestamp('ms'),
+        'string': pa.string(),
+        'binary': pa.binary(),
+    }[kind]
+
+
+class ColumnarWriter(object):
+    """Writer of record batches into Parquet or Arrow IPC file"""
+
+    def __init__(self, output, output_format, names, kinds, compression=None):
+        pa = self._pa = import_pyarrow(output_format)
+        self._output = output
+        self._names = names
+        self._types = [arrow_type(pa, kind) for kind in kinds]
+        schema = pa.schema([pa.field(name, arrow_type)
+                            for name, arrow_type in zip(names, self._types)])
+        if output_format == 'parquet':
+            self._writer = pa.parquet.ParquetWriter(output, schema, compression=compression)
+            self._write = lambda batch: self._writer.write_table(pa.Table.from_batches([batch]))
+        else:
+            self._writer = pa.RecordBatchFileWriter(output, schema)
+            self._write = self._writer.write_batch
+
+    def write(self, columns):
+        pa = self._pa
+        arrays = [pa.array(values, type=arrow_type)
+                  for values, arrow_type in zip(columns, self._types)]
+        self._write(pa.RecordBatch.from_arrays(arrays, self._names))
+
+    def close(self):
+        self._writer.close()
+        # ParquetWriter may close the Python file it writes to
+        if not getattr(self._output, 'closed', False):
+            self._output.flush()
+
+
+class ColumnarExport(MongoExport):
+    """Export into Parquet or Arrow IPC file
+
+    Expanded rows are collected into record batches of ``record_batch_rows``
+    rows. Values keep their types instead of being serialized. The schema
+    is written before the first batch, so unless all the column types are
+    declared by ``column_types``, batches are spooled into a temporary file
+    while the column kinds are widened over all the values: integers mixed
+    with floats become double, other mixes and values without a matching
+    type become strings, all null columns are strings. ObjectIds are
+    written as strings or as 12 bytes binary.
+    """
+
+    defaults = dict(MongoExport.defaults,
+                    output_format='parquet', # parquet or arrow
+                    record_batch_rows=65536, # Rows per record batch
+                    parquet_compression='snappy',
+                    objectid_binary=False, # Write ObjectId as binary instead of string
+                    column_types=None, # Declared kinds of columns by field name
+                    tmp_dir=None) # Directory of the spool file
+
+    def run(self):
+        declared = self.config['column_types'] or {}
+        unknown = [field for field in declared if field not in self.fields]
+        if unknown:
+            raise ValueError('Column types of unknown fields: {}'.format(', '.join(unknown)))
+        self._declared = [field in declared for field in self.fields]
+        self._kinds = [declared.get(field) for field in self.fields]
+        self._unconverted = 0
+        if all(self._kinds):
+            self._open_writer()
+            self._write_batches(self._write_batch)
+        else:
+            spool = tempfile.TemporaryFile(prefix='mongocsvexport-',
+                                           dir=self.config['tmp_dir'])
+            try:
+                self._write_batches(lambda columns: self._spool_batch(spool, columns))
+                self._kinds = [kind or 'string' for kind in self._kinds]
+                self._open_writer()
+                spool.seek(0)
+                while True:
+                    try:
+                        columns = cPickle.load(spool)
+                    except EOFError:
+                        break
+                    self._write_batch(columns)
+            finally:
+                spool.close()
+        self._columnar.close()
+        self._report()
+
+    def _write_batches(self, write):
+        num_rows = self._write_chunks(self._doc_iter(), lambda batch: write(zip(*batch)),
+                                      self.config['record_batch_rows'])
+        if not num_rows:
+            write([()] * len(self.fields))
+
+    def _spool_batch(self, spool, columns):
+        self._kinds = [kind if declared else infer_kind(values, kind)
+                       for values, kind, declared
+                       in zip(columns, self._kinds, self._declared)]
+        cPickle.dump(columns, spool, cPickle.HIGHEST_PROTOCOL)
+
+    def _open_writer(self):
+        self._columnar = ColumnarWriter(self._output, self.config['output_format'],
+                                        self.fields, self._kinds,
+                                        self.config['parquet_compression'])
+        if self._stats is not None:
+            self._columnar.write = self._stats.timed(self._columnar.write, 'write')
+
+    def _document_rows(self, doc):
+        # values keep their types
+        return document_rows(doc, self._plan, self._convert)
+
+    def _write_batch(self, columns):
+        stringify = self._stringify
+        coerced = []
+        for values, kind in zip(columns, self._kinds):
+            column = coerce_values(values, kind, stringify)
+            self._unconverted += sum(1 for val, result in zip(values, column)
+                                     if result is None and val is not None)
+            coerced.append(column)
+        self._columnar.write(coerced)
+
+    def _report(self):
+        if self._unconverted:
+            print >>sys.stderr, ('Column types: {} values not fitting declared types '
+                                 'written as null'.format(self._unconverted))
+        MongoExport._report(self)
+
+    def _convert(self, val):
+        if val is None or type(val) in VALUE_KINDS:
+            return val
+        if isinstance(val, ObjectId):
+            return val.binary if self.config['objectid_binary'] else unicode(val)
+        # subclasses like bson Int64
+        if isinstance(val, (int, long)):
+            return long(val)
+        if isinstance(val, float):
+            return float(val)
+        if isinstance(val, unicode):
+            return unicode(val)
+        return self._stringify(val)
+
+    def _stringify(self, val):
+        return self._serialize(val).decode('utf-8', 'replace')
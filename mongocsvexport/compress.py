@@ -0,0 +1,156 @@
+"""Compressed output streams"""
+import sys
+import zlib
+import Queue
+import threading
+
+
+SUFFIXES = {
+    '.gz': 'gzip',
+    '.zst': 'zstd',
+    '.lz4': 'lz4',
+}
+
+def compression_from_path(path):
+    """Guess compression method by output file name suffix"""
+    for suffix, method in SUFFIXES.iteritems():
+        if path.endswith(suffix):
+            return method
+    return None
+
+
+class GzipCompressor(object):
+
+    def __init__(self, level=None):
+        self._compressor = zlib.compressobj(6 if level is None else level,
+                                            zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+
+class ZstdCompressor(object):
+
+    def __init__(self, level=None):
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError('zstd compression requires zstandard package')
+        compressor = zstandard.ZstdCompressor(level=3 if level is None else level)
+        self._compressor = compressor.compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+
+class Lz4Compressor(object):
+
+    def __init__(self, level=None):
+        try:
+            import lz4.frame
+        except ImportError:
+            raise ValueError('lz4 compression requires lz4 package')
+        self._compressor = lz4.frame.LZ4FrameCompressor(
+            compression_level=0 if level is None else level)
+        self._header = self._compressor.begin()
+
+    def compress(self, data):
+        header, self._header = self._header, ''
+        return header + self._compressor.compress(data)
+
+    def flush(self):
+        header, self._header = self._header, ''
+        return header + self._compressor.flush()
+
+
+COMPRESSORS = {
+    'gzip': GzipCompressor,
+    'zstd': ZstdCompressor,
+    'lz4': Lz4Compressor,
+}
+
+
+class CompressedOutput(object):
+    """Write-only file object compressing data in a background thread
+
+    Written data is collected into blocks of ``block_size`` bytes which are
+    passed to the compression thread through a queue of ``queue_size``
+    blocks, so compression overlaps with producing the data. ``close``
+    finishes the compressed stream and closes the underlying file.
+    """
+
+    def __init__(self, fileobj, method, level=None,
+                 block_size=1024 * 1024, queue_size=8):
+        if method not in COMPRESSORS:
+            raise ValueError('Unknown compression method: {}'.format(method))
+        self._fileobj = fileobj
+        self._compressor = COMPRESSORS[method](level)
+        self._block_size = block_size
+        self._blocks = []
+        self._buffered = 0
+        self._position = 0
+        self._queue = Queue.Queue(queue_size)
+        self._error = None
+        self.closed = False
+        self._thread = threading.Thread(target=self._compress_blocks,
+                                        name='mongocsvexport-compress')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def write(self, data):
+        self._blocks.append(data)
+        self._buffered += len(data)
+        self._position += len(data)
+        if self._buffered >= self._block_size:
+            self._put_block()
+
+    def tell(self):
+        """Number of uncompressed bytes written"""
+        return self._position
+
+    def flush(self):
+        # hand buffered data to the compression thread, the compressor
+        # itself is not flushed to keep the compression ratio
+        self._put_block()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._put_block()
+        self._queue.put(None)
+        self._thread.join()
+        self._check_error()
+        self._fileobj.write(self._compressor.flush())
+        self._fileobj.close()
+
+    def _put_block(self):
+        self._check_error()
+        if self._blocks:
+            self._queue.put(''.join(self._blocks))
+            self._blocks = []
+            self._buffered = 0
+
+    def _check_error(self):
+        if self._error is not None:
+            exc_type, exc_value, exc_tb = self._error
+            raise exc_type, exc_value, exc_tb
+
+    def _compress_blocks(self):
+        while True:
+            block = self._queue.get()
+            if block is None:
+                break
+            if self._error is not None:
+                # keep draining the queue so writers are never blocked
+                continue
+            try:
+                self._fileobj.write(self._compressor.compress(block))
+            except Exception:
+                self._error = sys.exc_info()
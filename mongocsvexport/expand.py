@@ -0,0 +1,331 @@
+"""Expansion of documents into CSV rows
+
+Requested fields are compiled into a plan (prefix trie of the field
+paths) which drives the expansion of lists into rows. The module does
+not depend on MongoDB driver.
+"""
+import types
+import itertools
+from collections import OrderedDict
+
+
+class FieldNode(object):
+    """Node of the compiled fields plan (prefix trie of field paths)
+
+    ``children`` maps a document key to the child node, ``index`` is the
+    output column index if the node is a requested field itself,
+    ``columns`` are indexes of all the columns in the subtree.
+    """
+
+    __slots__ = ('path', 'children', 'index', 'columns')
+
+    def __init__(self, path=()):
+        self.path = path
+        self.children = OrderedDict()
+        self.index = None
+        self.columns = ()
+
+    @property
+    def is_leaf(self):
+        return self.index is not None
+
+    def __repr__(self):
+        return 'FieldNode({}, {})'.format(repr(self.path), repr(self.index))
+
+class FieldsPlan(FieldNode):
+    """Root node of the compiled fields plan"""
+
+    __slots__ = ('width',)
+
+    def __init__(self, width):
+        super(FieldsPlan, self).__init__()
+        self.width = width # number of output columns
+
+def compile_fields(fields):
+    """Build expansion plan from the list of field paths (tuples of keys)"""
+    fields = list(fields)
+    root = FieldsPlan(len(fields))
+    for i, path in enumerate(fields):
+        node = root
+        for key in path:
+            child = node.children.get(key)
+            if child is None:
+                child = node.children[key] = FieldNode(node.path + (key,))
+            node = child
+        node.index = i
+    _init_columns(root)
+    return root
+
+def _init_columns(node):
+    columns = [] if node.index is None else [node.index]
+    for child in node.children.itervalues():
+        columns.extend(_init_columns(child))
+    node.columns = tuple(sorted(columns))
+    return node.columns
+
+def build_projection(fields, depth=1):
+    """Build find() projection for the list of field paths (tuples of keys)
+
+    Every path is cut to its first ``depth`` keys. Only top-level keys are
+    always safe: projecting a deeper path drops scalar items of the arrays
+    along the path, which changes the expansion result.
+    """
+    prefixes = sorted(set(path[:depth] for path in fields))
+    projection = OrderedDict()
+    last = None
+    for prefix in prefixes:
+        if last is not None and prefix[:len(last)] == last:
+            # parent path is already projected
+            continue
+        projection['.'.join(prefix)] = 1
+        last = prefix
+    if '_id' not in projection:
+        projection['_id'] = 0
+    return projection
+
+# sub-documents with more alternatives are enumerated lazily instead of
+# being materialized, so memory is proportional to the document size
+# rather than to the number of its rows
+MAX_MATERIALIZED = 256
+
+def _size(alternatives):
+    return len(alternatives) if type(alternatives) is list else alternatives.count
+
+def _product(branches):
+    """itertools.product which iterates its inputs again instead of keeping them"""
+    iterators = [iter(branch) for branch in branches]
+    current = [next(iterator) for iterator in iterators]
+    yield tuple(current)
+    while True:
+        i = len(branches) - 1
+        while i >= 0:
+            try:
+                current[i] = next(iterators[i])
+                break
+            except StopIteration:
+                iterators[i] = iter(branches[i])
+                current[i] = next(iterators[i])
+                i -= 1
+        if i < 0:
+            return
+        yield tuple(current)
+
+
+class LazyUnion(object):
+    """Alternatives of list items chained without materializing them"""
+
+    __slots__ = ('parts', 'count')
+
+    def __init__(self, parts):
+        self.parts = parts
+        self.count = sum(_size(part) for part in parts)
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self.parts)
+
+
+class LazyProduct(object):
+    """Alternatives of a sub-document with lists, enumerated on demand"""
+
+    __slots__ = ('cells', 'branches', 'count')
+
+    def __init__(self, cells, branches, count):
+        self.cells = cells
+        self.branches = branches
+        self.count = count
+
+    def __iter__(self):
+        cells = self.cells
+        chain = itertools.chain.from_iterable
+        for combination in _product(self.branches):
+            yield cells + tuple(chain(combination))
+
+
+class LazyCompleted(object):
+    """Lazy alternatives completed like by _complete"""
+
+    __slots__ = ('alternatives', 'columns', 'null', 'count')
+
+    def __init__(self, alternatives, columns, null):
+        self.alternatives = alternatives
+        self.columns = columns
+        self.null = null
+        self.count = alternatives.count
+
+    def __iter__(self):
+        size = len(self.columns)
+        for cells in self.alternatives:
+            if len(cells) != size:
+                cells = _complete([cells], self.columns, self.null)[0]
+            yield cells
+
+
+def expand_list(l, node, serialize):
+    """Alternatives (see expand_node) for the list items"""
+    alternatives = []
+    parts = None
+    for item in l:
+        if isinstance(item, dict):
+            item_alternatives = expand_node(item, node, serialize)
+            if type(item_alternatives) is list:
+                alternatives.extend(item_alternatives)
+                continue
+            if parts is None:
+                parts = []
+            if alternatives:
+                parts.append(alternatives)
+                alternatives = []
+            parts.append(item_alternatives)
+        elif node.index is not None:
+            alternatives.append(((node.index, serialize(item)),))
+        else:
+            alternatives.append(())
+    if parts is None:
+        return alternatives
+    if alternatives:
+        parts.append(alternatives)
+    return LazyUnion(parts)
+
+def expand_node(doc, node, serialize):
+    """Alternatives for the sub-document
+
+    Every alternative is a tuple of (column index, value) cells. Values of
+    the sub-document scalars are serialized once and shared by all the
+    alternatives produced by its lists. Alternatives are returned as a
+    list unless there are more than MAX_MATERIALIZED of them, then as a
+    lazy iterable with ``count`` attribute.
+    """
+    cells = []
+    branches = []
+    count = 1
+    for key, child in node.children.iteritems():
+        val = doc.get(key)
+        if type(val) in (types.GeneratorType, list):
+            branch = expand_list(val, child, serialize)
+        elif isinstance(val, dict):
+            branch = expand_node(val, child, serialize)
+        else:
+            if child.index is not None:
+                cells.append((child.index, serialize(val)))
+            continue
+        branches.append(branch)
+        count *= _size(branch)
+    cells = tuple(cells)
+    if not branches:
+        return [cells]
+    if not count:
+        return []
+    if count > MAX_MATERIALIZED:
+        return LazyProduct(cells, branches, count)
+    return [cells + tuple(itertools.chain.from_iterable(combination))
+            for combination in itertools.product(*branches)]
+
+def _complete(alternatives, columns, null):
+    # make every alternative of the branch overwrite all its columns
+    size = len(columns)
+    result = []
+    for cells in alternatives:
+        if len(cells) != size:
+            present = set(index for index, _ in cells)
+            cells += tuple((index, null) for index in columns if index not in present)
+        result.append(cells)
+    return result
+
+def _identity(val):
+    return val
+
+
+class DocumentRows(object):
+    """Output rows of the document, produced on iteration
+
+    ``count`` is the number of rows, known before any of them is built.
+    Rows are emitted from a single row buffer which keeps the shared
+    prefix: for every next row only the cells of the top-level branches
+    that changed are rewritten.
+    """
+
+    __slots__ = ('row', 'branches', 'count')
+
+    def __init__(self, row, branches, count):
+        self.row = row
+        self.branches = branches
+        self.count = count
+
+    def __iter__(self):
+        return self.rows()
+
+    def rows(self, limit=None):
+        """Generate the rows, at most ``limit`` of them"""
+        remaining = self.count if limit is None else min(self.count, limit)
+        if remaining <= 0:
+            return
+        branches = self.branches
+        if not branches:
+            yield self.row[:]
+            return
+        row = self.row[:]
+        iterators = [iter(branch) for branch in branches]
+        for iterator in iterators:
+            for index, val in next(iterator):
+                row[index] = val
+        yield row[:]
+        remaining -= 1
+        last = len(branches) - 1
+        while remaining:
+            # advance branches like an odometer, the last one changes fastest
+            i = last
+            while True:
+                cells = next(iterators[i], None)
+                if cells is not None:
+                    break
+                iterators[i] = iter(branches[i])
+                for index, val in next(iterators[i]):
+                    row[index] = val
+                i -= 1
+            for index, val in cells:
+                row[index] = val
+            yield row[:]
+            remaining -= 1
+
+
+def document_rows(doc, plan, serialize=_identity):
+    """Rows of the document (see expand_dict) with their count"""
+    null = serialize(None)
+    row = [null] * plan.width
+    branches = []
+    count = 1
+    for key, child in plan.children.iteritems():
+        val = doc.get(key)
+        if type(val) in (types.GeneratorType, list):
+            alternatives = expand_list(val, child, serialize)
+        elif isinstance(val, dict):
+            alternatives = expand_node(val, child, serialize)
+        else:
+            if child.index is not None:
+                row[child.index] = serialize(val)
+            continue
+        size = _size(alternatives)
+        if not size:
+            return DocumentRows(row, [], 0)
+        if type(alternatives) is list:
+            branches.append(_complete(alternatives, child.columns, null))
+        else:
+            branches.append(LazyCompleted(alternatives, child.columns, null))
+        count *= size
+    return DocumentRows(row, branches, count)
+
+def expand_dict(doc, plan, serialize=_identity):
+    """Iterator of output rows (lists of column values) of the document
+
+    ``plan`` is a root node built by compile_fields. A list of field paths
+    is accepted as well and compiled on the fly. ``serialize`` is applied
+    once to every value taken from the document; absent fields get
+    ``serialize(None)``.
+
+    Sub-documents and lists of the top level are expanded once into
+    alternatives, large products of nested lists are enumerated lazily,
+    so memory use does not grow with the number of rows.
+    """
+    if not isinstance(plan, FieldsPlan):
+        plan = compile_fields(plan)
+    return document_rows(doc, plan, serialize).rows()
@@ -0,0 +1,104 @@
+"""Query plan report of an export without running it
+
+The find command of the export is explained with ``queryPlanner``
+verbosity, which makes the server choose the plan without executing the
+query. Collection statistics give the upper bound of scanned documents
+and bytes.
+"""
+from bson.son import SON
+
+
+def find_command(export):
+    """find command of the export cursor"""
+    config = export.config
+    command = SON([('find', export.collection.name)])
+    if config['query_cond']:
+        command['filter'] = config['query_cond']
+    if config['projection']:
+        command['projection'] = export._projection()
+    if config['sort']:
+        command['sort'] = SON(config['sort'])
+    if config['hint']:
+        hint = config['hint']
+        command['hint'] = hint if isinstance(hint, basestring) else SON(hint)
+    if config['limit']:
+        command['limit'] = config['limit']
+    return command
+
+def plan_stages(plan):
+    """Stages of the plan from the root, list of (stage, index name) pairs
+
+    Plans of sharded collections are merged from the shard plans, plans of
+    the slot based execution engine are read from their ``queryPlan``.
+    """
+    stages = []
+    def visit(stage):
+        if 'queryPlan' in stage:
+            stage = stage['queryPlan']
+        if 'shards' in stage:
+            stages.append((stage['stage'], None))
+            for shard in stage['shards']:
+                visit(shard['winningPlan'])
+            return
+        stages.append((stage['stage'], stage.get('indexName')))
+        if 'inputStage' in stage:
+            visit(stage['inputStage'])
+        for input_stage in stage.get('inputStages', ()):
+            visit(input_stage)
+    visit(plan)
+    return stages
+
+def explain(export):
+    """Query plan report of the export, dict"""
+    collection = export.collection
+    db = collection.database
+    read_preference = collection.read_preference
+    result = db.command(SON([('explain', find_command(export)),
+                             ('verbosity', 'queryPlanner')]),
+                        read_preference=read_preference)
+    stats = db.command('collStats', collection.name, read_preference=read_preference)
+    planner = result['queryPlanner']
+    stages = plan_stages(planner['winningPlan'])
+    indexes = []
+    for stage, index in stages:
+        if index is not None and index not in indexes:
+            indexes.append(index)
+    docs = stats.get('count', 0)
+    avg_size = stats.get('avgObjSize', 0)
+    in_memory_sort = any(stage == 'SORT' for stage, index in stages)
+    scan_docs = docs
+    config = export.config
+    if config['limit'] and not config['query_cond'] and not in_memory_sort:
+        # the scan stops at the limit
+        scan_docs = min(docs, config['limit'])
+    return {
+        'namespace': planner.get('namespace', collection.full_name),
+        'stages': [stage for stage, index in stages],
+        'indexes': indexes,
+        'collection_scan': any(stage == 'COLLSCAN' for stage, index in stages),
+        'in_memory_sort': in_memory_sort,
+        'rejected_plans': len(planner.get('rejectedPlans', ())),
+        'docs': docs,
+        'avg_doc_size': avg_size,
+        'scan_docs': scan_docs,
+        'scan_bytes': int(scan_docs * avg_size),
+    }
+
+def report_lines(report):
+    """Lines of the human readable report"""
+    lines = [
+        'Namespace: {}'.format(report['namespace']),
+        'Winning plan: {}'.format(' <- '.join(report['stages'])),
+        'Indexes: {}'.format(', '.join(report['indexes']) or 'none'),
+        'Rejected plans: {}'.format(report['rejected_plans']),
+        'Collection: {} docs, {} bytes per doc on average'.format(
+            report['docs'], report['avg_doc_size']),
+    ]
+    scan = '{} docs, {:.1f} MB'.format(report['scan_docs'], report['scan_bytes'] / 1e6)
+    if report['collection_scan']:
+        lines.append('Full collection scan: {}'.format(scan))
+    else:
+        lines.append('Scanned by index: at most {}'.format(scan))
+    if report['in_memory_sort']:
+        lines.append('Warning: sort is not supported by an index and is done in memory')
+    return lines
@@ -0,0 +1,116 @@
+"""Incremental export of documents beyond the high-water mark of a field"""
+import os
+import sys
+from mongocsvexport import MongoExport, merge_cond, build_projection, open_output
+from mongocsvexport.statefile import read_state, write_state
+
+
+class IncrementalState(object):
+    """High-water mark of the field and number of finished runs"""
+
+    def __init__(self, path, field):
+        self.path = path
+        self.field = field
+        self.mark = None
+        self.run = 0
+
+    @classmethod
+    def load(cls, path, field):
+        """Load state from the file, initial state if there is no file"""
+        state = cls(path, field)
+        data = read_state(path)
+        if data is None:
+            return state
+        if data['field'] != field:
+            raise ValueError('State {} is kept for other field: {}'.format(path, data['field']))
+        state.mark = data['mark']
+        state.run = data['run']
+        return state
+
+    def save(self):
+        write_state(self.path, {
+            'field': self.field,
+            'mark': self.mark,
+            'run': self.run,
+        })
+
+    def output_path(self, pattern):
+        """Output file name of the next run, ``{run}`` is its number"""
+        return pattern.replace('{run}', str(self.run + 1))
+
+
+def get_path(doc, path):
+    """Value of the sub-document path (tuple of keys), None if absent"""
+    for key in path:
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(key)
+    return doc
+
+
+class IncrementalExport(MongoExport):
+    """Export documents with the field greater than the last run mark
+
+    The largest value of the field among exported documents becomes the
+    mark of the next run. The state is saved only when the run finishes,
+    so a failed run is simply repeated. Output given by file name is
+    opened by the export, ``{run}`` in the name is the run number.
+    """
+
+    defaults = dict(MongoExport.defaults,
+                    incremental=None, # Monotonic field, e.g. _id or updated_at
+                    state=None, # Path of the state file
+                    incremental_hint=False, # Force the query to use the field index
+                    append=False) # Output is appended to the file of previous runs
+
+    def __init__(self, collection, fields, output, config):
+        super(IncrementalExport, self).__init__(collection, fields, output, config)
+        field = self.config['incremental']
+        self._field_path = tuple(field.split('.'))
+        self._mark = self._state.mark
+        if self._state.mark is not None:
+            self.config['query_cond'] = merge_cond(self.config['query_cond'],
+                                                   {field: {'$gt': self._state.mark}})
+        if self.config['incremental_hint']:
+            self.config['hint'] = [(field, 1)]
+        if self.config['limit']:
+            # documents beyond the limit must have larger marks
+            self.config['sort'] = [(field, 1)]
+
+    def _init_output(self, output):
+        self._state = IncrementalState.load(self.config['state'], self.config['incremental'])
+        self._appending = False
+        self._owns_output = output is None or isinstance(output, basestring)
+        if not self._owns_output:
+            return output
+        if output:
+            output = self._state.output_path(output)
+            self._appending = (self.config['append'] and os.path.isfile(output) and
+                               os.path.getsize(output) > 0)
+        return open_output(output, self.config)
+
+    def run(self):
+        super(IncrementalExport, self).run()
+        if self._owns_output and self._output is not sys.stdout:
+            self._output.close()
+        self._state.mark = self._mark
+        self._state.run += 1
+        self._state.save()
+
+    def _write_prologue(self):
+        if self._appending:
+            # header is already written by a previous run
+            self.config['header'] = False
+        super(IncrementalExport, self)._write_prologue()
+
+    def _projection(self):
+        fields = self._fields_order_map.keys() + [self._field_path]
+        return build_projection(fields, self.config['projection_depth'])
+
+    def _doc_iter(self):
+        path = self._field_path
+        for doc in super(IncrementalExport, self)._doc_iter():
+            value = get_path(doc, path)
+            if value is not None and (self._mark is None or value > self._mark):
+                self._mark = value
+            yield doc
@@ -0,0 +1,108 @@
+"""Several exports in one process sharing a MongoDB client"""
+import sys
+import time
+import threading
+import bson.json_util
+import pymongo
+from multiprocessing.pool import ThreadPool
+from mongocsvexport import get_params, open_output, export_class, opens_output, check_config
+
+
+REQUIRED_KEYS = ('db', 'collection', 'fields')
+
+def load_jobs(path):
+    """Read list of jobs from JSON file
+
+    A job is an object with ``db``, ``collection``, ``fields`` (list or
+    comma separated string) and ``output`` keys, other keys are export
+    config options like ``query_cond``, ``header`` or ``limit``. MongoDB
+    extended JSON is accepted, e.g. ``{"$date": ...}`` in conditions.
+    """
+    with open(path) as f:
+        jobs = bson.json_util.loads(f.read())
+    if not isinstance(jobs, list):
+        raise ValueError('Job file {} must contain a list of jobs'.format(path))
+    for num, job in enumerate(jobs, 1):
+        missing = [key for key in REQUIRED_KEYS if key not in job]
+        if missing:
+            raise ValueError('Job {} has no {}'.format(num, ', '.join(missing)))
+        if not job.get('output') and not job.get('psql_dsn'):
+            raise ValueError('Job {} has no output'.format(num))
+        for key in ('input_path', 'profile', 'explain'):
+            if job.get(key):
+                raise ValueError('Job {} can not have {}'.format(num, key))
+        if isinstance(job['fields'], basestring):
+            job['fields'] = [field.strip() for field in job['fields'].split(',')]
+    return jobs
+
+
+class JobRunner(object):
+    """Run export jobs by ``concurrency`` threads with one client
+
+    All the exports share the client connection pool. Threads overlap
+    network and disk waits of the exports while the CPU bound expansion
+    shares the interpreter lock: jobs of large collections may set
+    ``parallel`` to expand in worker processes. A failed job is reported
+    and does not stop the others.
+    """
+
+    def __init__(self, client, jobs, config, concurrency=4):
+        self.client = client
+        self.jobs = jobs
+        self.config = config
+        self.concurrency = concurrency
+        self._lock = threading.Lock()
+
+    def run(self):
+        """Run the jobs, return names of the failed ones"""
+        pool = ThreadPool(self.concurrency)
+        try:
+            results = pool.map(self._run_job, self.jobs)
+        finally:
+            pool.close()
+            pool.join()
+        return [name for name, error in results if error is not None]
+
+    def _run_job(self, job):
+        name = '{}.{}'.format(job['db'], job['collection'])
+        config = dict(self.config, **dict((key, val) for key, val in job.iteritems()
+                                          if key not in REQUIRED_KEYS + ('output',)))
+        # progress meters of concurrent jobs would garble each other
+        config['show_progress'] = False
+        if config.get('stats_file'):
+            # own stats file of the job
+            config['stats'] = True
+        start = time.time()
+        output = None
+        try:
+            output = job.get('output')
+            check_config(config, output)
+            if not opens_output(config):
+                output = open_output(output, config)
+            collection = self.client[job['db']][job['collection']]
+            export = export_class(config)(collection, job['fields'], output, config)
+            export.run()
+        except Exception as e:
+            self._log('{}: failed: {}'.format(name, e))
+            return name, e
+        finally:
+            if output is not None and output is not sys.stdout and \
+                    not isinstance(output, basestring):
+                output.close()
+        self._log('{}: done in {:.1f}s'.format(name, time.time() - start))
+        return name, None
+
+    def _log(self, message):
+        with self._lock:
+            print >>sys.stderr, message
+
+
+def run_jobs(path, config, concurrency=4):
+    """Run jobs of the file with one client, return number of failed jobs"""
+    jobs = load_jobs(path)
+    client = pymongo.MongoClient(**get_params('mongo_', config))
+    try:
+        failed = JobRunner(client, jobs, config, concurrency).run()
+    finally:
+        client.close()
+    return len(failed)
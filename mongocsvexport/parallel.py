@@ -0,0 +1,259 @@
+"""Parallel export of _id ranges in a process pool"""
+import os
+import re
+import uuid
+import shutil
+import tempfile
+import multiprocessing
+from datetime import datetime
+import tqdm
+from bson.binary import Binary
+from bson.decimal128 import Decimal128
+from bson.max_key import MaxKey
+from bson.min_key import MinKey
+from bson.objectid import ObjectId
+from bson.regex import Regex
+from bson.timestamp import Timestamp
+from pymongo.errors import OperationFailure
+from mongocsvexport import MongoExport, merge_cond
+
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# $type aliases of the BSON comparison order brackets, _id values of
+# different brackets never match the same range query
+TYPE_BRACKETS = (
+    ('minKey',),
+    ('undefined', 'null'),
+    ('double', 'int', 'long', 'decimal'),
+    ('symbol', 'string'),
+    ('object',),
+    ('array',),
+    ('binData',),
+    ('objectId',),
+    ('bool',),
+    ('date',),
+    ('timestamp',),
+    ('regex',),
+    ('maxKey',),
+)
+
+# brackets of the types, subclasses before their base classes
+_TYPE_BRACKETS = (
+    (MinKey, 0),
+    (type(None), 1),
+    (bool, 8),
+    ((int, long, float, Decimal128), 2),
+    ((Binary, uuid.UUID), 6),
+    (basestring, 3),
+    (dict, 4),
+    ((list, tuple), 5),
+    (ObjectId, 7),
+    (datetime, 9),
+    (Timestamp, 10),
+    ((Regex, type(re.compile(''))), 11),
+    (MaxKey, 12),
+)
+
+# brackets of _id types which sort in Python like in MongoDB
+_SPLIT_BRACKETS = (2, 3, 7, 9, 10)
+
+def type_bracket(val):
+    """Index of the value type in TYPE_BRACKETS, None for unknown types"""
+    for types, bracket in _TYPE_BRACKETS:
+        if isinstance(val, types):
+            return bracket
+    return None
+
+def id_bracket(val):
+    """Index of the _id value type in TYPE_BRACKETS, None unless ranges
+    of such values can be split"""
+    bracket = type_bracket(val)
+    if bracket not in _SPLIT_BRACKETS or isinstance(val, Decimal128):
+        return None
+    return bracket
+
+def split_boundaries(collection, num_ranges, query_cond=None, sample_factor=10):
+    """Find sorted _id values which split collection into num_ranges ranges
+
+    splitVector is used when the server allows it, otherwise boundaries are
+    taken from a random sample of the documents matching the query. Keys
+    of different BSON type brackets or of types without matching Python
+    order leave the collection in one range.
+    """
+    if num_ranges < 2:
+        return []
+    try:
+        keys = _split_vector(collection, num_ranges)
+    except OperationFailure:
+        keys = _sample_ids(collection, num_ranges * sample_factor, query_cond)
+    brackets = set(id_bracket(key) for key in keys)
+    if len(brackets) > 1 or None in brackets:
+        return []
+    keys = sorted(set(keys))
+    if len(keys) < num_ranges:
+        return keys
+    step = float(len(keys)) / num_ranges
+    return [keys[int(step * i)] for i in range(1, num_ranges)]
+
+def _split_vector(collection, num_ranges):
+    db = collection.database
+    size = db.command('collstats', collection.name).get('size', 0)
+    result = db.command('splitVector', collection.full_name,
+                        keyPattern={'_id': 1},
+                        maxChunkSizeBytes=max(int(size // num_ranges), 1))
+    return [key['_id'] for key in result['splitKeys']]
+
+def _sample_ids(collection, size, query_cond=None):
+    pipeline = []
+    if query_cond:
+        pipeline.append({'$match': query_cond})
+    pipeline.append({'$sample': {'size': size}})
+    pipeline.append({'$project': {'_id': 1}})
+    return [doc['_id'] for doc in collection.aggregate(pipeline)]
+
+def id_ranges(boundaries):
+    """Convert sorted boundaries into list of (lower, upper) _id ranges
+
+    ``None`` stands for an open end of the range.
+    """
+    bounds = [None] + list(boundaries) + [None]
+    return zip(bounds[:-1], bounds[1:])
+
+def range_cond(lower, upper):
+    """Query condition selecting _id values in [lower, upper)
+
+    The open ends also select _id values of other types which sort before
+    or after the type of the boundary.
+    """
+    cond = {}
+    if lower is not None:
+        cond['$gte'] = lower
+    if upper is not None:
+        cond['$lt'] = upper
+    if not cond:
+        return {}
+    if lower is None:
+        other = _bracket_types(upper, 0)
+        if other:
+            return {'$or': [{'_id': cond}, {'_id': {'$type': other}}]}
+    elif upper is None:
+        other = _bracket_types(lower, 1)
+        if other:
+            return {'$or': [{'_id': cond}, {'_id': {'$not': {'$type': other}}}]}
+    return {'_id': cond}
+
+def _bracket_types(val, inclusive):
+    # $type aliases of the brackets before the bracket of val (inclusive)
+    bracket = type_bracket(val)
+    if bracket is None:
+        return []
+    return [alias for aliases in TYPE_BRACKETS[:bracket + inclusive] for alias in aliases]
+
+def export_range(task):
+    """Export one _id range into a temporary file (pool worker)
+
+    Returns path of the file, number of exported documents and, if the
+    documents number is limited, file offsets of the document ends.
+    """
+    db_name, coll_name, fields, config, bounds, path = task
+    config = dict(config,
+                  query_cond=merge_cond(config.get('query_cond'), range_cond(*bounds)),
+                  header=False,
+                  psql_dump=None,
+                  show_progress=False)
+    with open(path, 'wb', config['buffer_size']) as output:
+        export = MongoExport.create(db_name, coll_name, fields, output, config)
+        num_docs, offsets = write_part(export, output)
+    return path, num_docs, offsets
+
+def write_part(export, output):
+    """Write rows of the export documents without prologue and epilogue
+
+    Returns number of the documents and, if the documents number is
+    limited, output offsets of the document ends.
+    """
+    num_docs = 0
+    offsets = []
+    limit = export.config['limit']
+    for doc in export._doc_iter():
+        export._writer.writerows(export._get_rows(doc))
+        num_docs += 1
+        if limit:
+            offsets.append(output.tell())
+    return num_docs, offsets
+
+
+class ParallelExport(MongoExport):
+    """Export collection split into _id ranges by several processes
+
+    Ranges are exported into temporary files which are appended to the
+    output either in _id order or in order of completion.
+    """
+
+    defaults = dict(MongoExport.defaults,
+                    parallel=2, # Number of worker processes
+                    ordered=True, # Merge ranges in _id order
+                    tmp_dir=None)
+
+    def run(self):
+        self._write_prologue()
+        tmp_dir = tempfile.mkdtemp(prefix='mongocsvexport-',
+                                   dir=self.config['tmp_dir'])
+        try:
+            self._merge(self._imap(self._tasks(tmp_dir)))
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        self._write_epilogue()
+
+    def _ranges(self):
+        num_ranges = self.config['parallel'] * 4
+        boundaries = split_boundaries(self.collection, num_ranges,
+                                      self.config['query_cond'])
+        return id_ranges(boundaries)
+
+    def _tasks(self, tmp_dir):
+        config = dict(self.config)
+        if self.config['ordered']:
+            config['sort'] = [('_id', 1)]
+        tasks = []
+        for i, bounds in enumerate(self._ranges()):
+            path = os.path.join(tmp_dir, 'range-{:05d}.csv'.format(i))
+            tasks.append((self.collection.database.name, self.collection.name,
+                          self.fields, config, bounds, path))
+        return tasks
+
+    def _imap(self, tasks, func=export_range):
+        pool = multiprocessing.Pool(self.config['parallel'])
+        try:
+            imap = pool.imap if self.config['ordered'] else pool.imap_unordered
+            results = imap(func, tasks)
+            if self.config['show_progress']:
+                results = tqdm.tqdm(results, total=len(tasks))
+            for result in results:
+                yield result
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _merge(self, results):
+        remaining = self.config['limit'] or None
+        for path, num_docs, offsets in results:
+            with open(path, 'rb') as src:
+                if remaining is None or num_docs <= remaining:
+                    shutil.copyfileobj(src, self._output, COPY_CHUNK_SIZE)
+                else:
+                    self._copy_bytes(src, offsets[remaining - 1] if remaining else 0)
+            os.remove(path)
+            if remaining is not None:
+                remaining -= min(num_docs, remaining)
+                if not remaining:
+                    break
+
+    def _copy_bytes(self, src, size):
+        while size > 0:
+            data = src.read(min(size, COPY_CHUNK_SIZE))
+            if not data:
+                break
+            self._output.write(data)
+            size -= len(data)
@@ -0,0 +1,214 @@
+"""Export with fetch, expand and write stages running concurrently"""
+import sys
+import time
+import Queue
+import threading
+import bson
+import tqdm
+from mongocsvexport import MongoExport
+from mongocsvexport.rawbson import decode_batch, decode_document
+
+
+_DONE = object()
+
+
+class StageTimer(object):
+    """Busy and idle (waiting on queues) time of a pipeline stage"""
+
+    def __init__(self, name):
+        self.name = name
+        self.busy = 0.0
+        self.idle = 0.0
+        self._last = None
+
+    def start(self):
+        self._last = time.time()
+
+    def mark_busy(self):
+        now = time.time()
+        self.busy += now - self._last
+        self._last = now
+
+    def mark_idle(self):
+        now = time.time()
+        self.idle += now - self._last
+        self._last = now
+
+    def __str__(self):
+        total = self.busy + self.idle
+        return '{}: busy {:.2f}s, idle {:.2f}s ({:.0f}% busy)'.format(
+            self.name, self.busy, self.idle,
+            100.0 * self.busy / total if total else 0.0)
+
+
+class StageError(Exception):
+    """Pipeline is stopped because of an error in another stage"""
+
+
+class PipelineExport(MongoExport):
+    """Export which overlaps cursor reads, expansion and writing
+
+    The fetch stage reads batches of documents (or raw BSON batches) from
+    the cursor, the expand stage turns them into chunks of output rows and
+    the write stage, running in the calling thread, writes the chunks.
+    Stages are connected by bounded queues.
+    """
+
+    defaults = dict(MongoExport.defaults,
+                    fetch_queue=8, # Max number of fetched batches waiting for expansion
+                    write_queue=8, # Max number of row chunks waiting for writing
+                    raw_batches=False, # Fetch raw BSON batches, decode in expand stage
+                    pipeline_batch=1000) # Documents per fetched batch
+
+    def run(self):
+        self._write_prologue()
+        self._stop = threading.Event()
+        self._error = None
+        self.timers = [StageTimer(name) for name in ('fetch', 'expand', 'write')]
+        fetched = Queue.Queue(self.config['fetch_queue'])
+        expanded = Queue.Queue(self.config['write_queue'])
+        threads = [
+            threading.Thread(target=self._stage, name='mongocsvexport-fetch',
+                             args=(self._fetch, self.timers[0], None, fetched)),
+            threading.Thread(target=self._stage, name='mongocsvexport-expand',
+                             args=(self._expand, self.timers[1], fetched, expanded)),
+        ]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        try:
+            self._write(expanded, self.timers[2])
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+        if self._error is not None:
+            exc_type, exc_value, exc_tb = self._error
+            raise exc_type, exc_value, exc_tb
+        self._write_epilogue()
+        self._output.flush()
+        self._report()
+
+    def _report(self):
+        super(PipelineExport, self)._report()
+        for timer in self.timers:
+            print >>sys.stderr, timer
+
+    def _stage(self, target, timer, input, output):
+        timer.start()
+        try:
+            target(timer, input, output)
+            self._put(output, _DONE, timer)
+        except StageError:
+            pass
+        except Exception:
+            self._error = sys.exc_info()
+            self._stop.set()
+
+    def _get(self, queue, timer):
+        timer.mark_busy()
+        while True:
+            if self._stop.is_set():
+                raise StageError()
+            try:
+                item = queue.get(timeout=0.1)
+            except Queue.Empty:
+                continue
+            timer.mark_idle()
+            return item
+
+    def _put(self, queue, item, timer):
+        timer.mark_busy()
+        while True:
+            if self._stop.is_set():
+                raise StageError()
+            try:
+                queue.put(item, timeout=0.1)
+            except Queue.Full:
+                continue
+            timer.mark_idle()
+            return
+
+    def _fetch(self, timer, input, output):
+        if self.config['raw_batches']:
+            for batch in self._timed_cursor(self._cursor(self.collection.find_raw_batches)):
+                self._put(output, batch, timer)
+            return
+        batch_size = self.config['pipeline_batch']
+        batch = []
+        find = self._raw_find() if self.config['lazy_decode'] else None
+        for doc in self._timed_cursor(self._cursor(find)):
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                self._put(output, batch, timer)
+                batch = []
+        if batch:
+            self._put(output, batch, timer)
+
+    def _timed_cursor(self, cursor):
+        if self._stats is not None:
+            return self._stats.timed_iter(cursor, 'cursor')
+        return cursor
+
+    def _expand(self, timer, input, output):
+        progress = None
+        if self.config['show_progress']:
+            progress = tqdm.tqdm(total=self._count_docs())
+        def doc_done(doc, num_rows, flush):
+            self._batch_left -= 1
+            if not self._batch_left:
+                # rows of a batch do not wait for the next one
+                flush()
+                if progress is not None:
+                    progress.update(self._batch_size)
+        try:
+            self._write_chunks(self._fetched_docs(timer, input),
+                               lambda rows: self._put(output, rows, timer),
+                               doc_done=doc_done)
+        finally:
+            if progress is not None:
+                progress.close()
+
+    def _fetched_docs(self, timer, input):
+        raw_batches = self.config['raw_batches']
+        lazy_decode = self.config['lazy_decode']
+        plan = self._plan
+        decode_all = bson.decode_all
+        decode_raw_batch = lambda batch, plan: list(decode_batch(batch, plan))
+        decode = decode_document
+        if self._stats is not None:
+            decode_all = self._stats.timed(decode_all, 'decode')
+            decode_raw_batch = self._stats.timed(decode_raw_batch, 'decode')
+            decode = self._stats.timed(decode, 'decode')
+        while True:
+            batch = self._get(input, timer)
+            if batch is _DONE:
+                return
+            if raw_batches:
+                if lazy_decode:
+                    batch = decode_raw_batch(batch, plan)
+                else:
+                    batch = decode_all(batch)
+            elif lazy_decode:
+                batch = [decode(doc.raw, plan) for doc in batch]
+            self._batch_size = self._batch_left = len(batch)
+            for doc in batch:
+                yield doc
+
+    def _write(self, input, timer):
+        timer.start()
+        writerows = self._writer.writerows
+        flush_interval = self.config['flush_interval'] if self.config['show_progress'] else None
+        last_flush = time.time()
+        try:
+            while True:
+                rows = self._get(input, timer)
+                if rows is _DONE:
+                    break
+                writerows(rows)
+                if flush_interval is not None and time.time() - last_flush >= flush_interval:
+                    self._output.flush()
+                    last_flush = time.time()
+        except StageError:
+            pass
+        timer.mark_busy()
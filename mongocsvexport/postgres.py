@@ -0,0 +1,220 @@
+"""Export straight into PostgreSQL with COPY FROM STDIN"""
+import sys
+import Queue
+import threading
+from mongocsvexport import MongoExport, merge_cond
+from mongocsvexport.parallel import ParallelExport, range_cond
+
+
+_EOF = object()
+_ABORT = object()
+
+
+def connect(dsn):
+    try:
+        import psycopg2
+    except ImportError:
+        raise ValueError('--psql-dsn requires psycopg2 package')
+    return psycopg2.connect(dsn)
+
+def copy_sql(table):
+    return 'COPY {} FROM STDIN WITH (FORMAT csv)'.format(table)
+
+
+class CopyAborted(Exception):
+    """Data source of COPY has failed"""
+
+
+class CopyStream(object):
+    """Write-only file object feeding COPY FROM STDIN of the connection
+
+    Written data is collected into blocks of ``block_size`` bytes which
+    are read by COPY running in a background thread, at most
+    ``queue_size`` blocks are waiting. ``commit`` finishes the running
+    COPY, commits the transaction and starts the next COPY, ``close``
+    finishes and commits the last one and ``abort`` rolls it back.
+    """
+
+    def __init__(self, conn, sql, block_size=1024 * 1024, queue_size=8):
+        self._conn = conn
+        self._sql = sql
+        self._block_size = block_size
+        self._queue_size = queue_size
+        self._blocks = []
+        self._buffered = 0
+        self._position = 0
+        self.closed = False
+        self._start()
+
+    def write(self, data):
+        self._blocks.append(data)
+        self._buffered += len(data)
+        self._position += len(data)
+        if self._buffered >= self._block_size:
+            self._put_block()
+
+    def tell(self):
+        """Number of bytes written"""
+        return self._position
+
+    def flush(self):
+        self._put_block()
+
+    def commit(self):
+        self._finish()
+        self._conn.commit()
+        self._start()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._finish()
+        self._conn.commit()
+
+    def abort(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._blocks = []
+        try:
+            self._put(_ABORT)
+        except Exception:
+            pass # COPY has already failed
+        self._thread.join()
+        self._conn.rollback()
+
+    def read(self, size=-1):
+        # called by COPY in the background thread
+        block = self._queue.get()
+        if block is _EOF:
+            return ''
+        if block is _ABORT:
+            raise CopyAborted('Export has failed')
+        return block
+
+    def _start(self):
+        self._queue = Queue.Queue(self._queue_size)
+        self._error = None
+        self._thread = threading.Thread(target=self._copy, name='mongocsvexport-copy')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _finish(self):
+        self._put_block()
+        self._put(_EOF)
+        self._thread.join()
+        self._check_error()
+
+    def _copy(self):
+        try:
+            cursor = self._conn.cursor()
+            cursor.copy_expert(self._sql, self, self._block_size)
+            cursor.close()
+        except CopyAborted:
+            pass
+        except Exception:
+            self._error = sys.exc_info()
+
+    def _put_block(self):
+        if self._blocks:
+            self._put(''.join(self._blocks))
+            self._blocks = []
+            self._buffered = 0
+
+    def _put(self, item):
+        # COPY may fail and stop reading, do not block on the full queue
+        while True:
+            self._check_error()
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except Queue.Full:
+                if not self._thread.is_alive():
+                    self._check_error()
+                    raise RuntimeError('COPY has stopped reading data')
+
+    def _check_error(self):
+        if self._error is not None:
+            exc_type, exc_value, exc_tb = self._error
+            raise exc_type, exc_value, exc_tb
+
+
+class PostgresExport(MongoExport):
+    """Export rows into PostgreSQL table with COPY over a connection
+
+    Rows are written as CSV into COPY FROM STDIN running concurrently with
+    the export. With ``psql_commit_rows`` the transaction is committed and
+    a new COPY started every that many rows (documents are never split),
+    so a failure rolls back only the last batch. The output passed to the
+    constructor is not used.
+    """
+
+    defaults = dict(MongoExport.defaults,
+                    psql_dsn=None, # libpq connection string
+                    psql_table=None, # Target table, collection name by default
+                    psql_commit_rows=None, # Rows per transaction, one transaction by default
+                    copy_block_size=1024 * 1024) # Bytes passed to COPY at once
+
+    def __init__(self, collection, fields, output, config):
+        # COPY reads empty unquoted values as NULL
+        config = dict(config, delimiter=',', header=False, null_value='', psql_dump=None)
+        super(PostgresExport, self).__init__(collection, fields, output, config)
+
+    def _init_output(self, output):
+        self._conn = connect(self.config['psql_dsn'])
+        table = self.config['psql_table'] or self.collection.name
+        return CopyStream(self._conn, copy_sql(table), self.config['copy_block_size'])
+
+    def run(self):
+        try:
+            super(PostgresExport, self).run()
+            self._output.close()
+        except:
+            self._output.abort()
+            raise
+        finally:
+            self._conn.close()
+
+    def _write_rows(self, docs):
+        commit_rows = self.config['psql_commit_rows']
+        if not commit_rows:
+            return super(PostgresExport, self)._write_rows(docs)
+        self._commit_at = commit_rows
+        self._write_chunks(docs, self._write_chunk, min(self.config['chunk_rows'], commit_rows),
+                           self._doc_done)
+
+    def _doc_done(self, doc, num_rows, flush):
+        # transactions end at document boundaries
+        if num_rows >= self._commit_at:
+            flush()
+            self._output.commit()
+            self._commit_at = num_rows + self.config['psql_commit_rows']
+
+
+def copy_range(task):
+    """Copy one _id range into PostgreSQL (pool worker)"""
+    db_name, coll_name, fields, config, bounds = task
+    config = dict(config,
+                  query_cond=merge_cond(config.get('query_cond'), range_cond(*bounds)),
+                  show_progress=False)
+    export = PostgresExport.create(db_name, coll_name, fields, None, config)
+    export.run()
+
+
+class ParallelPostgresExport(ParallelExport):
+    """Copy _id ranges of collection into PostgreSQL by several processes
+
+    Every process runs its own COPY streams and transactions, so ranges
+    are committed independently. A partitioned target table routes rows
+    of concurrent streams to its partitions.
+    """
+
+    defaults = dict(ParallelExport.defaults, ordered=False, **PostgresExport.defaults)
+
+    def run(self):
+        tasks = [(self.collection.database.name, self.collection.name,
+                  self.fields, self.config, bounds)
+                 for bounds in self._ranges()]
+        for _ in self._imap(tasks, copy_range):
+            pass
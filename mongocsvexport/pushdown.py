@@ -0,0 +1,102 @@
+"""Expansion of lists by the server with an aggregation pipeline
+
+Every node of the fields plan is unwound by ``$unwind`` in plan order,
+parents first, so the server returns one document per output row in the
+order of the client expansion. Rows are still produced by expand_dict
+from the unwound documents, which keeps the null value and serialization
+rules the same.
+"""
+import tqdm
+from bson.son import SON
+from mongocsvexport import MongoExport
+
+
+class NestedList(list):
+    """List nested directly in a list
+
+    The client expansion does not expand such lists but writes them as
+    values, expand_dict does the same for this type.
+    """
+
+
+def unwind_paths(plan):
+    """Paths of the plan nodes, parents before their children"""
+    paths = []
+    def visit(node):
+        for child in node.children.itervalues():
+            paths.append(child.path)
+            visit(child)
+    visit(plan)
+    return paths
+
+def _field(path):
+    return '$' + '.'.join(path)
+
+def empty_list_cond(path):
+    """Expression which is true for an empty list at the path
+
+    Only lists reached through sub-documents count: a path into a list
+    nested in a list is not expanded by the client.
+    """
+    conds = [{'$eq': [{'$type': _field(path[:i])}, 'object']} for i in range(1, len(path))]
+    conds.append({'$eq': [_field(path), []]})
+    return conds[0] if len(conds) == 1 else {'$and': conds}
+
+def build_pipeline(plan, query_cond=None, sort=None, limit=None, projection=None):
+    """Aggregation pipeline returning one document per output row"""
+    pipeline = []
+    if query_cond:
+        pipeline.append({'$match': query_cond})
+    if sort:
+        pipeline.append({'$sort': SON(sort)})
+    if limit:
+        # limit applies to documents, not to rows
+        pipeline.append({'$limit': limit})
+    if projection:
+        pipeline.append({'$project': projection})
+    for path in unwind_paths(plan):
+        # empty lists produce no rows
+        pipeline.append({'$match': {'$expr': {'$not': [empty_list_cond(path)]}}})
+        pipeline.append({'$unwind': {'path': _field(path), 'preserveNullAndEmptyArrays': True}})
+    return pipeline
+
+def wrap_nested(doc, paths):
+    """Mark lists left at unwound paths, they were nested in lists"""
+    for path in paths:
+        parent = doc
+        for key in path[:-1]:
+            parent = parent.get(key) if type(parent) is dict else None
+        if type(parent) is dict:
+            val = parent.get(path[-1])
+            if type(val) is list:
+                parent[path[-1]] = NestedList(val)
+    return doc
+
+
+class PushdownExport(MongoExport):
+    """Export with lists unwound by the server
+
+    The server sends one document per output row. This moves the
+    expansion of array paths close to the data at the cost of larger
+    transfer for documents with many rows. Progress meter counts rows as
+    their number is not known in advance.
+    """
+
+    def _doc_iter(self):
+        config = self.config
+        projection = self._projection() if config['projection'] else None
+        pipeline = build_pipeline(self._plan, config['query_cond'], config['sort'],
+                                  config['limit'], projection)
+        kwargs = {'allowDiskUse': True}
+        if config['hint']:
+            kwargs['hint'] = config['hint']
+        if config['batch_size']:
+            kwargs['batchSize'] = config['batch_size']
+        docs = self.collection.aggregate(pipeline, **kwargs)
+        if self._stats is not None:
+            docs = self._stats.timed_iter(docs, 'cursor')
+        if config['show_progress']:
+            docs = tqdm.tqdm(docs)
+        paths = unwind_paths(self._plan)
+        for doc in docs:
+            yield wrap_nested(doc, paths)
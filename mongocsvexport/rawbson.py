@@ -0,0 +1,149 @@
+"""Decode only the requested paths of raw BSON documents
+
+Documents are walked following the compiled fields plan. Values are
+decoded only for requested fields and the arrays leading to them, other
+elements are skipped by their size. The result is a plain dict holding
+the values expand_dict needs to produce the same rows as for the fully
+decoded document.
+"""
+import struct
+import bson
+from bson.errors import InvalidBSON
+from bson.objectid import ObjectId
+
+
+_int32 = struct.Struct('<i')
+_double = struct.Struct('<d')
+
+# sizes of fixed size values by BSON element type
+_FIXED_SIZES = {
+    0x01: 8, # double
+    0x06: 0, # undefined
+    0x07: 12, # ObjectId
+    0x08: 1, # boolean
+    0x09: 8, # UTC datetime
+    0x0A: 0, # null
+    0x10: 4, # int32
+    0x11: 8, # timestamp
+    0x12: 8, # int64
+    0x13: 16, # decimal128
+    0x7F: 0, # max key
+    0xFF: 0, # min key
+}
+
+def _cstring_end(data, pos):
+    # find instead of index: memory maps have no index method
+    end = data.find('\x00', pos)
+    if end < 0:
+        raise InvalidBSON('Unterminated C string')
+    return end
+
+def _value_size(data, element_type, pos):
+    size = _FIXED_SIZES.get(element_type)
+    if size is not None:
+        return size
+    if element_type in (0x02, 0x0D, 0x0E): # string, code, symbol
+        return 4 + _int32.unpack_from(data, pos)[0]
+    if element_type in (0x03, 0x04, 0x0F): # document, array, code with scope
+        return _int32.unpack_from(data, pos)[0]
+    if element_type == 0x05: # binary
+        return 5 + _int32.unpack_from(data, pos)[0]
+    if element_type == 0x0B: # regex
+        return _cstring_end(data, _cstring_end(data, pos) + 1) + 1 - pos
+    if element_type == 0x0C: # DBPointer
+        return 4 + _int32.unpack_from(data, pos)[0] + 12
+    raise InvalidBSON('Unknown BSON element type: {:#x}'.format(element_type))
+
+def iter_elements(data, start=0):
+    """Generate (type, key, value start, value end) for document elements"""
+    end = start + _int32.unpack_from(data, start)[0] - 1
+    pos = start + 4
+    while pos < end:
+        element_type = ord(data[pos])
+        key_end = _cstring_end(data, pos + 1)
+        value_pos = key_end + 1
+        value_end = value_pos + _value_size(data, element_type, value_pos)
+        yield element_type, data[pos + 1:key_end], value_pos, value_end
+        pos = value_end
+
+def decode_value(data, element_type, start, end, codec_options=bson.DEFAULT_CODEC_OPTIONS):
+    """Decode single element value"""
+    if element_type == 0x02:
+        return data[start + 4:end - 1].decode('utf-8')
+    if element_type == 0x10:
+        return _int32.unpack_from(data, start)[0]
+    if element_type == 0x01:
+        return _double.unpack_from(data, start)[0]
+    if element_type == 0x07:
+        return ObjectId(data[start:end])
+    if element_type == 0x08:
+        return data[start] == '\x01'
+    if element_type == 0x0A:
+        return None
+    # wrap the value into one element document for bson to decode it
+    element = chr(element_type) + '\x00' + data[start:end]
+    doc = _int32.pack(len(element) + 5) + element + '\x00'
+    return bson.decode_all(doc, codec_options)[0]['']
+
+def decode_document(data, plan, start=0, codec_options=bson.DEFAULT_CODEC_OPTIONS):
+    """Decode requested paths of the BSON document starting at ``start``"""
+    doc = {}
+    children = plan.children
+    remaining = len(children)
+    if not remaining:
+        return doc
+    # iter_elements inlined: most of the elements are only skipped
+    unpack_int32 = _int32.unpack_from
+    fixed_sizes = _FIXED_SIZES
+    find = data.find
+    end = start + unpack_int32(data, start)[0] - 1
+    pos = start + 4
+    while pos < end:
+        element_type = ord(data[pos])
+        key_end = find('\x00', pos + 1)
+        node = children.get(data[pos + 1:key_end])
+        pos = key_end + 1
+        size = fixed_sizes.get(element_type)
+        if size is None:
+            if element_type <= 0x04: # string, document, array
+                size = unpack_int32(data, pos)[0] + (4 if element_type == 0x02 else 0)
+            else:
+                size = _value_size(data, element_type, pos)
+        if node is not None:
+            key = node.path[-1]
+            if element_type == 0x03:
+                doc[key] = decode_document(data, node, pos, codec_options)
+            elif element_type == 0x04:
+                doc[key] = decode_array(data, node, pos, codec_options)
+            elif node.index is not None:
+                doc[key] = decode_value(data, element_type, pos, pos + size, codec_options)
+            remaining -= 1
+            if not remaining:
+                break
+        pos += size
+    return doc
+
+def decode_array(data, node, start=0, codec_options=bson.DEFAULT_CODEC_OPTIONS):
+    """Decode array items under the plan node
+
+    Items which are not documents only matter for a requested field, for
+    other nodes they are kept as None placeholders as they still produce
+    a row each.
+    """
+    items = []
+    for element_type, _, start, end in iter_elements(data, start):
+        if element_type == 0x03:
+            items.append(decode_document(data, node, start, codec_options))
+        elif node.index is not None:
+            items.append(decode_value(data, element_type, start, end, codec_options))
+        else:
+            items.append(None)
+    return items
+
+def decode_batch(data, plan, codec_options=bson.DEFAULT_CODEC_OPTIONS):
+    """Generate decoded documents of concatenated BSON documents"""
+    pos = 0
+    size = len(data)
+    while pos < size:
+        yield decode_document(data, plan, pos, codec_options)
+        pos += _int32.unpack_from(data, pos)[0]
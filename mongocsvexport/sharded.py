@@ -0,0 +1,140 @@
+"""Export into several part files with size or row count rollover"""
+import re
+from mongocsvexport import MongoExport, open_output
+from mongocsvexport.statefile import write_state
+
+
+PART_NUMBER_RE = re.compile(r'%0?\d*d')
+
+def manifest_path(pattern):
+    """Default manifest file name for the part files pattern"""
+    return PART_NUMBER_RE.sub('manifest', pattern, count=1) + '.json'
+
+
+class Part(object):
+    """Part file statistics for the manifest"""
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        self.docs = 0
+        self.bytes = 0
+        self.min_id = None
+        self.max_id = None
+
+    def add_id(self, doc_id):
+        if self.min_id is None or doc_id < self.min_id:
+            self.min_id = doc_id
+        if self.max_id is None or doc_id > self.max_id:
+            self.max_id = doc_id
+
+    def to_dict(self):
+        return {
+            'path': self.path,
+            'rows': self.rows,
+            'docs': self.docs,
+            'bytes': self.bytes,
+            'min_id': self.min_id,
+            'max_id': self.max_id,
+        }
+
+
+class ShardedExport(MongoExport):
+    """Export into part files named by a pattern like out-%05d.csv
+
+    A new part is started when the current one has ``max_rows`` rows or
+    ``max_bytes`` bytes. Every part gets its own header or COPY framing.
+    Rows of a document are kept in one part unless ``split_docs`` is set,
+    so a part may exceed ``max_bytes`` by one document and ``max_rows``
+    only if a single document has more rows. Parts with their row counts
+    and _id ranges are listed in a JSON manifest written at the end.
+    """
+
+    defaults = dict(MongoExport.defaults,
+                    max_rows=None, # Max number of rows in a part
+                    max_bytes=None, # Max size of a part, bytes
+                    split_docs=False, # Allow rows of a document in several parts
+                    manifest=None) # Manifest file, derived from pattern by default
+
+    def _init_output(self, pattern):
+        if not PART_NUMBER_RE.search(pattern):
+            raise ValueError('Output file name must have part number like %05d')
+        self._pattern = pattern
+        self.parts = []
+        return self._open_part()
+
+    def _open_part(self):
+        part = Part(self._pattern % (len(self.parts) + 1))
+        self.parts.append(part)
+        return open_output(part.path, self.config)
+
+    def _rollover(self):
+        self._write_epilogue()
+        self._close_part()
+        self._output = self._open_part()
+        self._writer = self._new_writer(self._output)
+        self._write_prologue()
+
+    def _close_part(self):
+        self.parts[-1].bytes = self._output.tell()
+        self._output.close()
+
+    def run(self):
+        super(ShardedExport, self).run()
+        self._close_part()
+        write_state(self.config['manifest'] or manifest_path(self._pattern),
+                    {'parts': [part.to_dict() for part in self.parts]})
+
+    def _projection(self):
+        projection = super(ShardedExport, self)._projection()
+        projection['_id'] = 1
+        return projection
+
+    def _is_full(self, part, new_rows):
+        max_rows = self.config['max_rows']
+        max_bytes = self.config['max_bytes']
+        if not part.rows:
+            return False
+        return ((max_rows and part.rows + new_rows > max_rows) or
+                (max_bytes and self._output.tell() >= max_bytes))
+
+    def _row_count(self, rows):
+        # number of rows of the document rows without generating them
+        count = rows.count
+        max_fanout = self.config['max_fanout']
+        if max_fanout is not None and count > max_fanout:
+            return max_fanout if self.config['fanout_policy'] == 'truncate' else 0
+        return count
+
+    def _write_rows(self, docs):
+        if not self.config['split_docs']:
+            self._doc_start = 0
+            # the writer is replaced by the rollover
+            self._write_chunks(docs, lambda rows: self._writer.writerows(rows),
+                               doc_done=self._doc_done)
+            return
+        for doc in docs:
+            for row in self._get_rows(doc):
+                if self._is_full(self.parts[-1], 1):
+                    self._rollover()
+                self._writer.writerow(row)
+                self._add_doc(self.parts[-1], doc, 1)
+
+    def _get_rows(self, doc):
+        rows = self._document_rows(doc)
+        # a document which does not fit starts the next part
+        if not self.config['split_docs'] and self._is_full(self.parts[-1],
+                                                           self._row_count(rows)):
+            self._rollover()
+        return self._fanout_rows(doc, rows)
+
+    def _doc_done(self, doc, num_rows, flush):
+        # parts end at document boundaries
+        flush()
+        self._add_doc(self.parts[-1], doc, num_rows - self._doc_start)
+        self._doc_start = num_rows
+
+    def _add_doc(self, part, doc, num_rows):
+        part.rows += num_rows
+        part.docs += 1
+        part.add_id(doc.get('_id'))
@@ -0,0 +1,218 @@
+"""Export of documents from files instead of a collection
+
+Sources generate documents of mongodump ``.bson`` files or of JSON lines
+(MongoDB extended JSON, one document per line). The collection is the
+source of MongoExport, FileExport takes a file source in its place and
+feeds the documents to the same expansion and output.
+"""
+import os
+import sys
+import mmap
+import struct
+import itertools
+import bson.json_util
+from mongocsvexport import MongoExport
+from mongocsvexport.parallel import ParallelExport, write_part
+from mongocsvexport.rawbson import decode_document
+from mongocsvexport.statefile import JSON_OPTIONS
+
+
+INPUT_FORMATS = ('bson', 'jsonl')
+
+_int32 = struct.Struct('<i')
+
+
+def input_format(path):
+    """Guess input format by file name suffix, JSON lines by default"""
+    return 'bson' if path.endswith('.bson') else 'jsonl'
+
+def open_source(path, format=None):
+    """Source of the file documents, ``-`` stands for stdin"""
+    format = format or input_format(path)
+    if format not in INPUT_FORMATS:
+        raise ValueError('Unknown input format: {}'.format(format))
+    if path != '-' and not os.path.isfile(path):
+        raise ValueError('Input file {} does not exist'.format(path))
+    if format == 'bson':
+        return BsonStreamSource(sys.stdin) if path == '-' else BsonFileSource(path)
+    return JsonLinesSource(path)
+
+def _split_offsets(size, num_parts):
+    step = max(size // max(num_parts, 1), 1)
+    return range(step, size, step)[:num_parts - 1]
+
+
+class BsonFileSource(object):
+    """Documents of a .bson file between ``start`` and ``end`` offsets
+
+    The file is memory mapped and only the requested paths of the
+    documents are decoded from the map.
+    """
+
+    def __init__(self, path, start=0, end=None):
+        self.path = path
+        self.start = start
+        self.end = end
+
+    def docs(self, plan):
+        with open(self.path, 'rb') as f:
+            if not os.fstat(f.fileno()).st_size:
+                return
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            unpack_int32 = _int32.unpack_from
+            pos = self.start
+            end = len(data) if self.end is None else self.end
+            while pos < end:
+                size = unpack_int32(data, pos)[0]
+                if size < 5 or pos + size > len(data):
+                    raise ValueError('Broken document at offset {} of {}'.format(pos, self.path))
+                yield decode_document(data, plan, pos)
+                pos += size
+        finally:
+            data.close()
+
+    def split(self, num_parts):
+        """Split into about equal sources at document boundaries
+
+        Only the document sizes are read to find the boundaries.
+        """
+        size = os.path.getsize(self.path)
+        offsets = iter(_split_offsets(size, num_parts))
+        bounds = [0]
+        with open(self.path, 'rb') as f:
+            offset = next(offsets, None)
+            pos = 0
+            while offset is not None and pos < size:
+                if pos >= offset:
+                    bounds.append(pos)
+                    while offset is not None and offset <= pos:
+                        offset = next(offsets, None)
+                    continue
+                f.seek(pos)
+                header = f.read(4)
+                doc_size = _int32.unpack(header)[0] if len(header) == 4 else 0
+                if doc_size < 5:
+                    raise ValueError('Broken document at offset {} of {}'.format(pos, self.path))
+                pos += doc_size
+        bounds.append(None)
+        return [BsonFileSource(self.path, start, end)
+                for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+class BsonStreamSource(object):
+    """Documents of a BSON stream like stdin, can not be split"""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+
+    def docs(self, plan):
+        read = self.fileobj.read
+        while True:
+            header = read(4)
+            if not header:
+                return
+            size = _int32.unpack(header)[0] if len(header) == 4 else 0
+            data = header + read(size - 4) if size >= 5 else header
+            if len(data) != size:
+                raise ValueError('Truncated BSON document in the input')
+            yield decode_document(data, plan)
+
+
+class JsonLinesSource(object):
+    """Documents of JSON lines starting between ``start`` and ``end``
+    offsets, ``-`` reads stdin"""
+
+    def __init__(self, path, start=0, end=None):
+        self.path = path
+        self.start = start
+        self.end = end
+
+    def docs(self, plan):
+        if self.path == '-':
+            for line in sys.stdin:
+                if line.strip():
+                    yield bson.json_util.loads(line, json_options=JSON_OPTIONS)
+            return
+        with open(self.path, 'rb') as f:
+            if self.start:
+                # the line containing start - 1 belongs to the previous part
+                f.seek(self.start - 1)
+                f.readline()
+            while self.end is None or f.tell() < self.end:
+                line = f.readline()
+                if not line:
+                    break
+                if line.strip():
+                    yield bson.json_util.loads(line, json_options=JSON_OPTIONS)
+
+    def split(self, num_parts):
+        if self.path == '-':
+            raise ValueError('Standard input can not be split')
+        bounds = [0] + _split_offsets(os.path.getsize(self.path), num_parts) + [None]
+        return [JsonLinesSource(self.path, start, end)
+                for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+class FileExport(MongoExport):
+    """Export documents of a file source
+
+    ``collection`` argument is the source. Query conditions, sort and
+    projection of the collection export do not apply to files.
+    """
+
+    defaults = dict(MongoExport.defaults,
+                    input_path=None, # .bson or JSON lines file, - for stdin
+                    input_format=None) # bson or jsonl, by default guessed by suffix
+
+    @classmethod
+    def create(cls, db_name, coll_name, fields, output, config):
+        """Constructor which opens the source from config"""
+        source = open_source(config['input_path'], config.get('input_format'))
+        return cls(source, fields, output, config)
+
+    def _doc_iter(self):
+        docs = self.collection.docs(self._plan)
+        if self.config['limit']:
+            docs = itertools.islice(docs, self.config['limit'])
+        if self._stats is not None:
+            docs = self._stats.timed_iter(docs, 'cursor')
+        if self.config['show_progress']:
+            import tqdm
+            # number of documents is not known without reading the file
+            docs = tqdm.tqdm(docs)
+        return docs
+
+
+def export_part(task):
+    """Export one part of the file into a temporary file (pool worker)"""
+    source, fields, config, path = task
+    config = dict(config, header=False, psql_dump=None, show_progress=False)
+    with open(path, 'wb', config['buffer_size']) as output:
+        export = FileExport(source, fields, output, config)
+        num_docs, offsets = write_part(export, output)
+    return path, num_docs, offsets
+
+
+class ParallelFileExport(ParallelExport):
+    """Export of a file split at document boundaries by several processes"""
+
+    defaults = dict(ParallelExport.defaults,
+                    input_path=None,
+                    input_format=None)
+
+    @classmethod
+    def create(cls, db_name, coll_name, fields, output, config):
+        source = open_source(config['input_path'], config.get('input_format'))
+        return cls(source, fields, output, config)
+
+    def _tasks(self, tmp_dir):
+        config = dict(self.config)
+        tasks = []
+        for i, part in enumerate(self.collection.split(self.config['parallel'] * 4)):
+            path = os.path.join(tmp_dir, 'part-{:05d}.csv'.format(i))
+            tasks.append((part, self.fields, config, path))
+        return tasks
+
+    def _imap(self, tasks, func=export_part):
+        return ParallelExport._imap(self, tasks, func)
@@ -0,0 +1,32 @@
+"""State files of resumable and incremental exports"""
+import os
+import bson.json_util
+from bson.json_util import JSONOptions
+
+
+# datetimes come back naive like from MongoClient with default options
+JSON_OPTIONS = JSONOptions(tz_aware=False)
+
+def read_state(path):
+    """Read state dict from the file, None if there is no file"""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return bson.json_util.loads(f.read(), json_options=JSON_OPTIONS)
+
+def write_state(path, state):
+    """Write state dict to the file atomically"""
+    write_atomic(path, bson.json_util.dumps(state, json_options=JSON_OPTIONS))
+
+def write_atomic(path, data):
+    """Replace the file content
+
+    The data is written to a temporary file which is renamed over the
+    file, so a crash never leaves a partial content.
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(tmp_path, path)
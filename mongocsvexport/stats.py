@@ -0,0 +1,222 @@
+"""Stage timers and counters of an export"""
+import json
+import time
+from mongocsvexport.statefile import write_atomic
+
+
+STAGES = ('cursor', 'decode', 'expand', 'serialize', 'write')
+FORMATS = ('jsonl', 'prometheus')
+
+
+def fanout_bucket(num_rows):
+    """Histogram bucket of rows per document: 0, 1, 2-3, 4-7, ..."""
+    bucket = 0
+    while num_rows:
+        num_rows >>= 1
+        bucket += 1
+    return bucket
+
+def bucket_bounds(bucket):
+    """(lowest, highest) number of rows in the bucket"""
+    if not bucket:
+        return 0, 0
+    return 2 ** (bucket - 1), 2 ** bucket - 1
+
+
+class CountingOutput(object):
+    """Output proxy counting written bytes"""
+
+    def __init__(self, output, stats):
+        self._output = output
+        self._stats = stats
+
+    def write(self, data):
+        self._stats.bytes += len(data)
+        self._output.write(data)
+
+
+class TimedWriter(object):
+    """csv writer proxy timing the writes"""
+
+    def __init__(self, writer, stats):
+        self._writer = writer
+        self._stats = stats
+
+    def writerow(self, row):
+        start = time.time()
+        self._writer.writerow(row)
+        self._stats.seconds['write'] += time.time() - start
+
+    def writerows(self, rows):
+        start = time.time()
+        self._writer.writerows(rows)
+        self._stats.seconds['write'] += time.time() - start
+
+
+class ExportStats(object):
+    """Documents, rows and bytes counters, rows per document histogram
+    and time spent in the export stages
+
+    ``cursor`` is the time of waiting for documents from the cursor
+    (including BSON decoding by the driver), ``decode`` is the lazy
+    decoding, ``expand`` the expansion without ``serialize`` and
+    ``write`` the CSV writer with the output. Snapshots are written to
+    ``path`` every ``interval`` seconds and at the end, as JSON lines or
+    as Prometheus text file which is replaced each time.
+    """
+
+    def __init__(self, path=None, format='jsonl', interval=10.0):
+        if format not in FORMATS:
+            raise ValueError('Unknown stats format: {}'.format(format))
+        self.path = path
+        self.format = format
+        self.interval = interval
+        self.docs = 0
+        self.rows = 0
+        self.bytes = 0
+        self.fanout = {}
+        self.seconds = dict((stage, 0.0) for stage in STAGES)
+        self.started = time.time()
+        self._last_snapshot = self.started
+        if path and format == 'jsonl':
+            # snapshots of this export only
+            open(path, 'w').close()
+
+    def counting_output(self, output):
+        return CountingOutput(output, self)
+
+    def timed_writer(self, writer):
+        return TimedWriter(writer, self)
+
+    def timed(self, func, stage):
+        """Wrap the function to add its time to the stage"""
+        seconds = self.seconds
+        def timed_func(*args):
+            start = time.time()
+            result = func(*args)
+            seconds[stage] += time.time() - start
+            return result
+        return timed_func
+
+    def timed_iter(self, iterable, stage):
+        """Generate items of the iterable adding time of getting them to the stage"""
+        seconds = self.seconds
+        iterator = iter(iterable)
+        while True:
+            start = time.time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                seconds[stage] += time.time() - start
+                return
+            seconds[stage] += time.time() - start
+            yield item
+
+    def timed_rows(self, get_rows):
+        """Wrap the document expansion to count documents and rows
+
+        Rows are generated as they are expanded, the document is counted
+        when its rows are exhausted.
+        """
+        seconds = self.seconds
+        fanout = self.fanout
+        def timed_get_rows(doc):
+            start = time.time()
+            rows = iter(get_rows(doc))
+            num_rows = 0
+            while True:
+                try:
+                    row = next(rows)
+                except StopIteration:
+                    break
+                seconds['expand'] += time.time() - start
+                num_rows += 1
+                yield row
+                start = time.time()
+            now = time.time()
+            seconds['expand'] += now - start
+            self.docs += 1
+            self.rows += num_rows
+            bucket = fanout_bucket(num_rows)
+            fanout[bucket] = fanout.get(bucket, 0) + 1
+            if self.path and now - self._last_snapshot >= self.interval:
+                self.write_snapshot(now)
+        return timed_get_rows
+
+    def snapshot(self, now=None):
+        now = time.time() if now is None else now
+        seconds = dict(self.seconds)
+        # serialization runs inside the expansion
+        seconds['expand'] = max(seconds['expand'] - seconds['serialize'], 0.0)
+        return {
+            'time': now,
+            'elapsed': now - self.started,
+            'docs': self.docs,
+            'rows': self.rows,
+            'bytes': self.bytes,
+            'seconds': seconds,
+            'fanout': dict(('{}-{}'.format(*bucket_bounds(bucket)), count)
+                           for bucket, count in sorted(self.fanout.items())),
+        }
+
+    def write_snapshot(self, now=None):
+        self._last_snapshot = time.time() if now is None else now
+        snapshot = self.snapshot(self._last_snapshot)
+        if self.format == 'jsonl':
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(snapshot, sort_keys=True) + '\n')
+        else:
+            write_atomic(self.path, self.prometheus(snapshot))
+
+    def prometheus(self, snapshot):
+        """Snapshot in Prometheus text exposition format"""
+        lines = []
+        def metric(name, metric_type, help, samples):
+            lines.append('# HELP mongocsvexport_{} {}'.format(name, help))
+            lines.append('# TYPE mongocsvexport_{} {}'.format(name, metric_type))
+            for labels, value in samples:
+                lines.append('mongocsvexport_{}{} {}'.format(name, labels, value))
+        metric('docs_total', 'counter', 'Documents exported', [('', snapshot['docs'])])
+        metric('rows_total', 'counter', 'Rows written', [('', snapshot['rows'])])
+        metric('bytes_total', 'counter', 'Bytes written', [('', snapshot['bytes'])])
+        metric('elapsed_seconds', 'gauge', 'Time since export start',
+               [('', '{:.3f}'.format(snapshot['elapsed']))])
+        metric('stage_seconds_total', 'counter', 'Time spent in export stage',
+               [('{{stage="{}"}}'.format(stage), '{:.3f}'.format(snapshot['seconds'][stage]))
+                for stage in STAGES])
+        buckets = []
+        count = 0
+        for bucket in range(max(self.fanout) + 1 if self.fanout else 1):
+            count += self.fanout.get(bucket, 0)
+            buckets.append(('{{le="{}"}}'.format(bucket_bounds(bucket)[1]), count))
+        buckets.append(('{le="+Inf"}', count))
+        metric('fanout_rows', 'histogram', 'Rows per document', [])
+        for labels, value in buckets:
+            lines.append('mongocsvexport_fanout_rows_bucket{} {}'.format(labels, value))
+        lines.append('mongocsvexport_fanout_rows_sum {}'.format(snapshot['rows']))
+        lines.append('mongocsvexport_fanout_rows_count {}'.format(count))
+        return '\n'.join(lines) + '\n'
+
+    def close(self):
+        if self.path:
+            self.write_snapshot()
+
+    def summary(self):
+        """Lines of the human readable summary"""
+        snapshot = self.snapshot()
+        elapsed = snapshot['elapsed'] or 1e-9
+        lines = ['Export stats: {} docs, {} rows, {} bytes in {:.2f}s '
+                 '({:.0f} docs/s, {:.0f} rows/s, {:.2f} MB/s)'.format(
+                     snapshot['docs'], snapshot['rows'], snapshot['bytes'], elapsed,
+                     snapshot['docs'] / elapsed, snapshot['rows'] / elapsed,
+                     snapshot['bytes'] / elapsed / 1e6)]
+        for stage in STAGES:
+            seconds = snapshot['seconds'][stage]
+            lines.append('  {:10} {:8.2f}s {:5.1f}%'.format(stage, seconds,
+                                                         100.0 * seconds / elapsed))
+        lines.append('  rows per document:')
+        for bucket, count in sorted(self.fanout.items()):
+            lowest, highest = bucket_bounds(bucket)
+            bounds = str(lowest) if lowest == highest else '{}-{}'.format(lowest, highest)
+            lines.append('  {:>14} {}'.format(bounds, count))
+        return lines
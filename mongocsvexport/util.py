@@ -1 +1,49 @@
+"""Helpers which do not depend on MongoDB"""
 
+
+class LRUCache(object):
+    """Bounded mapping which discards the least recently used items
+
+    Items are kept in a circular doubly linked list of [prev, next, key,
+    value] links, the most recently used one is next to the root.
+    """
+
+    PREV, NEXT, KEY, VALUE = 0, 1, 2, 3
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._links = {}
+        self._root = root = []
+        root[:] = [root, root, None, None]
+
+    def __len__(self):
+        return len(self._links)
+
+    def get(self, key, compute):
+        """Return cached value for the key, call compute(key) on a miss"""
+        link = self._links.get(key)
+        if link is not None:
+            self.hits += 1
+            prev, next = link[0], link[1]
+            prev[1] = next
+            next[0] = prev
+            root = self._root
+            first = root[1]
+            link[0] = root
+            link[1] = first
+            first[0] = root[1] = link
+            return link[3]
+        self.misses += 1
+        value = compute(key)
+        root = self._root
+        if len(self._links) >= self.maxsize:
+            oldest = root[0]
+            oldest[0][1] = root
+            root[0] = oldest[0]
+            del self._links[oldest[2]]
+        first = root[1]
+        link = [root, first, key, value]
+        first[0] = root[1] = self._links[key] = link
+        return value
@@ -13,9 +13,15 @@ setup(
       'pymongo',
       'tqdm'
     ],
+    extras_require={
+      'zstd': ['zstandard'],
+      'lz4': ['lz4'],
+      'postgres': ['psycopg2'],
+      'columnar': ['pyarrow'],
+    },
     entry_points={
         "console_scripts": [
-            "mongocsvexport=mongocsvexport:main"
+            "mongocsvexport=mongocsvexport.cli:main"
         ]
     }
 )
@@ -0,0 +1,167 @@
+import os
+import shutil
+import tempfile
+import unittest
+from mock import MagicMock
+from bson.objectid import ObjectId
+from mongocsvexport.checkpoint import Checkpoint, CheckpointExport
+from mongocsvexport.parallel import TYPE_BRACKETS, type_bracket
+
+
+def id_key(val):
+    # BSON order of _id values
+    return type_bracket(val), val
+
+def matches(doc, cond):
+    """Evaluate _id query condition like the server"""
+    for key, val in cond.items():
+        if key == '$and' and not all(matches(doc, sub) for sub in val):
+            return False
+        if key == '$or' and not any(matches(doc, sub) for sub in val):
+            return False
+        if key == '_id' and not matches_ops(doc['_id'], val):
+            return False
+    return True
+
+def matches_ops(val, ops):
+    same_type = lambda arg: type_bracket(arg) == type_bracket(val)
+    for op, arg in ops.items():
+        if op == '$gt' and not (same_type(arg) and val > arg):
+            return False
+        if op == '$gte' and not (same_type(arg) and val >= arg):
+            return False
+        if op == '$ne' and val == arg:
+            return False
+        if op == '$type' and not set(TYPE_BRACKETS[type_bracket(val)]) & set(arg):
+            return False
+        if op == '$not' and matches_ops(val, arg):
+            return False
+    return True
+
+
+class CursorMock(object):
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def __iter__(self):
+        return iter(self.docs)
+
+    def sort(self, sort):
+        self.docs = sorted(self.docs, key=lambda doc: id_key(doc['_id']))
+        return self
+
+    def limit(self, limit):
+        self.docs = self.docs[:limit]
+        return self
+
+
+class Interrupted(Exception):
+    pass
+
+
+class CheckpointTests(unittest.TestCase):
+
+    docs = [{'_id': i, 'f1': 'foo{}'.format(i), 'f2': [1, 2]} for i in range(10)]
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.output = os.path.join(self.tmp_dir, 'out.csv')
+        self.checkpoint = os.path.join(self.tmp_dir, 'out.checkpoint')
+        self.collection = MagicMock()
+        self.queries = []
+        def find(*args, **kwargs):
+            self.queries.append((args, kwargs))
+            docs = self.docs
+            if args:
+                docs = [doc for doc in docs if matches(doc, args[0])]
+            return CursorMock(docs)
+        self.collection.find.side_effect = find
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def create_instance(self, config={}):
+        config = dict(config, checkpoint=self.checkpoint, checkpoint_every=3,
+                      psql_dump='foo_table')
+        return CheckpointExport(self.collection, ['f1', 'f2'], self.output, config)
+
+    def read(self):
+        with open(self.output) as f:
+            return f.read()
+
+    def expected(self, docs):
+        return ''.join('foo{0},1\r\nfoo{0},2\r\n'.format(doc['_id']) for doc in docs)
+
+    def test_complete(self):
+        self.create_instance().run()
+        self.assertEqual(self.read(),
+                         'COPY foo_table FROM stdin WITH (FORMAT csv);\n' +
+                         self.expected(self.docs) + '\\.\n')
+        self.assertFalse(os.path.exists(self.checkpoint))
+        self.assertEqual(self.queries[0][1]['projection'], {'f1': 1, 'f2': 1, '_id': 1})
+
+    def test_resume(self):
+        export = self.create_instance()
+        original_get_rows = export._get_rows
+        def get_rows(doc):
+            if doc['_id'] == 7:
+                raise Interrupted()
+            return original_get_rows(doc)
+        export._get_rows = get_rows
+        with self.assertRaises(Interrupted):
+            export.run()
+        export._output.close()
+        checkpoint = Checkpoint.load(self.checkpoint, ['f1', 'f2'])
+        self.assertEqual((checkpoint.last_id, checkpoint.num_docs), (5, 6))
+        self.assertEqual(os.path.getsize(self.output), checkpoint.offset)
+
+        self.queries = []
+        self.create_instance().run()
+        self.assertEqual(self.queries[0][0][0]['$and'][1], {'_id': {'$ne': 5}})
+        self.assertEqual(self.read(),
+                         'COPY foo_table FROM stdin WITH (FORMAT csv);\n' +
+                         self.expected(self.docs) + '\\.\n')
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_resume_mixed_ids(self):
+        ids = [ObjectId('5a0000000000000000000001'), 3, u'b', 1,
+               ObjectId('5a0000000000000000000002'), u'a', None, True]
+        self.docs = [{'_id': _id, 'f1': 'foo{}'.format(i), 'f2': [1, 2]}
+                     for i, _id in enumerate(ids)]
+        export = self.create_instance()
+        original_get_rows = export._get_rows
+        def get_rows(doc):
+            if doc['_id'] == u'b':
+                raise Interrupted()
+            return original_get_rows(doc)
+        export._get_rows = get_rows
+        with self.assertRaises(Interrupted):
+            export.run()
+        export._output.close()
+        self.assertEqual(Checkpoint.load(self.checkpoint, ['f1', 'f2']).last_id, 3)
+
+        self.create_instance().run()
+        self.assertEqual(self.read(),
+                         'COPY foo_table FROM stdin WITH (FORMAT csv);\n' +
+                         ''.join('foo{0},1\r\nfoo{0},2\r\n'.format(i)
+                                 for i in (6, 3, 1, 5, 2, 0, 4, 7)) + '\\.\n')
+
+    def test_resume_with_limit(self):
+        checkpoint = Checkpoint(self.checkpoint, ['f1', 'f2'])
+        checkpoint.last_id, checkpoint.num_docs = 2, 3
+        checkpoint.offset = len('COPY foo_table FROM stdin WITH (FORMAT csv);\n' +
+                                self.expected(self.docs[:3]))
+        checkpoint.save()
+        with open(self.output, 'w') as f:
+            f.write('COPY foo_table FROM stdin WITH (FORMAT csv);\n' +
+                    self.expected(self.docs[:4]) + 'partial row')
+        self.create_instance({'limit': 5}).run()
+        self.assertEqual(self.read(),
+                         'COPY foo_table FROM stdin WITH (FORMAT csv);\n' +
+                         self.expected(self.docs[:5]) + '\\.\n')
+
+    def test_other_fields(self):
+        Checkpoint(self.checkpoint, ['f1']).save()
+        with self.assertRaises(ValueError):
+            self.create_instance()
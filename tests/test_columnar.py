@@ -0,0 +1,206 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from StringIO import StringIO
+from mock import MagicMock, patch
+from bson.objectid import ObjectId
+from bson.int64 import Int64
+from mongocsvexport import open_output
+from mongocsvexport.columnar import (ColumnarExport, infer_kind, coerce_values, widen_kind,
+                                     column_types)
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+class KindTests(unittest.TestCase):
+
+    def test_infer(self):
+        self.assertEqual(infer_kind([None, 1, 2L]), 'int64')
+        self.assertEqual(infer_kind([1, 2.5]), 'double')
+        self.assertEqual(infer_kind([u'a', None]), 'string')
+        self.assertEqual(infer_kind([datetime(2020, 1, 1)]), 'timestamp')
+        self.assertEqual(infer_kind([True, False]), 'bool')
+        self.assertEqual(infer_kind([1, u'a']), 'string')
+        self.assertEqual(infer_kind([None, None]), None)
+        self.assertEqual(infer_kind([2.5], 'int64'), 'double')
+        self.assertEqual(infer_kind([None], 'bool'), 'bool')
+
+    def test_widen(self):
+        self.assertEqual(widen_kind(None, 'int64'), 'int64')
+        self.assertEqual(widen_kind('double', None), 'double')
+        self.assertEqual(widen_kind('double', 'int64'), 'double')
+        self.assertEqual(widen_kind('bool', 'int64'), 'string')
+        self.assertEqual(widen_kind('timestamp', 'string'), 'string')
+
+    def test_coerce(self):
+        self.assertEqual(coerce_values([1, None, 2.5], 'double', unicode), [1.0, None, 2.5])
+        self.assertEqual(coerce_values([1, u'a', None], 'string', unicode), [u'1', u'a', None])
+        self.assertEqual(coerce_values([True, 2.0], 'int64', unicode), [1, 2])
+        # declared kinds only, values which do not fit become null
+        self.assertEqual(coerce_values([1, u'a', 2.5], 'int64', unicode), [1, None, None])
+
+    def test_column_types(self):
+        self.assertEqual(column_types('p:double, a.b:string'), {'p': 'double', 'a.b': 'string'})
+        for val in ('p', 'p:decimal', ':int64'):
+            with self.assertRaises(ValueError):
+                column_types(val)
+
+
+class WriterMock(object):
+
+    instances = []
+
+    def __init__(self, output, output_format, names, kinds, compression=None):
+        self.names = names
+        self.kinds = kinds
+        self.batches = []
+        self.closed = False
+        self.instances.append(self)
+
+    def write(self, columns):
+        self.batches.append(columns)
+
+    def close(self):
+        self.closed = True
+
+
+class ColumnarExportTests(unittest.TestCase):
+
+    oid = ObjectId('5a0000000000000000000001')
+    docs = [
+        {'n': 1, 'x': [1.5, 2], 'ts': datetime(2020, 1, 1), 'id': oid, 'tags': [u'a']},
+        {'n': Int64(2), 'x': 3, 'ts': None, 'id': oid, 'tags': [[1, 2]]},
+        {'n': 3, 'x': None, 'tags': [u'\u044f']},
+    ]
+    fields = ['n', 'x', 'ts', 'id', 'tags']
+
+    def run_export(self, config={}, docs=None):
+        collection = MagicMock()
+        collection.find.return_value = self.docs if docs is None else docs
+        del WriterMock.instances[:]
+        with patch('mongocsvexport.columnar.ColumnarWriter', WriterMock):
+            self.export = ColumnarExport(collection, self.fields, StringIO(),
+                                         dict(config, record_batch_rows=2))
+            self.export.run()
+        return WriterMock.instances[0]
+
+    def test_batches(self):
+        writer = self.run_export()
+        self.assertEqual(writer.kinds, ['int64', 'double', 'timestamp', 'string', 'string'])
+        self.assertTrue(writer.closed)
+        columns = [sum((list(batch[i]) for batch in writer.batches), [])
+                   for i in range(len(self.fields))]
+        self.assertEqual(columns[0], [1, 1, 2, 3])
+        self.assertEqual(columns[1], [1.5, 2.0, 3.0, None])
+        self.assertEqual(columns[2], [datetime(2020, 1, 1)] * 2 + [None, None])
+        self.assertEqual(columns[3], [unicode(self.oid)] * 3 + [None])
+        self.assertEqual(columns[4], [u'a', u'a', u'[1, 2]', u'\u044f'])
+
+    def test_objectid_binary(self):
+        writer = self.run_export({'objectid_binary': True})
+        self.assertEqual(writer.kinds[3], 'binary')
+        self.assertEqual(writer.batches[0][3], [self.oid.binary] * 2)
+
+    def test_empty(self):
+        writer = self.run_export(docs=[])
+        self.assertEqual(writer.kinds, ['string'] * len(self.fields))
+        self.assertEqual(writer.batches, [[[]] * len(self.fields)])
+
+    def test_stats(self):
+        with patch('sys.stderr', StringIO()):
+            self.run_export({'stats': True, 'max_fanout': 1, 'fanout_policy': 'truncate'})
+        export = self.export
+        self.assertEqual((export._stats.docs, export._stats.rows), (3, 3))
+        self.assertEqual(export._overflows, 1)
+
+    def test_output_file(self):
+        class ClosingWriter(WriterMock):
+            # like ParquetWriter, closing the writer closes the file
+            def __init__(self, output, *args):
+                WriterMock.__init__(self, output, *args)
+                self.output = output
+            def write(self, columns):
+                self.output.write('batch\n')
+            def close(self):
+                self.output.write('footer\n')
+                self.output.close()
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'out.parquet')
+            collection = MagicMock()
+            collection.find.return_value = self.docs
+            with patch('mongocsvexport.columnar.ColumnarWriter', ClosingWriter):
+                ColumnarExport(collection, self.fields, open_output(path, {}),
+                               {'record_batch_rows': 2}).run()
+            with open(path) as f:
+                self.assertEqual(f.read(), 'batch\nbatch\nfooter\n')
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_widen_later_batch(self):
+        self.fields = ['p', 'b', 'z']
+        docs = [{'p': 1, 'b': 1}, {'p': 2, 'b': True}, {'p': 2.5, 'z': 3}]
+        writer = self.run_export(docs=docs)
+        self.assertEqual(writer.kinds, ['double', 'string', 'int64'])
+        self.assertEqual(len(writer.batches), 2)
+        self.assertEqual(writer.batches[0], [[1.0, 2.0], [u'1', u'True'], [None, None]])
+        self.assertEqual(writer.batches[1], [[2.5], [None], [3]])
+
+    def test_declared_types(self):
+        self.fields = ['p', 'b']
+        docs = [{'p': 1, 'b': True}, {'p': 2.5, 'b': u'x'}]
+        writer = self.run_export({'column_types': {'p': 'int64', 'b': 'bool'}}, docs=docs)
+        self.assertEqual(writer.kinds, ['int64', 'bool'])
+        self.assertEqual(writer.batches, [[[1, None], [True, None]]])
+        with self.assertRaises(ValueError):
+            self.run_export({'column_types': {'q': 'int64'}}, docs=docs)
+
+
+@unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+class PyarrowTests(unittest.TestCase):
+
+    docs = [{'n': i, 'name': u'doc{}'.format(i), 'ts': datetime(2020, 1, i + 1)}
+            for i in range(5)]
+
+    def run_export(self, output_format):
+        collection = MagicMock()
+        collection.find.return_value = self.docs
+        output = pyarrow.BufferOutputStream()
+        ColumnarExport(collection, ['n', 'name', 'ts'], output,
+                       {'output_format': output_format, 'record_batch_rows': 2}).run()
+        return pyarrow.BufferReader(output.getvalue())
+
+    def check(self, table):
+        self.assertEqual(table.num_rows, 5)
+        self.assertEqual(table.column('n').type, pyarrow.int64())
+        self.assertEqual(table.to_pydict()['name'], [u'doc{}'.format(i) for i in range(5)])
+
+    def test_parquet(self):
+        self.check(pyarrow.parquet.read_table(self.run_export('parquet')))
+
+    def test_arrow(self):
+        self.check(pyarrow.RecordBatchFileReader(self.run_export('arrow')).read_all())
+
+    def test_output_file(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            for output_format in ('parquet', 'arrow'):
+                path = os.path.join(tmp_dir, 'out.' + output_format)
+                collection = MagicMock()
+                collection.find.return_value = self.docs
+                output = open_output(path, {})
+                ColumnarExport(collection, ['n', 'name', 'ts'], output,
+                               {'output_format': output_format, 'record_batch_rows': 2}).run()
+                output.close()
+                if output_format == 'parquet':
+                    self.check(pyarrow.parquet.read_table(path))
+                else:
+                    self.check(pyarrow.RecordBatchFileReader(pyarrow.OSFile(path)).read_all())
+        finally:
+            shutil.rmtree(tmp_dir)
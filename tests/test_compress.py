@@ -0,0 +1,61 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+from mock import MagicMock
+from mongocsvexport import MongoExport
+from mongocsvexport.compress import CompressedOutput, compression_from_path
+
+
+class CompressedOutputTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'out.csv.gz')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def read(self):
+        with gzip.open(self.path) as f:
+            return f.read()
+
+    def test_suffix(self):
+        self.assertEqual(compression_from_path('out.csv.gz'), 'gzip')
+        self.assertEqual(compression_from_path('out.csv.zst'), 'zstd')
+        self.assertEqual(compression_from_path('out.csv.lz4'), 'lz4')
+        self.assertEqual(compression_from_path('out.csv'), None)
+
+    def test_gzip(self):
+        output = CompressedOutput(open(self.path, 'wb'), 'gzip', block_size=10)
+        for i in range(100):
+            output.write('line {}\n'.format(i))
+        output.flush()
+        output.close()
+        self.assertEqual(self.read(), ''.join('line {}\n'.format(i) for i in range(100)))
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            CompressedOutput(StringIO(), 'rar')
+
+    def test_write_error(self):
+        fileobj = MagicMock()
+        fileobj.write.side_effect = IOError('No space left on device')
+        output = CompressedOutput(fileobj, 'gzip', block_size=1)
+        output.write('data')
+        with self.assertRaises(IOError):
+            output.close()
+
+    def test_psql_dump(self):
+        class MongoExportPatch(MongoExport):
+            def _doc_iter(self):
+                return iter([{'f1': 'foo1', 'f2': 'one,two'}, {'f2': 'foo2'}])
+        export = MongoExportPatch(MagicMock(), ['f1', 'f2'], self.path,
+                                  {'psql_dump': 'foo_table'})
+        export.run()
+        export._output.close()
+        self.assertEqual(self.read(),
+                         ('COPY foo_table FROM stdin WITH (FORMAT csv);\n'
+                          'foo1,"one,two"\r\n,foo2\r\n\\.\n'))
@@ -2,10 +2,18 @@
 import unittest
 from datetime import datetime
 import sys
+import gc
+import os
+import json
+import shutil
+import tempfile
+import itertools
 from mock import patch, MagicMock
 from StringIO import StringIO
 from bson.objectid import ObjectId
-from mongocsvexport import MongoExport, main
+from bson.tz_util import FixedOffset
+from mongocsvexport import (MongoExport, main, compile_fields, expand_dict,
+                            build_projection, document_rows, check_config)
 
 
 class CoreTests(unittest.TestCase):
@@ -43,6 +51,73 @@ class CoreTests(unittest.TestCase):
         self.assertEqual(self.output.getvalue(),
                          '2014-05-01 12:34:10,2014-05-01 12:00:10.345000\r\n')
 
+    def test_value_types(self):
+        class Name(unicode):
+            pass
+        export = self.create_instance(['f1', 'f2', 'f3', 'f4', 'f5', 'f6'],
+                                      [{'f1': True, 'f2': 10L ** 20, 'f3': 0.1,
+                                        'f4': ObjectId('524a118c1bf33d08f28c5391'),
+                                        'f5': Name(u'\u0441'), 'f6': 7}])
+        export.run()
+        self.assertEqual(self.output.getvalue(),
+                         'True,100000000000000000000,0.1,524a118c1bf33d08f28c5391,'
+                         '\xd1\x81,7\r\n')
+
+    def test_serialize_cache(self):
+        export = self.create_instance(['f1', 'f2'],
+                                      [{'f1': u'ok', 'f2': 1}, {'f1': u'ok', 'f2': 2},
+                                       {'f1': u'failed', 'f2': 3}],
+                                      {'serialize_cache': 10})
+        stderr = StringIO()
+        with patch('sys.stderr', stderr):
+            export.run()
+        self.assertEqual(self.output.getvalue(), 'ok,1\r\nok,2\r\nfailed,3\r\n')
+        self.assertEqual((export._cache.hits, export._cache.misses), (1, 2))
+        self.assertTrue('1 hits, 2 misses' in stderr.getvalue())
+
+    def test_serialize_cache_timezones(self):
+        utc = datetime(2020, 1, 1, 12, tzinfo=FixedOffset(0, 'UTC'))
+        msk = utc.astimezone(FixedOffset(180, 'MSK'))
+        export = self.create_instance(['d'], [{'d': utc}, {'d': msk}, {'d': datetime(2020, 1, 1)},
+                                              {'d': datetime(2020, 1, 1)}],
+                                      {'serialize_cache': 10})
+        with patch('sys.stderr', StringIO()):
+            export.run()
+        self.assertEqual(self.output.getvalue(),
+                         '2020-01-01 12:00:00+00:00\r\n2020-01-01 15:00:00+03:00\r\n'
+                         '2020-01-01 00:00:00\r\n2020-01-01 00:00:00\r\n')
+        self.assertEqual((export._cache.hits, export._cache.misses), (1, 1))
+
+    def test_chunked_write(self):
+        docs = [{'f1': i, 'f2': [1, 2]} for i in range(5)]
+        export = self.create_instance(['f1', 'f2'], docs, {'chunk_rows': 3})
+        writer = export._writer
+        export._writer = MagicMock(wraps=writer)
+        export.run()
+        self.assertEqual([len(call[0][0]) for call in export._writer.writerows.call_args_list],
+                         [3, 3, 3, 1])
+        self.assertEqual(self.output.getvalue(),
+                         ''.join('{0},1\r\n{0},2\r\n'.format(i) for i in range(5)))
+
+    def test_rows_memory_bound(self):
+        # 90000 rows of one document are never held in memory at once
+        docs = [{'a': range(300), 'b': range(300)}]
+        export = self.create_instance(['a', 'b'], docs, {'chunk_rows': 1000, 'stats': True})
+        writer = export._writer
+        num_objects = []
+        class WriterProxy(object):
+            def writerows(self, rows):
+                num_objects.append(len(gc.get_objects()))
+                writer.writerows(rows)
+        export._writer = WriterProxy()
+        gc.collect()
+        base = len(gc.get_objects())
+        export.run()
+        self.assertEqual(len(num_objects), 90)
+        self.assertTrue(max(num_objects) - base < 10000)
+        self.assertEqual((export._stats.docs, export._stats.rows), (1, 90000))
+        self.assertEqual(self.output.getvalue().count('\n'), 90000)
+
     def test_field_traverse(self):
         export = self.create_instance(['f1','f2.sub'],
                                       [{'f1':'foo1', 'f2': {'sub': 'foo2'}}], {})
@@ -95,6 +170,14 @@ class CoreTests(unittest.TestCase):
         self.assertEqual(self.output.getvalue(),
                          'Hilton,Standard,1000,100\r\nHilton,Deluxe,1000,120\r\n')
 
+    def test_absent_sub_document(self):
+        export = self.create_instance(['f1', 'f2.sub', 'f3'],
+                                      [{'f1': 'foo1', 'f3': 'foo3'},
+                                       {'f1': 'foo1', 'f2': 'scalar', 'f3': 'foo3'}])
+        export.run()
+        self.assertEqual(self.output.getvalue(),
+                         'foo1,,foo3\r\nfoo1,,foo3\r\n')
+
     def test_custom_null(self):
         export = self.create_instance(['f1','f2'],
                                       [{'f1':'foo1', 'f2': None},{'f2':'foo2'}],
@@ -132,6 +215,139 @@ class CoreTests(unittest.TestCase):
                          ('COPY foo_table FROM stdin WITH (FORMAT csv);\n'
                           'foo1,"one,two"\r\n,foo2\r\n\.\n'))
 
+    def test_fanout_truncate(self):
+        export = self.create_instance(['f1', 'f2'],
+                                      [{'f1': 'a', 'f2': [1, 2, 3]}, {'f1': 'b', 'f2': [1]}],
+                                      {'max_fanout': 2})
+        with patch('sys.stderr', StringIO()) as stderr:
+            export.run()
+        self.assertEqual(self.output.getvalue(), 'a,1\r\na,2\r\nb,1\r\n')
+        self.assertTrue('1 documents with more than 2 rows truncated' in stderr.getvalue())
+
+    def test_fanout_skip(self):
+        export = self.create_instance(['f1', 'f2'],
+                                      [{'f1': 'a', 'f2': [1, 2, 3]}, {'f1': 'b', 'f2': [1]}],
+                                      {'max_fanout': 2, 'fanout_policy': 'skip'})
+        with patch('sys.stderr', StringIO()):
+            export.run()
+        self.assertEqual(self.output.getvalue(), 'b,1\r\n')
+
+    def test_fanout_reject(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            reject_file = os.path.join(tmp_dir, 'rejected.json')
+            export = self.create_instance(['f1', 'f2'],
+                                          [{'f1': 'a', 'f2': [1, 2, 3]}, {'f1': 'b', 'f2': [1]}],
+                                          {'max_fanout': 2, 'fanout_policy': 'reject',
+                                           'reject_file': reject_file})
+            with patch('sys.stderr', StringIO()):
+                export.run()
+            self.assertEqual(self.output.getvalue(), 'b,1\r\n')
+            with open(reject_file) as f:
+                self.assertEqual([json.loads(line) for line in f],
+                                 [{'f1': 'a', 'f2': [1, 2, 3]}])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_fanout_reject_file_required(self):
+        with self.assertRaises(ValueError):
+            self.create_instance(['f1'], [], {'max_fanout': 2, 'fanout_policy': 'reject'})
+
+
+class FieldsPlanTests(unittest.TestCase):
+
+    def test_column_order(self):
+        plan = compile_fields([('f2', 'sub'), ('f1',), ('f2', 'sub2')])
+        self.assertEqual(plan.width, 3)
+        rows = list(expand_dict({'f1': 'foo1', 'f2': {'sub': 'one', 'sub2': 'two'}}, plan))
+        self.assertEqual(rows, [['one', 'foo1', 'two']])
+
+    def test_compile(self):
+        plan = compile_fields([('f1',), ('f2', 'sub'), ('f2', 'sub2')])
+        self.assertEqual(list(plan.children), ['f1', 'f2'])
+        self.assertEqual(plan.children['f1'].index, 0)
+        self.assertFalse(plan.children['f2'].is_leaf)
+        self.assertEqual(list(plan.children['f2'].children), ['sub', 'sub2'])
+        self.assertEqual(plan.children['f2'].children['sub2'].index, 2)
+        self.assertEqual(plan.children['f2'].children['sub2'].path, ('f2', 'sub2'))
+
+    def test_expand_with_plan(self):
+        plan = compile_fields([('f1',), ('f2', 'sub')])
+        rows = list(expand_dict({'f1': 'foo1', 'f3': 'skip',
+                                 'f2': [{'sub': 'one'}, {'sub': 'two'}]}, plan))
+        self.assertEqual(rows, [['foo1', 'one'], ['foo1', 'two']])
+
+    def test_compile_columns(self):
+        plan = compile_fields([('f1',), ('f2', 'sub'), ('f3',), ('f2', 'sub2', 'x')])
+        self.assertEqual(plan.columns, (0, 1, 2, 3))
+        self.assertEqual(plan.children['f2'].columns, (1, 3))
+
+    def test_sibling_lists_product(self):
+        plan = compile_fields([('a', 'x'), ('b',), ('c',)])
+        rows = list(expand_dict({'a': [{'x': 1}, {}], 'b': [1, 2], 'c': 's'}, plan))
+        self.assertEqual(rows, [[1, 1, 's'], [1, 2, 's'], [None, 1, 's'], [None, 2, 's']])
+
+    def test_empty_list(self):
+        plan = compile_fields([('a',), ('b',)])
+        self.assertEqual(list(expand_dict({'a': 1, 'b': []}, plan)), [])
+
+    def test_lazy_nested_product(self):
+        # 10^8 rows of nested sibling lists are neither built nor kept
+        plan = compile_fields([('a', 'x'), ('a', 'y')])
+        doc = {'a': [{'x': range(10000), 'y': range(10000)}, {'x': 'last', 'y': 'row'}]}
+        rows = document_rows(doc, plan)
+        self.assertEqual(rows.count, 10 ** 8 + 1)
+        self.assertEqual(list(itertools.islice(rows, 3)), [[0, 0], [0, 1], [0, 2]])
+        self.assertEqual(list(rows.rows(2)), [[0, 0], [0, 1]])
+        doc['a'] = [{'x': range(3), 'y': range(100)}] * 3 + [{'x': 'last', 'y': 'row'}]
+        self.assertEqual(list(expand_dict(doc, plan)),
+                         [[x, y] for x in range(3) for y in range(100)] * 3 + [['last', 'row']])
+
+    def test_serialize_once(self):
+        calls = []
+        def serialize(val):
+            calls.append(val)
+            return val
+        plan = compile_fields([('a',), ('b', 'x'), ('b', 'y', 'z')])
+        doc = {'a': 'parent', 'b': [{'x': 'dep', 'y': [{'z': i} for i in range(3)]}]}
+        rows = list(expand_dict(doc, plan, serialize))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(calls.count('parent'), 1)
+        self.assertEqual(calls.count('dep'), 1)
+
+    def test_expand_with_fields_list(self):
+        rows = list(expand_dict({'f1': 'foo1'}, [('f1',), ('f2',)]))
+        self.assertEqual(rows, [['foo1', None]])
+
+
+class ProjectionTests(unittest.TestCase):
+
+    def test_top_level(self):
+        projection = build_projection([('f1',), ('f2', 'sub'), ('f2', 'sub2', 'x')])
+        self.assertEqual(projection, {'f1': 1, 'f2': 1, '_id': 0})
+
+    def test_depth(self):
+        projection = build_projection([('f1',), ('f2', 'sub'), ('f2', 'sub2', 'x')], 2)
+        self.assertEqual(projection, {'f1': 1, 'f2.sub': 1, 'f2.sub2': 1, '_id': 0})
+
+    def test_path_collision(self):
+        projection = build_projection([('f2', 'sub', 'x'), ('f2',), ('f2', 'sub')], 3)
+        self.assertEqual(projection, {'f2': 1, '_id': 0})
+
+    def test_id_requested(self):
+        projection = build_projection([('_id',), ('f1',)])
+        self.assertEqual(projection, {'_id': 1, 'f1': 1})
+
+
+class CheckConfigTests(unittest.TestCase):
+
+    def test_parallel_one(self):
+        for config in ({'checkpoint': 'out.checkpoint'}, {'incremental': 'ts', 'state': 's'},
+                       {'max_rows': 10}, {'output_format': 'parquet'}):
+            check_config(dict(config, parallel=1), 'out-%03d.csv')
+            with self.assertRaises(ValueError):
+                check_config(dict(config, parallel=2), 'out-%03d.csv')
+
 
 class CreateTest(unittest.TestCase):
     """MongoExport.create constructor test"""
@@ -156,12 +372,18 @@ class MongoInteropTests(unittest.TestCase):
 
         def __init__(self, docs):
             self.docs = docs
+            self.batch = None
 
         def __iter__(self):
             return iter(self.docs)
 
-        def count(self, *args, **kwargs):
-            return len(self.docs)
+        def limit(self, limit):
+            self.docs = self.docs[:limit]
+            return self
+
+        def batch_size(self, batch_size):
+            self.batch = batch_size
+            return self
 
     def setUp(self):
         self.collection = MagicMock()
@@ -188,6 +410,18 @@ class MongoInteropTests(unittest.TestCase):
         self.assertEqual(len(result),1)
         self.assertEqual(result, [{'f1':'foo1'}])
 
+    def test_no_count(self):
+        export = self.create_instance([{'f1':'foo1'},{'f1':'foo2'}])
+        list(export._doc_iter())
+        self.assertFalse(self.collection.count_documents.called)
+
+    def test_cursor_options(self):
+        export = self.create_instance([{'f1':'foo1'}],
+                                      {'batch_size': 5000, 'no_cursor_timeout': True})
+        list(export._doc_iter())
+        self.assertEqual(self.collection.find.return_value.batch, 5000)
+        self.assertTrue(self.collection.find.call_args[1]['no_cursor_timeout'])
+
     def test_cond(self):
         export = self.create_instance([{'f1':'foo1'},{'f1':'foo2'}],
                                       {'query_cond': {'ts': {
@@ -201,17 +435,44 @@ class MongoInteropTests(unittest.TestCase):
                           'state': 'success'}
                          )
 
+    def test_projection(self):
+        self.collection.find.return_value = self.CursorMock([])
+        export = MongoExport(self.collection, ['f1', 'f2.sub'], MagicMock(), {})
+        list(export._doc_iter())
+        self.assertEqual(self.collection.find.call_args[1]['projection'],
+                         {'f1': 1, 'f2': 1, '_id': 0})
+
+    def test_no_projection(self):
+        export = self.create_instance([{'f1':'foo1'}], {'projection': False})
+        list(export._doc_iter())
+        self.assertFalse('projection' in self.collection.find.call_args[1])
+
     def test_show_progress(self):
+        self.collection.count_documents.return_value = 2
         with patch('tqdm.tqdm') as tqdm_mock:
             export = self.create_instance([{'f1':'foo1'},{'f1':'foo2'}],
-                                          {'show_progress': True})
+                                          {'show_progress': True,
+                                           'query_cond': {'state': 'success'}})
             tqdm_mock.return_value = [{'f1':'foo1', 'f2': 'one,twooo'},{'f2':'foo2'}]
             export.run()
         self.assertEqual(len(tqdm_mock.call_args_list), 1)
         self.assertTrue(isinstance(tqdm_mock.call_args[0][0], self.CursorMock))
         self.assertEqual(tqdm_mock.call_args[1].get('total'), 2)
+        self.collection.count_documents.assert_called_once_with({'state': 'success'})
+
+    def test_show_progress_estimated_count(self):
+        self.collection.estimated_document_count.return_value = 1000
+        with patch('tqdm.tqdm') as tqdm_mock:
+            export = self.create_instance([{'f1':'foo1'},{'f1':'foo2'}],
+                                          {'show_progress': True,
+                                           'estimated_count': True})
+            tqdm_mock.return_value = []
+            export.run()
+        self.assertEqual(tqdm_mock.call_args[1].get('total'), 1000)
+        self.assertFalse(self.collection.count_documents.called)
 
     def test_show_progress_with_limit(self):
+        self.collection.count_documents.return_value = 1
         with patch('tqdm.tqdm') as tqdm_mock:
             export = self.create_instance([{'f1':'foo1'},{'f1':'foo2'}],
                                           {'show_progress': True,
@@ -221,6 +482,7 @@ class MongoInteropTests(unittest.TestCase):
         self.assertEqual(len(tqdm_mock.call_args_list), 1)
         self.assertTrue(isinstance(tqdm_mock.call_args[0][0], self.CursorMock))
         self.assertEqual(tqdm_mock.call_args[1].get('total'), 1)
+        self.collection.count_documents.assert_called_once_with({}, limit=1)
 
 
 class CmdRunTests(unittest.TestCase):
@@ -284,6 +546,33 @@ class CmdRunTests(unittest.TestCase):
             args = self._run_main()
         self.assertEqual(open_mock.call_args[0][0], '/tmp/data.csv')
 
+    @patch('sys.argv', required_args + ['-o', '/tmp/data.csv', '--buffer-size', '65536',
+                                        '--chunk-rows', '500'])
+    def test_buffer_size(self):
+        with patch('__builtin__.open') as open_mock:
+            args = self._run_main()
+        self.assertEqual(open_mock.call_args[0], ('/tmp/data.csv', 'w', 65536))
+        self.assertEqual(args[4], {'buffer_size': 65536, 'chunk_rows': 500})
+
+    @patch('sys.argv', required_args + ['-o', '/tmp/data.csv', '--compress', 'gzip',
+                                        '--compress-level', '1'])
+    def test_compress(self):
+        with patch('__builtin__.open') as open_mock:
+            with patch('mongocsvexport.CompressedOutput') as compressed_mock:
+                args = self._run_main()
+        self.assertEqual(open_mock.call_args[0][0], '/tmp/data.csv')
+        self.assertEqual(compressed_mock.call_args[0],
+                         (open_mock.return_value, 'gzip', 1))
+        self.assertEqual(args[3], compressed_mock.return_value)
+        self.assertTrue(compressed_mock.return_value.close.called)
+
+    @patch('sys.argv', required_args + ['-o', '/tmp/data.csv.gz'])
+    def test_compress_by_suffix(self):
+        with patch('__builtin__.open') as open_mock:
+            with patch('mongocsvexport.CompressedOutput') as compressed_mock:
+                args = self._run_main()
+        self.assertEqual(compressed_mock.call_args[0][1], 'gzip')
+
     @patch('sys.argv', required_args + ['--host', 'localhost:27034'])
     def test_host(self):
         args = self._run_main()
@@ -327,6 +616,129 @@ class CmdRunTests(unittest.TestCase):
         args = self._run_main()
         self.assertEqual(args[4], {'psql_dump': 'foo_table'})
 
+    @patch('sys.argv', required_args + ['--estimated-count', '--batch-size', '1000',
+                                        '--no-cursor-timeout'])
+    def test_cursor_options(self):
+        args = self._run_main()
+        self.assertEqual(args[4], {'estimated_count': True, 'batch_size': 1000,
+                                   'no_cursor_timeout': True})
+
+    @patch('sys.argv', required_args + ['--lazy-decode'])
+    def test_lazy_decode(self):
+        args = self._run_main()
+        self.assertEqual(args[4], {'lazy_decode': True})
+
+    @patch('sys.argv', required_args + ['--serialize-cache', '10000'])
+    def test_serialize_cache(self):
+        args = self._run_main()
+        self.assertEqual(args[4], {'serialize_cache': 10000})
+
+    @patch('sys.argv', required_args + ['--no-projection'])
+    def test_no_projection(self):
+        args = self._run_main()
+        self.assertEqual(args[4], {'projection': False})
+
+    @patch('sys.argv', required_args + ['--projection-depth', '2'])
+    def test_projection_depth(self):
+        args = self._run_main()
+        self.assertEqual(args[4], {'projection_depth': 2})
+
+    @patch('sys.argv', required_args + ['--sort', 'ts:-1, _id', '--hint', 'ts:-1,_id:1'])
+    def test_sort_hint(self):
+        args = self._run_main()
+        self.assertEqual(args[4], {'sort': [('ts', -1), ('_id', 1)],
+                                   'hint': [('ts', -1), ('_id', 1)]})
+
+    @patch('sys.argv', required_args + ['--hint', 'ts,_id'])
+    def test_hint_fields(self):
+        args = self._run_main()
+        self.assertEqual(args[4], {'hint': [('ts', 1), ('_id', 1)]})
+
+    @patch('sys.argv', required_args + ['--hint', 'ts_1', '--read-preference', 'secondary'])
+    def test_hint_name_read_preference(self):
+        args = self._run_main()
+        self.assertEqual(args[4], {'hint': 'ts_1', 'mongo_readPreference': 'secondary'})
+
+    @patch('sys.argv', required_args + ['--sort', 'ts:2'])
+    def test_bad_sort(self):
+        stderr = StringIO()
+        with patch('sys.stderr', stderr):
+            with self.assertRaises(SystemExit):
+                main()
+        self.assertTrue("argument --sort: invalid key_spec value: 'ts:2'" in stderr.getvalue())
+
+    @patch('sys.argv', required_args + ['--sort', 'ts', '--incremental', 'ts',
+                                        '--state', 'state.json'])
+    def test_sort_with_incremental(self):
+        stderr = StringIO()
+        with patch('sys.stderr', stderr):
+            with self.assertRaises(SystemExit):
+                main()
+        self.assertTrue('--incremental can not be used with --sort' in stderr.getvalue())
+
+    @patch('sys.argv', required_args + ['--parallel', '4', '--unordered'])
+    def test_parallel(self):
+        with patch('mongocsvexport.parallel.ParallelExport.create') as create_mock:
+            main()
+        self.assertEqual(create_mock.call_args[0][4], {'parallel': 4, 'ordered': False})
+        self.assertEqual(len(create_mock.return_value.run.call_args_list), 1)
+
+    @patch('sys.argv', required_args + ['--pipeline', '--fetch-queue', '2',
+                                        '--write-queue', '3', '--raw-batches'])
+    def test_pipeline(self):
+        with patch('mongocsvexport.pipeline.PipelineExport.create') as create_mock:
+            main()
+        self.assertEqual(create_mock.call_args[0][4],
+                         {'pipeline': True, 'fetch_queue': 2, 'write_queue': 3,
+                          'raw_batches': True})
+
+    @patch('sys.argv', required_args + ['--pipeline', '--parallel', '2'])
+    def test_pipeline_with_parallel(self):
+        stderr = StringIO()
+        with patch('sys.stderr', stderr):
+            with self.assertRaises(SystemExit):
+                main()
+        self.assertTrue('--pipeline can not be used with --parallel' in stderr.getvalue())
+
+    @patch('sys.argv', required_args + ['-o', '/tmp/data.csv', '--checkpoint', '/tmp/data.ckpt',
+                                        '--checkpoint-every', '100'])
+    def test_checkpoint(self):
+        with patch('mongocsvexport.checkpoint.CheckpointExport.create') as create_mock:
+            main()
+        self.assertEqual(create_mock.call_args[0][3], '/tmp/data.csv')
+        self.assertEqual(create_mock.call_args[0][4],
+                         {'checkpoint': '/tmp/data.ckpt', 'checkpoint_every': 100})
+
+    @patch('sys.argv', required_args + ['-o', '/tmp/data.csv.gz', '--checkpoint', '/tmp/data.ckpt'])
+    def test_checkpoint_compressed(self):
+        stderr = StringIO()
+        with patch('sys.stderr', stderr):
+            with self.assertRaises(SystemExit):
+                main()
+        self.assertTrue('can not be used with --checkpoint' in stderr.getvalue())
+
+    @patch('sys.argv', required_args + ['-o', '/tmp/data-{run}.csv', '--incremental', 'ts',
+                                        '--state', '/tmp/mongocsvexport-test-state.json',
+                                        '--append'])
+    def test_incremental(self):
+        with patch('mongocsvexport.incremental.IncrementalExport.create') as create_mock:
+            with patch('__builtin__.open') as open_mock:
+                main()
+        # the export opens the output of the run
+        self.assertFalse(open_mock.called)
+        self.assertEqual(create_mock.call_args[0][3], '/tmp/data-{run}.csv')
+        self.assertEqual(create_mock.call_args[0][4],
+                         {'incremental': 'ts', 'state': '/tmp/mongocsvexport-test-state.json',
+                          'append': True})
+
+    @patch('sys.argv', required_args + ['--incremental', 'ts'])
+    def test_incremental_without_state(self):
+        stderr = StringIO()
+        with patch('sys.stderr', stderr):
+            with self.assertRaises(SystemExit):
+                main()
+        self.assertTrue('You must use the --state option' in stderr.getvalue())
+
     @patch('sys.argv', required_args + ['-p'])
     def test_progress_without_output(self):
         stderr = StringIO()
@@ -0,0 +1,135 @@
+import unittest
+from StringIO import StringIO
+from mock import patch, MagicMock
+from bson.son import SON
+from mongocsvexport import MongoExport, main
+from mongocsvexport.explain import explain, find_command, plan_stages, report_lines
+
+
+INDEX_PLAN = {
+    'stage': 'PROJECTION',
+    'inputStage': {
+        'stage': 'FETCH',
+        'inputStage': {'stage': 'IXSCAN', 'indexName': 'ts_1', 'keyPattern': {'ts': 1}},
+    },
+}
+
+SHARDED_PLAN = {
+    'stage': 'SHARD_MERGE',
+    'shards': [
+        {'shardName': 's1', 'winningPlan': {'stage': 'COLLSCAN'}},
+        {'shardName': 's2', 'winningPlan': {
+            'stage': 'SORT', 'inputStage': {
+                'stage': 'OR', 'inputStages': [
+                    {'stage': 'IXSCAN', 'indexName': 'a_1'},
+                    {'stage': 'IXSCAN', 'indexName': 'b_1'}]}}},
+    ],
+}
+
+# slot based execution engine wraps the plan with queryPlan
+SBE_PLAN = {
+    'queryPlan': INDEX_PLAN,
+    'slotBasedPlan': {'slots': '$$RESULT=s7', 'stages': '[2] nlj inner [] [s2]'},
+}
+
+SBE_SHARDED_PLAN = {
+    'stage': 'SHARD_MERGE',
+    'shards': [
+        {'shardName': 's1', 'winningPlan': {
+            'queryPlan': {'stage': 'COLLSCAN'}, 'slotBasedPlan': {}}},
+        {'shardName': 's2', 'winningPlan': SBE_PLAN},
+    ],
+}
+
+
+class ExplainTests(unittest.TestCase):
+
+    def create_export(self, plan, config={}):
+        collection = MagicMock()
+        collection.name = 'coll'
+        collection.full_name = 'db.coll'
+        def command(cmd, *args, **kwargs):
+            if cmd == 'collStats':
+                return {'count': 1000, 'avgObjSize': 2000, 'size': 2000000}
+            return {'queryPlanner': {'namespace': 'db.coll', 'winningPlan': plan,
+                                     'rejectedPlans': [{}]}}
+        collection.database.command.side_effect = command
+        return MongoExport(collection, ['f1.sub', 'ts'], StringIO(), config)
+
+    def test_find_command(self):
+        export = self.create_export(INDEX_PLAN, {'query_cond': {'ts': {'$gt': 1}},
+                                                 'sort': [('ts', -1), ('_id', 1)],
+                                                 'hint': [('ts', -1)], 'limit': 10})
+        command = find_command(export)
+        self.assertEqual(command.items(), [
+            ('find', 'coll'), ('filter', {'ts': {'$gt': 1}}),
+            ('projection', {'f1': 1, 'ts': 1, '_id': 0}),
+            ('sort', SON([('ts', -1), ('_id', 1)])), ('hint', SON([('ts', -1)])),
+            ('limit', 10)])
+        export.config['hint'] = 'ts_1'
+        export.config['projection'] = False
+        command = find_command(export)
+        self.assertEqual(command['hint'], 'ts_1')
+        self.assertFalse('projection' in command)
+
+    def test_plan_stages(self):
+        self.assertEqual(plan_stages(INDEX_PLAN),
+                         [('PROJECTION', None), ('FETCH', None), ('IXSCAN', 'ts_1')])
+        self.assertEqual(plan_stages(SHARDED_PLAN),
+                         [('SHARD_MERGE', None), ('COLLSCAN', None), ('SORT', None),
+                          ('OR', None), ('IXSCAN', 'a_1'), ('IXSCAN', 'b_1')])
+        self.assertEqual(plan_stages(SBE_PLAN), plan_stages(INDEX_PLAN))
+        self.assertEqual(plan_stages(SBE_SHARDED_PLAN),
+                         [('SHARD_MERGE', None), ('COLLSCAN', None), ('PROJECTION', None),
+                          ('FETCH', None), ('IXSCAN', 'ts_1')])
+
+    def test_sbe_plan(self):
+        report = explain(self.create_export(SBE_PLAN))
+        self.assertEqual(report['stages'], ['PROJECTION', 'FETCH', 'IXSCAN'])
+        self.assertEqual(report['indexes'], ['ts_1'])
+
+    def test_index_scan(self):
+        export = self.create_export(INDEX_PLAN, {'query_cond': {'ts': {'$gt': 1}}})
+        report = explain(export)
+        self.assertEqual(report['stages'], ['PROJECTION', 'FETCH', 'IXSCAN'])
+        self.assertEqual(report['indexes'], ['ts_1'])
+        self.assertFalse(report['collection_scan'])
+        self.assertEqual(report['rejected_plans'], 1)
+        self.assertEqual((report['scan_docs'], report['scan_bytes']), (1000, 2000000))
+        args, kwargs = export.collection.database.command.call_args_list[0]
+        self.assertEqual(args[0]['verbosity'], 'queryPlanner')
+        self.assertEqual(args[0]['explain']['find'], 'coll')
+        self.assertEqual(kwargs, {'read_preference': export.collection.read_preference})
+        lines = report_lines(report)
+        self.assertTrue('Winning plan: PROJECTION <- FETCH <- IXSCAN' in lines)
+        self.assertTrue('Scanned by index: at most 1000 docs, 2.0 MB' in lines)
+
+    def test_collection_scan(self):
+        export = self.create_export(SHARDED_PLAN, {'limit': 10})
+        report = explain(export)
+        self.assertTrue(report['collection_scan'])
+        self.assertTrue(report['in_memory_sort'])
+        self.assertEqual(report['indexes'], ['a_1', 'b_1'])
+        # sorted in memory, the limit does not stop the scan
+        self.assertEqual(report['scan_docs'], 1000)
+        lines = report_lines(report)
+        self.assertTrue('Full collection scan: 1000 docs, 2.0 MB' in lines)
+        self.assertTrue(lines[-1].startswith('Warning: sort'))
+
+    def test_limit(self):
+        report = explain(self.create_export({'stage': 'COLLSCAN'}, {'limit': 10}))
+        self.assertEqual((report['scan_docs'], report['scan_bytes']), (10, 20000))
+
+    @patch('sys.argv', ['mongocsvexport', '-d', 'testdb', '-c', 'testcoll', '-f', 'ts',
+                        '--explain', '--read-preference', 'secondary', '-o', 'unused.csv'])
+    def test_main(self):
+        stdout = StringIO()
+        with patch('mongocsvexport.MongoExport.create') as create_mock:
+            create_mock.return_value = self.create_export(INDEX_PLAN)
+            with patch('sys.stdout', stdout):
+                main()
+        args = create_mock.call_args[0]
+        self.assertEqual(args[:4], ('testdb', 'testcoll', ['ts'], stdout))
+        self.assertEqual(args[4], {'mongo_readPreference': 'secondary'})
+        self.assertTrue('Indexes: ts_1\n' in stdout.getvalue())
+        self.assertFalse(create_mock.return_value.collection.find.called)
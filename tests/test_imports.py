@@ -0,0 +1,70 @@
+import os
+import sys
+import json
+import unittest
+import subprocess
+
+
+# modules which must not be loaded by the package import or by --help
+HEAVY_MODULES = ('pymongo', 'bson', 'tqdm', 'mongocsvexport.stats',
+                 'mongocsvexport.rawbson', 'mongocsvexport.statefile')
+
+# seconds, by default the import of the driver alone measured on the same
+# machine: the package takes about 10ms without the driver and 60ms with it
+IMPORT_BUDGET = os.environ.get('MONGOCSVEXPORT_IMPORT_BUDGET')
+
+REPORT = '''
+import sys, json
+sys.stdout.write('\\n' + json.dumps(sorted(m for m in sys.modules if sys.modules[m])) + '\\n')
+'''
+
+
+def run_python(code):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return subprocess.check_output([sys.executable, '-c', code], cwd=root)
+
+def import_seconds(module):
+    """Best of several fresh interpreter imports, the first ones may hit
+    cold disk cache"""
+    code = ('import time\n'
+            'start = time.time()\n'
+            'import {}\n'
+            'print(time.time() - start)').format(module)
+    return min(float(run_python(code)) for _ in range(5))
+
+def loaded_modules(code):
+    output = run_python(code + REPORT)
+    return set(json.loads(output.splitlines()[-1]))
+
+
+class ImportTests(unittest.TestCase):
+
+    def assertNotLoaded(self, modules):
+        self.assertEqual([name for name in HEAVY_MODULES if name in modules], [])
+
+    def test_package(self):
+        modules = loaded_modules('import mongocsvexport')
+        self.assertNotLoaded(modules)
+        self.assertFalse('argparse' in modules)
+
+    def test_expand(self):
+        modules = loaded_modules('from mongocsvexport import expand_dict\n'
+                                 'assert list(expand_dict({"a": [1, 2]}, [("a",)])) == [[1], [2]]')
+        self.assertNotLoaded(modules)
+
+    def test_help(self):
+        modules = loaded_modules('import sys\n'
+                                 'sys.argv = ["mongocsvexport", "--help"]\n'
+                                 'from mongocsvexport import main\n'
+                                 'try:\n'
+                                 '    main()\n'
+                                 'except SystemExit:\n'
+                                 '    pass')
+        self.assertNotLoaded(modules)
+
+    def test_import_time(self):
+        if IMPORT_BUDGET:
+            budget = float(IMPORT_BUDGET)
+        else:
+            budget = import_seconds('pymongo')
+        self.assertLess(import_seconds('mongocsvexport'), budget)
@@ -0,0 +1,126 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from StringIO import StringIO
+from mock import MagicMock
+from mongocsvexport.incremental import IncrementalExport, IncrementalState
+
+
+class CursorMock(object):
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.hinted = None
+
+    def __iter__(self):
+        return iter(self.docs)
+
+    def sort(self, sort):
+        self.docs = sorted(self.docs, key=lambda doc: doc['meta']['ts'])
+        return self
+
+    def limit(self, limit):
+        self.docs = self.docs[:limit]
+        return self
+
+    def hint(self, hint):
+        self.hinted = hint
+        return self
+
+
+class IncrementalTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.state = os.path.join(self.tmp_dir, 'state.json')
+        self.docs = [{'f1': 'foo{}'.format(i), 'meta': {'ts': datetime(2014, 5, i + 1)}}
+                     for i in (2, 0, 1)]
+        self.collection = MagicMock()
+        self.queries = []
+        self.cursors = []
+        def find(*args, **kwargs):
+            self.queries.append((args, kwargs))
+            docs = self.docs
+            if args:
+                mark = args[0]['meta.ts']['$gt']
+                docs = [doc for doc in docs if doc['meta']['ts'] > mark]
+            self.cursors.append(CursorMock(docs))
+            return self.cursors[-1]
+        self.collection.find.side_effect = find
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def run_export(self, config={}):
+        output = StringIO()
+        config = dict(config, incremental='meta.ts', state=self.state)
+        IncrementalExport(self.collection, ['f1'], output, config).run()
+        return output.getvalue()
+
+    def test_runs(self):
+        self.assertEqual(self.run_export(), 'foo2\r\nfoo0\r\nfoo1\r\n')
+        state = IncrementalState.load(self.state, 'meta.ts')
+        self.assertEqual((state.mark, state.run), (datetime(2014, 5, 3), 1))
+        self.assertEqual(self.queries[0][1]['projection'], {'f1': 1, 'meta': 1, '_id': 0})
+
+        self.docs.append({'f1': 'foo3', 'meta': {'ts': datetime(2014, 5, 4)}})
+        self.assertEqual(self.run_export({'incremental_hint': True}), 'foo3\r\n')
+        self.assertEqual(self.queries[1][0][0], {'meta.ts': {'$gt': datetime(2014, 5, 3)}})
+        self.assertEqual(self.cursors[1].hinted, [('meta.ts', 1)])
+        state = IncrementalState.load(self.state, 'meta.ts')
+        self.assertEqual((state.mark, state.run), (datetime(2014, 5, 4), 2))
+
+    def test_no_new_documents(self):
+        self.run_export()
+        self.assertEqual(self.run_export(), '')
+        state = IncrementalState.load(self.state, 'meta.ts')
+        self.assertEqual((state.mark, state.run), (datetime(2014, 5, 3), 2))
+
+    def test_limit(self):
+        self.assertEqual(self.run_export({'limit': 2}), 'foo0\r\nfoo1\r\n')
+        self.assertEqual(IncrementalState.load(self.state, 'meta.ts').mark,
+                         datetime(2014, 5, 2))
+
+    def test_failed_run(self):
+        self.collection.find.side_effect = RuntimeError('connection lost')
+        with self.assertRaises(RuntimeError):
+            self.run_export()
+        self.assertFalse(os.path.exists(self.state))
+
+    def run_file_export(self, pattern, config={}):
+        config = dict(config, incremental='meta.ts', state=self.state, header=True)
+        IncrementalExport(self.collection, ['f1'], os.path.join(self.tmp_dir, pattern),
+                          config).run()
+
+    def read(self, name):
+        with open(os.path.join(self.tmp_dir, name)) as f:
+            return f.read()
+
+    def test_append_header(self):
+        self.run_file_export('out.csv', {'append': True})
+        self.assertEqual(self.read('out.csv'), 'f1\r\nfoo2\r\nfoo0\r\nfoo1\r\n')
+        self.docs.append({'f1': 'foo3', 'meta': {'ts': datetime(2014, 5, 4)}})
+        self.run_file_export('out.csv', {'append': True})
+        self.assertEqual(self.read('out.csv'), 'f1\r\nfoo2\r\nfoo0\r\nfoo1\r\nfoo3\r\n')
+
+    def test_run_files(self):
+        self.run_file_export('out-{run}.csv', {'append': True})
+        self.docs.append({'f1': 'foo3', 'meta': {'ts': datetime(2014, 5, 4)}})
+        self.run_file_export('out-{run}.csv', {'append': True})
+        self.assertEqual(self.read('out-1.csv'), 'f1\r\nfoo2\r\nfoo0\r\nfoo1\r\n')
+        # new part file of the run starts with the header
+        self.assertEqual(self.read('out-2.csv'), 'f1\r\nfoo3\r\n')
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir, 'out-{run}.csv')))
+
+    def test_output_path(self):
+        state = IncrementalState(self.state, '_id')
+        self.assertEqual(state.output_path('out-{run}.csv'), 'out-1.csv')
+        state.run = 4
+        self.assertEqual(state.output_path('out-{run}.csv'), 'out-5.csv')
+
+    def test_other_field(self):
+        IncrementalState(self.state, '_id').save()
+        with self.assertRaises(ValueError):
+            self.run_export()
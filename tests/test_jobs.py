@@ -0,0 +1,140 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+from mock import MagicMock, patch
+from mongocsvexport import main
+from mongocsvexport.jobs import JobRunner, load_jobs
+
+
+class JobsTests(unittest.TestCase):
+
+    collections = {
+        'users': [{'name': u'ann', 'age': 30}, {'name': u'bob', 'age': 40}],
+        'orders': [{'num': 1, 'items': [{'sku': 'a'}, {'sku': 'b'}]}],
+    }
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.client = MagicMock()
+        self.client.__getitem__.return_value.__getitem__.side_effect = self.collection
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def collection(self, name):
+        collection = MagicMock()
+        if name == 'broken':
+            collection.find.side_effect = RuntimeError('connection lost')
+        else:
+            collection.find.return_value = self.collections[name]
+        return collection
+
+    def path(self, name):
+        return os.path.join(self.tmp_dir, name)
+
+    def read(self, name):
+        with open(self.path(name)) as f:
+            return f.read()
+
+    def write_jobs(self, jobs):
+        with open(self.path('jobs.json'), 'w') as f:
+            json.dump(jobs, f)
+        return self.path('jobs.json')
+
+    def test_load(self):
+        path = self.write_jobs([{'db': 'test', 'collection': 'users', 'fields': 'name, age',
+                                 'output': 'users.csv',
+                                 'query_cond': {'ts': {'$gt': {'$date': 0}}}}])
+        job = load_jobs(path)[0]
+        self.assertEqual(job['fields'], ['name', 'age'])
+        self.assertEqual(job['query_cond']['ts']['$gt'].year, 1970)
+
+    def test_load_invalid(self):
+        for jobs in ({'db': 'test'}, [{'db': 'test', 'collection': 'users'}],
+                     [{'db': 'test', 'collection': 'users', 'fields': 'name'}]):
+            with self.assertRaises(ValueError):
+                load_jobs(self.write_jobs(jobs))
+
+    def test_run(self):
+        jobs = [
+            {'db': 'test', 'collection': 'users', 'fields': ['name', 'age'],
+             'output': self.path('users.csv'), 'header': True},
+            {'db': 'test', 'collection': 'broken', 'fields': ['x'],
+             'output': self.path('broken.csv')},
+            {'db': 'test', 'collection': 'orders', 'fields': ['num', 'items.sku'],
+             'output': self.path('orders.csv')},
+        ]
+        with patch('sys.stderr', StringIO()) as stderr:
+            failed = JobRunner(self.client, jobs, {'delimiter': ';'}, concurrency=2).run()
+        self.assertEqual(failed, ['test.broken'])
+        self.assertTrue('test.broken: failed: connection lost' in stderr.getvalue())
+        self.assertEqual(self.read('users.csv'), 'name;age\r\nann;30\r\nbob;40\r\n')
+        self.assertEqual(self.read('orders.csv'), '1;a\r\n1;b\r\n')
+
+    def test_invalid_options(self):
+        jobs = [
+            {'db': 'test', 'collection': 'users', 'fields': ['name'],
+             'output': self.path('users.csv'), 'sort': [('age', 1)],
+             'checkpoint': self.path('users.checkpoint')},
+            {'db': 'test', 'collection': 'orders', 'fields': ['num'],
+             'output': self.path('orders.csv')},
+        ]
+        with patch('sys.stderr', StringIO()) as stderr:
+            failed = JobRunner(self.client, jobs, {'parallel': 2, 'stats': True}).run()
+        self.assertEqual(failed, ['test.users', 'test.orders'])
+        self.assertTrue('test.users: failed: --stats can not be used with --parallel'
+                        in stderr.getvalue())
+        with patch('sys.stderr', StringIO()) as stderr:
+            JobRunner(self.client, jobs[:1], {}).run()
+        self.assertTrue('--checkpoint can not be used with --sort' in stderr.getvalue())
+        self.assertFalse(os.path.exists(self.path('users.csv')))
+        for key in ('input_path', 'profile', 'explain'):
+            with self.assertRaises(ValueError):
+                load_jobs(self.write_jobs([dict(jobs[1], **{key: 'orders.bson'})]))
+
+    def test_stats_file(self):
+        jobs = [{'db': 'test', 'collection': 'users', 'fields': ['name'],
+                 'output': self.path('users.csv'), 'stats_file': self.path('users.stats')}]
+        with patch('sys.stderr', StringIO()):
+            failed = JobRunner(self.client, jobs, {}).run()
+        self.assertEqual(failed, [])
+        with open(self.path('users.stats')) as f:
+            self.assertEqual(json.loads(f.read().splitlines()[-1])['docs'], 2)
+
+    def test_incremental(self):
+        jobs = [{'db': 'test', 'collection': 'users', 'fields': ['name'],
+                 'output': self.path('users-{run}.csv'), 'incremental': 'age',
+                 'state': self.path('users.state')}]
+        with patch('sys.stderr', StringIO()):
+            failed = JobRunner(self.client, jobs, {}).run()
+        self.assertEqual(failed, [])
+        self.assertEqual(self.read('users-1.csv'), 'ann\r\nbob\r\n')
+        self.assertFalse(os.path.exists(self.path('users-{run}.csv')))
+
+    def test_cli(self):
+        path = self.write_jobs([{'db': 'test', 'collection': 'users', 'fields': 'name',
+                                 'output': self.path('users.csv')}])
+        argv = ['mongocsvexport', '--jobs', path, '--host', 'db.example', '--header']
+        with patch('sys.argv', argv):
+            with patch('mongocsvexport.jobs.pymongo.MongoClient',
+                       return_value=self.client) as client_cls:
+                with patch('sys.stderr', StringIO()):
+                    with self.assertRaises(SystemExit) as cm:
+                        main()
+        self.assertEqual(cm.exception.code, 0)
+        client_cls.assert_called_once_with(host='db.example')
+        self.assertEqual(self.read('users.csv'), 'name\r\nann\r\nbob\r\n')
+
+    def test_cli_conflict(self):
+        for option in (['-d', 'test'], ['--stats-file', 'stats.json'],
+                       ['--profile', 'profile.out'], ['--explain']):
+            argv = ['mongocsvexport', '--jobs', 'jobs.json'] + option
+            with patch('sys.argv', argv):
+                with patch('sys.stderr', StringIO()) as stderr:
+                    with self.assertRaises(SystemExit):
+                        main()
+            self.assertTrue('{} can not be used with --jobs'.format(option[0])
+                            in stderr.getvalue())
@@ -0,0 +1,117 @@
+import os
+import shutil
+import tempfile
+import unittest
+from mock import MagicMock
+from StringIO import StringIO
+from bson.objectid import ObjectId
+from pymongo.errors import OperationFailure
+from mongocsvexport.parallel import (ParallelExport, split_boundaries, id_ranges,
+                                     range_cond)
+
+
+class BoundariesTests(unittest.TestCase):
+
+    def setUp(self):
+        self.collection = MagicMock()
+        self.collection.name = 'testcoll'
+        self.collection.full_name = 'testdb.testcoll'
+
+    def test_split_vector(self):
+        self.collection.database.command.side_effect = [
+            {'size': 1000},
+            {'splitKeys': [{'_id': i} for i in range(1, 8)]}]
+        self.assertEqual(split_boundaries(self.collection, 4), [2, 4, 6])
+        args, kwargs = self.collection.database.command.call_args
+        self.assertEqual(args, ('splitVector', 'testdb.testcoll'))
+        self.assertEqual(kwargs['maxChunkSizeBytes'], 250)
+
+    def test_sample_fallback(self):
+        self.collection.database.command.side_effect = OperationFailure('unauthorized')
+        self.collection.aggregate.return_value = [{'_id': i} for i in (5, 1, 3, 7, 2, 6)]
+        self.assertEqual(split_boundaries(self.collection, 3, {'state': 'ok'}), [3, 6])
+        pipeline = self.collection.aggregate.call_args[0][0]
+        self.assertEqual(pipeline[0], {'$match': {'state': 'ok'}})
+        self.assertEqual(pipeline[1], {'$sample': {'size': 30}})
+
+    def test_single_range(self):
+        self.assertEqual(split_boundaries(self.collection, 1), [])
+        self.assertFalse(self.collection.database.command.called)
+
+    def test_ranges(self):
+        oid = ObjectId()
+        self.assertEqual(id_ranges([oid]), [(None, oid), (oid, None)])
+        self.assertEqual(range_cond(oid, oid), {'_id': {'$gte': oid, '$lt': oid}})
+        self.assertEqual(range_cond(None, None), {})
+        # open ends select _id values of the types sorting before and after
+        lower_types = ['minKey', 'undefined', 'null', 'double', 'int', 'long', 'decimal',
+                       'symbol', 'string', 'object', 'array', 'binData']
+        self.assertEqual(range_cond(None, oid),
+                         {'$or': [{'_id': {'$lt': oid}}, {'_id': {'$type': lower_types}}]})
+        self.assertEqual(range_cond(oid, None),
+                         {'$or': [{'_id': {'$gte': oid}},
+                                  {'_id': {'$not': {'$type': lower_types + ['objectId']}}}]})
+        self.assertEqual(range_cond(None, 5),
+                         {'$or': [{'_id': {'$lt': 5}},
+                                  {'_id': {'$type': ['minKey', 'undefined', 'null']}}]})
+
+    def test_mixed_types(self):
+        self.collection.database.command.side_effect = OperationFailure('unauthorized')
+        oids = [ObjectId() for i in range(6)]
+        self.collection.aggregate.return_value = [{'_id': oid} for oid in oids] + [{'_id': u'a'}]
+        self.assertEqual(split_boundaries(self.collection, 3), [])
+        # bool sorts in Python like int, not like BSON
+        self.collection.aggregate.return_value = [{'_id': i} for i in (1, 2, 3)] + [{'_id': True}]
+        self.assertEqual(split_boundaries(self.collection, 2), [])
+        # dict order differs from BSON order
+        self.collection.aggregate.return_value = [{'_id': {'a': i}} for i in range(6)]
+        self.assertEqual(split_boundaries(self.collection, 2), [])
+        self.collection.aggregate.return_value = [{'_id': i} for i in (3, 1.5, 2L, 4)]
+        self.assertEqual(split_boundaries(self.collection, 2), [3])
+
+
+class MergeTests(unittest.TestCase):
+    """Merge of range files into the output (workers are not started)"""
+
+    ranges = [('a\r\nb\r\n', 2), ('c\r\nd\r\ne\r\n', 3), ('f\r\n', 1)]
+
+    def setUp(self):
+        self.output = StringIO()
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def create_instance(self, config):
+        ranges = self.ranges
+        tmp_dir = self.tmp_dir
+        class ParallelExportPatch(ParallelExport):
+            def _tasks(self, _):
+                return ranges
+            def _imap(self, tasks):
+                for i, (data, num_docs) in enumerate(tasks):
+                    path = os.path.join(tmp_dir, str(i))
+                    with open(path, 'wb') as f:
+                        f.write(data)
+                    offsets = []
+                    pos = 0
+                    for line in data.splitlines(True):
+                        pos += len(line)
+                        offsets.append(pos)
+                    yield path, num_docs, offsets
+        return ParallelExportPatch(MagicMock(), ['f1'], self.output, config)
+
+    def test_merge(self):
+        self.create_instance({'psql_dump': 'foo_table'}).run()
+        self.assertEqual(self.output.getvalue(),
+                         ('COPY foo_table FROM stdin WITH (FORMAT csv);\n'
+                          'a\r\nb\r\nc\r\nd\r\ne\r\nf\r\n\\.\n'))
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+    def test_limit(self):
+        self.create_instance({'limit': 4}).run()
+        self.assertEqual(self.output.getvalue(), 'a\r\nb\r\nc\r\nd\r\n')
+
+    def test_limit_on_range_end(self):
+        self.create_instance({'limit': 2}).run()
+        self.assertEqual(self.output.getvalue(), 'a\r\nb\r\n')
@@ -0,0 +1,88 @@
+import time
+import unittest
+from StringIO import StringIO
+from mock import MagicMock, patch
+import bson
+from bson.raw_bson import RawBSONDocument
+from mongocsvexport.pipeline import PipelineExport
+
+
+class CursorMock(object):
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def __iter__(self):
+        return iter(self.docs)
+
+
+class PipelineTests(unittest.TestCase):
+
+    docs = [{'f1': 'foo{}'.format(i), 'f2': [1, 2]} for i in range(5)]
+
+    def setUp(self):
+        self.output = StringIO()
+        self.collection = MagicMock()
+        self.collection.find.return_value = CursorMock(self.docs)
+        self.collection.find_raw_batches.return_value = CursorMock(
+            [''.join(bson.BSON.encode(doc) for doc in self.docs[:3]),
+             ''.join(bson.BSON.encode(doc) for doc in self.docs[3:])])
+
+    def run_export(self, config):
+        export = PipelineExport(self.collection, ['f1', 'f2'], self.output, config)
+        with patch('sys.stderr', StringIO()) as stderr:
+            export.run()
+        return export, stderr.getvalue()
+
+    def expected(self):
+        return ''.join('foo{0},1\r\nfoo{0},2\r\n'.format(i) for i in range(5))
+
+    def test_run(self):
+        export, stderr = self.run_export({'pipeline_batch': 2, 'fetch_queue': 1,
+                                          'write_queue': 1, 'header': True})
+        self.assertEqual(self.output.getvalue(), 'f1,f2\r\n' + self.expected())
+        self.assertEqual([timer.name for timer in export.timers],
+                         ['fetch', 'expand', 'write'])
+        self.assertTrue('expand: busy' in stderr)
+
+    def test_stats(self):
+        class SlowCursor(CursorMock):
+            def __iter__(self):
+                for doc in self.docs:
+                    time.sleep(0.002)
+                    yield doc
+        self.collection.find.return_value = SlowCursor(self.docs)
+        export, stderr = self.run_export({'stats': True})
+        self.assertEqual((export._stats.docs, export._stats.rows), (5, 10))
+        self.assertTrue(export._stats.seconds['cursor'] >= 0.01)
+        export, stderr = self.run_export({'stats': True, 'raw_batches': True,
+                                          'lazy_decode': True})
+        self.assertEqual(export._stats.docs, 5)
+        self.assertTrue(export._stats.seconds['decode'] > 0)
+
+    def test_raw_batches(self):
+        self.run_export({'raw_batches': True})
+        self.assertEqual(self.output.getvalue(), self.expected())
+        self.assertFalse(self.collection.find.called)
+
+    def test_raw_batches_lazy_decode(self):
+        self.run_export({'raw_batches': True, 'lazy_decode': True})
+        self.assertEqual(self.output.getvalue(), self.expected())
+
+    def test_lazy_decode(self):
+        self.collection.with_options.return_value.find.return_value = CursorMock(
+            [RawBSONDocument(bson.BSON.encode(doc)) for doc in self.docs])
+        self.run_export({'lazy_decode': True, 'pipeline_batch': 2})
+        self.assertEqual(self.output.getvalue(), self.expected())
+        self.assertFalse(self.collection.find.called)
+
+    def test_fetch_error(self):
+        self.collection.find.side_effect = RuntimeError('connection lost')
+        with self.assertRaises(RuntimeError):
+            self.run_export({})
+
+    def test_write_error(self):
+        self.output = MagicMock()
+        self.output.write.side_effect = IOError('No space left on device')
+        with self.assertRaises(IOError):
+            self.run_export({'pipeline_batch': 1, 'fetch_queue': 1, 'write_queue': 1})
@@ -0,0 +1,154 @@
+import os
+import unittest
+from mock import MagicMock, patch
+from mongocsvexport.postgres import CopyStream, PostgresExport, copy_sql
+
+
+class CursorMock(object):
+    """Cursor reading COPY data like psycopg2 copy_expert"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def copy_expert(self, sql, file, size=8192):
+        data = []
+        while True:
+            block = file.read(size)
+            if not block:
+                break
+            if self.conn.fail_on and self.conn.fail_on in block:
+                raise ValueError('invalid input')
+            data.append(block)
+        self.conn.pending.append((sql, ''.join(data)))
+
+    def close(self):
+        pass
+
+
+class ConnectionMock(object):
+
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.pending = []
+        self.committed = []
+        self.rolled_back = 0
+        self.closed = False
+
+    def cursor(self):
+        return CursorMock(self)
+
+    def commit(self):
+        self.committed.append(self.pending)
+        self.pending = []
+
+    def rollback(self):
+        self.pending = []
+        self.rolled_back += 1
+
+    def close(self):
+        self.closed = True
+
+
+class CopyStreamTests(unittest.TestCase):
+
+    def test_copy(self):
+        conn = ConnectionMock()
+        stream = CopyStream(conn, copy_sql('foo_table'), block_size=4, queue_size=1)
+        for i in range(10):
+            stream.write('row{}\n'.format(i))
+        stream.commit()
+        stream.write('last\n')
+        stream.close()
+        self.assertEqual(stream.tell(), 55)
+        self.assertEqual(conn.committed, [
+            [('COPY foo_table FROM STDIN WITH (FORMAT csv)',
+              ''.join('row{}\n'.format(i) for i in range(10)))],
+            [('COPY foo_table FROM STDIN WITH (FORMAT csv)', 'last\n')]])
+
+    def test_copy_error(self):
+        conn = ConnectionMock(fail_on='bad')
+        stream = CopyStream(conn, copy_sql('foo_table'), block_size=1, queue_size=1)
+        with self.assertRaises(ValueError):
+            for i in range(100):
+                stream.write('bad\n')
+            stream.close()
+        stream.abort()
+        self.assertEqual(conn.rolled_back, 1)
+        self.assertEqual(conn.committed, [])
+
+    def test_abort(self):
+        conn = ConnectionMock()
+        stream = CopyStream(conn, copy_sql('foo_table'))
+        stream.write('row\n')
+        stream.abort()
+        self.assertEqual(conn.rolled_back, 1)
+        self.assertEqual(conn.pending, [])
+
+
+class PostgresExportTests(unittest.TestCase):
+
+    docs = [{'f1': 'foo{}'.format(i), 'f2': [1, None]} for i in range(5)]
+
+    def create_instance(self, conn, config={}):
+        collection = MagicMock()
+        collection.name = 'testcoll'
+        collection.find.return_value = self.docs
+        with patch('mongocsvexport.postgres.connect', return_value=conn):
+            return PostgresExport(collection, ['f1', 'f2'], None,
+                                  dict(config, psql_dsn='dbname=test', delimiter=';'))
+
+    def test_run(self):
+        conn = ConnectionMock()
+        self.create_instance(conn, {'header': True}).run()
+        self.assertEqual(len(conn.committed), 1)
+        sql, data = conn.committed[0][0]
+        self.assertEqual(sql, 'COPY testcoll FROM STDIN WITH (FORMAT csv)')
+        self.assertEqual(data, ''.join('foo{0},1\r\nfoo{0},\r\n'.format(i) for i in range(5)))
+        self.assertTrue(conn.closed)
+
+    def test_commit_rows(self):
+        conn = ConnectionMock()
+        self.create_instance(conn, {'psql_commit_rows': 3, 'psql_table': 'foo'}).run()
+        # documents are not split between transactions
+        self.assertEqual([data.count('\r\n') for [(_, data)] in conn.committed], [4, 4, 2])
+
+    def test_rollback(self):
+        conn = ConnectionMock()
+        export = self.create_instance(conn)
+        export._get_rows = MagicMock(side_effect=KeyError('f1'))
+        with self.assertRaises(KeyError):
+            export.run()
+        self.assertEqual(conn.committed, [])
+        self.assertEqual(conn.rolled_back, 1)
+        self.assertTrue(conn.closed)
+
+
+@unittest.skipUnless(os.environ.get('MONGOCSVEXPORT_TEST_PSQL_DSN'),
+                     'MONGOCSVEXPORT_TEST_PSQL_DSN is not set')
+class PostgresLoadTests(unittest.TestCase):
+    """Load into local PostgreSQL, e.g. MONGOCSVEXPORT_TEST_PSQL_DSN=dbname=test"""
+
+    def setUp(self):
+        import psycopg2
+        self.dsn = os.environ['MONGOCSVEXPORT_TEST_PSQL_DSN']
+        self.conn = psycopg2.connect(self.dsn)
+        with self.conn.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS mongocsvexport_test')
+            cursor.execute('CREATE TABLE mongocsvexport_test (f1 text, f2 integer)')
+        self.conn.commit()
+
+    def tearDown(self):
+        with self.conn.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS mongocsvexport_test')
+        self.conn.commit()
+        self.conn.close()
+
+    def test_load(self):
+        collection = MagicMock()
+        collection.find.return_value = [{'f1': 'a,"b"', 'f2': [1, None]}, {'f1': None}]
+        PostgresExport(collection, ['f1', 'f2'], None,
+                       {'psql_dsn': self.dsn, 'psql_table': 'mongocsvexport_test',
+                        'psql_commit_rows': 1}).run()
+        with self.conn.cursor() as cursor:
+            cursor.execute('SELECT f1, f2 FROM mongocsvexport_test ORDER BY f2, f1')
+            self.assertEqual(cursor.fetchall(), [('a,"b"', 1), ('a,"b"', None), (None, None)])
@@ -0,0 +1,213 @@
+import os
+import copy
+import random
+import unittest
+from StringIO import StringIO
+from mock import MagicMock
+from mongocsvexport import MongoExport, compile_fields, export_class
+from mongocsvexport.pushdown import PushdownExport, build_pipeline, unwind_paths
+
+
+MISSING = object()
+
+def path_value(val, keys):
+    """Value of an aggregation field path, lists are traversed"""
+    if not keys:
+        return val
+    if isinstance(val, dict):
+        return path_value(val[keys[0]], keys[1:]) if keys[0] in val else MISSING
+    if isinstance(val, list):
+        values = [path_value(item, keys) for item in val if isinstance(item, (dict, list))]
+        return [item for item in values if item is not MISSING]
+    return MISSING
+
+def type_name(val):
+    if val is MISSING:
+        return 'missing'
+    if val is None:
+        return 'null'
+    if isinstance(val, dict):
+        return 'object'
+    if isinstance(val, list):
+        return 'array'
+    return type(val).__name__
+
+def evaluate(expr, doc):
+    if isinstance(expr, basestring) and expr.startswith('$'):
+        return path_value(doc, expr[1:].split('.'))
+    if isinstance(expr, dict):
+        (op, args), = expr.items()
+        if op == '$type':
+            return type_name(evaluate(args, doc))
+        if op == '$eq':
+            left, right = [evaluate(arg, doc) for arg in args]
+            return left is not MISSING and right is not MISSING and left == right
+        if op == '$and':
+            return all(evaluate(arg, doc) for arg in args)
+        if op == '$not':
+            return not evaluate(args[0], doc)
+        raise NotImplementedError(op)
+    return expr
+
+def unwind(docs, path):
+    keys = path[1:].split('.')
+    for doc in docs:
+        # $unwind does not traverse lists
+        parent = doc
+        for key in keys[:-1]:
+            parent = parent.get(key) if isinstance(parent, dict) else None
+        val = parent.get(keys[-1], MISSING) if isinstance(parent, dict) else MISSING
+        if not isinstance(val, list):
+            yield doc
+            continue
+        for item in val:
+            parent[keys[-1]] = item
+            yield copy.deepcopy(doc)
+
+def aggregate(docs, pipeline):
+    """Stages of the pushdown pipeline on in-memory documents"""
+    docs = copy.deepcopy(docs)
+    for stage in pipeline:
+        (name, arg), = stage.items()
+        if name == '$match' and '$expr' in arg:
+            docs = [doc for doc in docs if evaluate(arg['$expr'], doc)]
+        elif name == '$match':
+            docs = [doc for doc in docs
+                    if all(doc.get(key) == val for key, val in arg.items())]
+        elif name == '$limit':
+            docs = docs[:arg]
+        elif name == '$project':
+            docs = [dict((key, val) for key, val in doc.items() if arg.get(key))
+                    for doc in docs]
+        elif name == '$unwind':
+            assert arg['preserveNullAndEmptyArrays']
+            docs = list(unwind(docs, arg['path']))
+        else:
+            raise NotImplementedError(name)
+    return iter(docs)
+
+
+def random_value(rnd, depth=0):
+    kind = rnd.choice(['missing', 'null', 'scalar', 'scalar', 'empty', 'doc', 'doc',
+                       'list', 'list', 'nested'] if depth < 3 else ['null', 'scalar'])
+    if kind == 'null':
+        return None
+    if kind == 'scalar':
+        return rnd.choice([1, 2.5, u'x', u'y,z', True])
+    if kind == 'empty':
+        return []
+    if kind == 'doc':
+        return random_doc(rnd, depth + 1)
+    if kind == 'list':
+        return random_list(rnd, depth + 1, 1)
+    if kind == 'nested':
+        return [random_list(rnd, depth + 2, 0)]
+    return MISSING
+
+def random_list(rnd, depth, min_len):
+    items = [random_value(rnd, depth) for _ in range(rnd.randint(min_len, 3))]
+    return [None if item is MISSING else item for item in items]
+
+def random_doc(rnd, depth=0):
+    doc = {}
+    for key in ('a', 'b', 'c'):
+        val = random_value(rnd, depth)
+        if val is not MISSING:
+            doc[key] = val
+    return doc
+
+
+class PushdownTests(unittest.TestCase):
+
+    fields = ['a', 'a.b', 'a.b.c', 'a.c', 'b', 'c.a', 'c.b']
+
+    def assertSameOutput(self, docs, fields=None, config={}):
+        fields = fields or self.fields
+        class ClientExport(MongoExport):
+            def _doc_iter(self):
+                # the same documents without unwinding
+                return aggregate(docs, build_pipeline(compile_fields([]),
+                                                      config.get('query_cond'),
+                                                      limit=config.get('limit')))
+        expected = StringIO()
+        ClientExport(MagicMock(), fields, expected, config).run()
+        collection = MagicMock()
+        collection.aggregate.side_effect = lambda pipeline, **kwargs: aggregate(docs, pipeline)
+        result = StringIO()
+        PushdownExport(collection, fields, result, config).run()
+        self.assertEqual(result.getvalue(), expected.getvalue())
+        return result.getvalue(), collection
+
+    def test_unwind_paths(self):
+        plan = compile_fields([('a', 'b'), ('c',), ('a', 'd', 'e')])
+        self.assertEqual(unwind_paths(plan),
+                         [('a',), ('a', 'b'), ('a', 'd'), ('a', 'd', 'e'), ('c',)])
+
+    def test_pipeline(self):
+        plan = compile_fields([('a', 'b'), ('c',)])
+        pipeline = build_pipeline(plan, {'x': 1}, [('x', 1)], 10, {'a': 1, 'c': 1})
+        self.assertEqual([stage.keys()[0] for stage in pipeline],
+                         ['$match', '$sort', '$limit', '$project'] + ['$match', '$unwind'] * 3)
+        self.assertEqual(pipeline[6], {'$match': {'$expr': {'$not': [{'$and': [
+            {'$eq': [{'$type': '$a'}, 'object']}, {'$eq': ['$a.b', []]}]}]}}})
+        self.assertEqual(pipeline[7], {'$unwind': {'path': '$a.b',
+                                                   'preserveNullAndEmptyArrays': True}})
+
+    def test_output(self):
+        docs = [
+            {'a': [{'b': [{'c': 1}, {'c': 2}], 'c': 'x'}, {'b': 3}], 'b': [4, 5]},
+            {'a': {'b': [], 'c': 1}, 'b': 1},
+            {'a': None, 'b': [], 'c': {'a': 1}},
+            {'b': 1, 'c': [{'a': 1, 'b': [2, 3]}, {'a': 4}, 5]},
+            {'a': [[1, 2], [{'b': 1}]], 'b': [[]], 'c': [[], {'a': [[3]]}]},
+        ]
+        result, collection = self.assertSameOutput(docs, config={'null_value': 'NULL'})
+        self.assertTrue('NULL' in result)
+        self.assertTrue('[1, 2]' in result)
+        self.assertFalse(collection.find.called)
+        self.assertEqual(collection.aggregate.call_args[1], {'allowDiskUse': True})
+
+    def test_random_documents(self):
+        rnd = random.Random(21)
+        docs = [random_doc(rnd) for _ in range(300)]
+        self.assertSameOutput(docs, config={'null_value': 'NULL'})
+
+    def test_query_and_limit(self):
+        docs = [{'a': [{'b': i}, {'b': i + 1}], 'b': i % 2} for i in range(6)]
+        result, collection = self.assertSameOutput(docs, ['a.b', 'b'],
+                                                   {'query_cond': {'b': 1}, 'limit': 2,
+                                                    'hint': 'b_1', 'batch_size': 50})
+        self.assertEqual(result, '1,1\r\n2,1\r\n3,1\r\n4,1\r\n')
+        self.assertEqual(collection.aggregate.call_args[1],
+                         {'allowDiskUse': True, 'hint': 'b_1', 'batchSize': 50})
+
+    def test_export_class(self):
+        self.assertIs(export_class({'pushdown': True}), PushdownExport)
+
+
+@unittest.skipUnless(os.environ.get('MONGOCSVEXPORT_TEST_MONGO_URI'),
+                     'MONGOCSVEXPORT_TEST_MONGO_URI is not set')
+class PushdownServerTests(unittest.TestCase):
+    """Comparison with the client expansion on a MongoDB 3.6+ server"""
+
+    def setUp(self):
+        import pymongo
+        self.client = pymongo.MongoClient(os.environ['MONGOCSVEXPORT_TEST_MONGO_URI'])
+        self.collection = self.client.mongocsvexport_test.pushdown
+        self.collection.drop()
+
+    def tearDown(self):
+        self.collection.drop()
+        self.client.close()
+
+    def run_export(self, export_cls, config):
+        output = StringIO()
+        export_cls(self.collection, PushdownTests.fields, output, config).run()
+        return output.getvalue()
+
+    def test_random_documents(self):
+        rnd = random.Random(21)
+        self.collection.insert_many([dict(random_doc(rnd), _id=i) for i in range(300)])
+        config = {'null_value': 'NULL', 'sort': [('_id', 1)]}
+        self.assertEqual(self.run_export(PushdownExport, config),
+                         self.run_export(MongoExport, config))
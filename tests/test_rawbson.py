@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import re
+import unittest
+from datetime import datetime
+from StringIO import StringIO
+from mock import MagicMock
+import bson
+from bson.binary import Binary
+from bson.int64 import Int64
+from bson.objectid import ObjectId
+from bson.raw_bson import RawBSONDocument
+from bson.timestamp import Timestamp
+from mongocsvexport import MongoExport, compile_fields, expand_dict
+from mongocsvexport.rawbson import decode_document, decode_batch
+
+
+class DecodeTests(unittest.TestCase):
+
+    doc = {
+        '_id': ObjectId('524a118c1bf33d08f28c5391'),
+        'name': u'сепулька',
+        'count': 10,
+        'big': Int64(2 ** 40),
+        'price': 1.5,
+        'flag': True,
+        'none': None,
+        'ts': datetime(2014, 5, 1, 12, 34, 10, 345000),
+        'stamp': Timestamp(1399583520, 1),
+        'blob': Binary('\x00\x01' * 100),
+        'regex': re.compile('^a.*'),
+        'sub': {'x': 1, 'skip': [1, 2, 3], 'y': {'z': u'deep'}},
+        'items': [{'a': 1, 'b': [u'one', u'two']}, 5, {'a': 2, 'b': []}, [1, 2]],
+        'tags': [u'red', {'a': 1}, [1, 2], None],
+    }
+
+    fields = [('_id',), ('name',), ('count',), ('big',), ('price',), ('flag',),
+              ('none',), ('ts',), ('stamp',), ('sub', 'x'), ('sub', 'y', 'z'),
+              ('sub', 'absent'), ('items', 'a'), ('tags',), ('regex',), ('missing',)]
+
+    def test_same_rows(self):
+        plan = compile_fields(self.fields)
+        data = bson.BSON.encode(self.doc)
+        decoded = decode_document(data, plan)
+        self.assertEqual(list(expand_dict(decoded, plan)),
+                         list(expand_dict(bson.BSON(data).decode(), plan)))
+
+    def test_nested_list_rows(self):
+        plan = compile_fields([('items', 'a'), ('items', 'b')])
+        data = bson.BSON.encode(self.doc)
+        self.assertEqual(list(expand_dict(decode_document(data, plan), plan)),
+                         list(expand_dict(bson.BSON(data).decode(), plan)))
+
+    def test_skips_unrequested(self):
+        plan = compile_fields([('count',), ('sub', 'x')])
+        decoded = decode_document(bson.BSON.encode(self.doc), plan)
+        self.assertEqual(decoded, {'count': 10, 'sub': {'x': 1}})
+
+    def test_batch(self):
+        plan = compile_fields([('f1',)])
+        data = ''.join(bson.BSON.encode({'f1': i, 'f2': 'x'}) for i in range(3))
+        self.assertEqual(list(decode_batch(data, plan)), [{'f1': 0}, {'f1': 1}, {'f1': 2}])
+
+    def test_export(self):
+        docs = [RawBSONDocument(bson.BSON.encode(doc)) for doc in
+                ({'f1': u'foo1', 'f2': [{'sub': 1}, {'sub': 2}], 'blob': 'x' * 100},)]
+        collection = MagicMock()
+        collection.with_options.return_value.find.return_value = docs
+        output = StringIO()
+        export = MongoExport(collection, ['f1', 'f2.sub'], output, {'lazy_decode': True})
+        export.run()
+        self.assertEqual(output.getvalue(), 'foo1,1\r\nfoo1,2\r\n')
+        codec_options = collection.with_options.call_args[1]['codec_options']
+        self.assertEqual(codec_options.document_class, RawBSONDocument)
+        self.assertFalse(collection.find.called)
@@ -0,0 +1,99 @@
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+from mock import MagicMock, patch
+from mongocsvexport import document_rows
+from mongocsvexport.sharded import ShardedExport, manifest_path
+from mongocsvexport.statefile import read_state
+
+
+class ShardedTests(unittest.TestCase):
+
+    docs = [{'_id': i, 'f1': 'foo{}'.format(i), 'f2': [1, 2, 3][:i % 3 + 1]}
+            for i in range(10)]
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.pattern = os.path.join(self.tmp_dir, 'out-%03d.csv')
+        self.collection = MagicMock()
+        self.collection.find.return_value = self.docs
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def run_export(self, **config):
+        export = ShardedExport(self.collection, ['f1', 'f2'], self.pattern, config)
+        export.run()
+        return export
+
+    def read(self, num):
+        with open(self.pattern % num) as f:
+            return f.read()
+
+    def parts(self):
+        return read_state(manifest_path(self.pattern))['parts']
+
+    def test_manifest_path(self):
+        self.assertEqual(manifest_path('out-%05d.csv'), 'out-manifest.csv.json')
+
+    def test_pattern_required(self):
+        with self.assertRaises(ValueError):
+            ShardedExport(self.collection, ['f1'], os.path.join(self.tmp_dir, 'out.csv'),
+                          {'max_rows': 1})
+
+    def test_max_rows(self):
+        self.run_export(max_rows=4, header=True)
+        parts = self.parts()
+        # documents have 1, 2, 3, 1, 2, 3, ... rows and are never split
+        self.assertEqual([part['rows'] for part in parts], [3, 4, 2, 4, 2, 4])
+        self.assertEqual([(part['min_id'], part['max_id']) for part in parts],
+                         [(0, 1), (2, 3), (4, 4), (5, 6), (7, 7), (8, 9)])
+        self.assertEqual(self.read(1), 'f1,f2\r\nfoo0,1\r\nfoo1,1\r\nfoo1,2\r\n')
+        for part in parts:
+            self.assertEqual(part['bytes'], os.path.getsize(part['path']))
+        self.assertEqual(sum(part['docs'] for part in parts), len(self.docs))
+        self.assertEqual(self.collection.find.call_args[1]['projection'],
+                         {'f1': 1, 'f2': 1, '_id': 1})
+
+    def test_expand_once(self):
+        with patch('mongocsvexport.document_rows', wraps=document_rows) as rows_mock, \
+                patch('sys.stderr', StringIO()):
+            self.run_export(max_rows=4, max_fanout=2, fanout_policy='truncate')
+        self.assertEqual(rows_mock.call_count, len(self.docs))
+        # truncated documents have at most 2 rows
+        self.assertEqual([part['rows'] for part in self.parts()], [3, 3, 4, 3, 3])
+
+    def test_split_docs(self):
+        self.run_export(max_rows=4, split_docs=True)
+        parts = self.parts()
+        self.assertEqual([part['rows'] for part in parts], [4, 4, 4, 4, 3])
+        self.assertEqual(self.read(1), 'foo0,1\r\nfoo1,1\r\nfoo1,2\r\nfoo2,1\r\n')
+
+    def test_max_bytes(self):
+        self.run_export(max_bytes=20, psql_dump='foo_table')
+        parts = self.parts()
+        self.assertTrue(len(parts) > 1)
+        content = ''.join(self.read(num) for num in range(1, len(parts) + 1))
+        self.assertEqual(content.count('COPY foo_table FROM stdin'), len(parts))
+        self.assertEqual(content.count('\\.\n'), len(parts))
+        self.assertEqual(sum(part['rows'] for part in parts), 19)
+
+    def test_empty(self):
+        self.collection.find.return_value = []
+        self.run_export(max_rows=4, header=True, manifest=os.path.join(self.tmp_dir, 'm.json'))
+        parts = read_state(os.path.join(self.tmp_dir, 'm.json'))['parts']
+        self.assertEqual(len(parts), 1)
+        self.assertEqual(parts[0]['rows'], 0)
+        self.assertEqual(self.read(1), 'f1,f2\r\n')
+
+    def test_compressed_parts(self):
+        self.pattern += '.gz'
+        self.run_export(max_rows=10)
+        parts = self.parts()
+        self.assertEqual(len(parts), 2)
+        content = ''.join(gzip.open(part['path']).read() for part in parts)
+        self.assertEqual(content.count('\r\n'), 19)
+        self.assertEqual(parts[0]['bytes'], len(gzip.open(parts[0]['path']).read()))
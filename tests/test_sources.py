@@ -0,0 +1,135 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from StringIO import StringIO
+from mock import patch, MagicMock
+import bson
+import bson.json_util
+from mongocsvexport import MongoExport, compile_fields, main
+from mongocsvexport.sources import (BsonFileSource, BsonStreamSource, JsonLinesSource,
+                                    FileExport, ParallelFileExport, open_source)
+
+
+DOCS = [{'_id': i, 'a': [{'b': j, 'c': 'x' * j} for j in range(i % 3)],
+         'd': datetime(2020, 1, 1 + i % 28, 12, 30), 'e': {'f': [i, i + 1]}}
+        for i in range(40)]
+
+FIELDS = ['_id', 'a.b', 'd', 'e.f']
+
+
+class SourcesTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.bson_path = os.path.join(self.tmp_dir, 'coll.bson')
+        with open(self.bson_path, 'wb') as f:
+            for doc in DOCS:
+                f.write(bson.BSON.encode(doc))
+        self.jsonl_path = os.path.join(self.tmp_dir, 'coll.jsonl')
+        with open(self.jsonl_path, 'w') as f:
+            for doc in DOCS:
+                f.write(bson.json_util.dumps(doc) + '\n')
+        self.plan = compile_fields(tuple(field.split('.')) for field in FIELDS)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def expected(self, config={}, docs=DOCS):
+        class ClientExport(MongoExport):
+            def _doc_iter(self):
+                return iter(docs)
+        output = StringIO()
+        ClientExport(MagicMock(), FIELDS, output, config).run()
+        return output.getvalue()
+
+    def export(self, export_cls, source, config={}):
+        output = StringIO()
+        export_cls(source, FIELDS, output, config).run()
+        return output.getvalue()
+
+    def test_open_source(self):
+        self.assertTrue(isinstance(open_source(self.bson_path), BsonFileSource))
+        self.assertTrue(isinstance(open_source(self.jsonl_path), JsonLinesSource))
+        self.assertTrue(isinstance(open_source(self.jsonl_path, 'bson'), BsonFileSource))
+        self.assertTrue(isinstance(open_source('-', 'bson'), BsonStreamSource))
+        with self.assertRaises(ValueError):
+            open_source(os.path.join(self.tmp_dir, 'missing.bson'))
+
+    def test_bson_file(self):
+        expected = self.expected({'header': True})
+        self.assertEqual(self.export(FileExport, BsonFileSource(self.bson_path),
+                                     {'header': True}), expected)
+
+    def test_jsonl_file(self):
+        self.assertEqual(self.export(FileExport, JsonLinesSource(self.jsonl_path)),
+                         self.expected())
+
+    def test_bson_stream(self):
+        data = ''.join(bson.BSON.encode(doc) for doc in DOCS)
+        self.assertEqual(self.export(FileExport, BsonStreamSource(StringIO(data))),
+                         self.expected())
+        with self.assertRaises(ValueError):
+            list(BsonStreamSource(StringIO(data[:-3])).docs(self.plan))
+
+    def test_limit(self):
+        self.assertEqual(self.export(FileExport, BsonFileSource(self.bson_path), {'limit': 5}),
+                         self.expected(docs=DOCS[:5]))
+
+    def test_split(self):
+        for source in (BsonFileSource(self.bson_path), JsonLinesSource(self.jsonl_path)):
+            docs = list(source.docs(self.plan))
+            for num_parts in (1, 2, 3, 7, 100):
+                parts = source.split(num_parts)
+                self.assertTrue(len(parts) <= num_parts)
+                self.assertEqual([doc for part in parts for doc in part.docs(self.plan)], docs)
+        # bson parts start at document boundaries and are never empty
+        parts = BsonFileSource(self.bson_path).split(7)
+        self.assertEqual(len(parts), 7)
+        self.assertTrue(all(list(part.docs(self.plan)) for part in parts))
+
+    def test_broken_bson(self):
+        with open(self.bson_path, 'ab') as f:
+            f.write('\x02\x00\x00\x00')
+        with self.assertRaises(ValueError):
+            list(BsonFileSource(self.bson_path).docs(self.plan))
+
+    def test_parallel(self):
+        config = {'parallel': 2, 'header': True}
+        self.assertEqual(self.export(ParallelFileExport, BsonFileSource(self.bson_path), config),
+                         self.expected({'header': True}))
+        config['limit'] = 7
+        self.assertEqual(self.export(ParallelFileExport, JsonLinesSource(self.jsonl_path), config),
+                         self.expected({'header': True}, DOCS[:7]))
+
+    def test_main(self):
+        output_path = os.path.join(self.tmp_dir, 'out.csv')
+        argv = ['mongocsvexport', '-f', ','.join(FIELDS), '--input', self.bson_path,
+                '-o', output_path]
+        with patch('sys.argv', argv):
+            main()
+        with open(output_path) as f:
+            self.assertEqual(f.read(), self.expected())
+
+    def test_main_with_cond(self):
+        argv = ['mongocsvexport', '-f', 'a', '--input', self.bson_path, '--cond', '{"a": 1}']
+        stderr = StringIO()
+        with patch('sys.argv', argv), patch('sys.stderr', stderr):
+            with self.assertRaises(SystemExit):
+                main()
+        self.assertTrue('--cond can not be used with --input' in stderr.getvalue())
+
+    def test_main_missing_input(self):
+        output_path = os.path.join(self.tmp_dir, 'out.csv')
+        with open(output_path, 'w') as f:
+            f.write('previous export\n')
+        argv = ['mongocsvexport', '-f', 'a', '--input', os.path.join(self.tmp_dir, 'missing.bson'),
+                '-o', output_path]
+        stderr = StringIO()
+        with patch('sys.argv', argv), patch('sys.stderr', stderr):
+            with self.assertRaises(SystemExit):
+                main()
+        self.assertTrue('missing.bson does not exist' in stderr.getvalue())
+        with open(output_path) as f:
+            self.assertEqual(f.read(), 'previous export\n')
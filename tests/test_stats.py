@@ -0,0 +1,84 @@
+import os
+import json
+import pstats
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+from mock import MagicMock, patch
+from mongocsvexport import MongoExport, main
+from mongocsvexport.stats import ExportStats, fanout_bucket, bucket_bounds
+
+
+class StatsTests(unittest.TestCase):
+
+    docs = [{'f1': 'a', 'f2': []}, {'f1': 'b', 'f2': [1]}, {'f1': 'c', 'f2': [1, 2, 3]}]
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.stats_file = os.path.join(self.tmp_dir, 'stats')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def run_export(self, config):
+        collection = MagicMock()
+        collection.find.return_value = self.docs
+        output = StringIO()
+        export = MongoExport(collection, ['f1', 'f2'], output,
+                             dict(config, stats=True, stats_file=self.stats_file))
+        with patch('sys.stderr', StringIO()) as stderr:
+            export.run()
+        return export, output.getvalue(), stderr.getvalue()
+
+    def test_buckets(self):
+        self.assertEqual([fanout_bucket(n) for n in (0, 1, 2, 3, 4, 7, 8)],
+                         [0, 1, 2, 2, 3, 3, 4])
+        self.assertEqual([bucket_bounds(b) for b in (0, 1, 2, 3)],
+                         [(0, 0), (1, 1), (2, 3), (4, 7)])
+
+    def test_jsonl(self):
+        export, output, stderr = self.run_export({})
+        self.assertEqual(output, 'b,1\r\nc,1\r\nc,2\r\nc,3\r\n')
+        with open(self.stats_file) as f:
+            snapshots = [json.loads(line) for line in f]
+        self.assertEqual(len(snapshots), 1)
+        snapshot = snapshots[0]
+        self.assertEqual((snapshot['docs'], snapshot['rows'], snapshot['bytes']),
+                         (3, 4, len(output)))
+        self.assertEqual(snapshot['fanout'], {'0-0': 1, '1-1': 1, '2-3': 1})
+        self.assertEqual(sorted(snapshot['seconds']),
+                         ['cursor', 'decode', 'expand', 'serialize', 'write'])
+        self.assertTrue('Export stats: 3 docs, 4 rows' in stderr)
+
+    def test_periodic(self):
+        self.run_export({'stats_interval': 0})
+        with open(self.stats_file) as f:
+            # after every document and at the end
+            self.assertEqual(len(f.readlines()), 4)
+
+    def test_prometheus(self):
+        self.run_export({'stats_format': 'prometheus'})
+        with open(self.stats_file) as f:
+            lines = f.read().splitlines()
+        self.assertTrue('mongocsvexport_docs_total 3' in lines)
+        self.assertTrue('mongocsvexport_rows_total 4' in lines)
+        self.assertTrue('mongocsvexport_fanout_rows_bucket{le="1"} 2' in lines)
+        self.assertTrue('mongocsvexport_fanout_rows_bucket{le="+Inf"} 3' in lines)
+        self.assertTrue('mongocsvexport_fanout_rows_count 3' in lines)
+        self.assertTrue(any(line.startswith('mongocsvexport_stage_seconds_total{stage="write"}')
+                            for line in lines))
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            ExportStats(self.stats_file, 'xml')
+
+    def test_profile(self):
+        path = os.path.join(self.tmp_dir, 'profile')
+        argv = ['mongocsvexport', '-d', 'testdb', '-c', 'testcoll', '-f', 'f1',
+                '--profile', path]
+        with patch('sys.argv', argv):
+            with patch('mongocsvexport.MongoExport.create') as create_mock:
+                main()
+        self.assertTrue(create_mock.return_value.run.called)
+        self.assertTrue(pstats.Stats(path).total_calls > 0)
@@ -0,0 +1,23 @@
+import unittest
+from mongocsvexport.util import LRUCache
+
+
+class LRUCacheTests(unittest.TestCase):
+
+    def test_get(self):
+        cache = LRUCache(2)
+        self.assertEqual(cache.get('a', str.upper), 'A')
+        self.assertEqual(cache.get('a', lambda key: 'other'), 'A')
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_eviction(self):
+        cache = LRUCache(2)
+        computed = []
+        def compute(key):
+            computed.append(key)
+            return key
+        for key in ('a', 'b', 'a', 'c', 'a', 'b'):
+            cache.get(key, compute)
+        # 'b' is the least recently used one when 'c' is added
+        self.assertEqual(computed, ['a', 'b', 'c', 'b'])
+        self.assertEqual(len(cache), 2)